@@ -0,0 +1,236 @@
+"""
+Adaptive concurrency limits and load shedding for Taara Internet Monitor
+Each route, and the worker as a whole, admits at most ``limit`` requests at
+a time; limits follow observed latency and requests over them get an
+immediate 503 with Retry-After instead of queueing inside the worker
+"""
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.routing import Match
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Priority class per route path; anything else is "default"
+ROUTE_PRIORITIES = {
+    "/api/collect": "critical",
+    "/": "interactive",
+    "/health": "exempt",
+    "/health/ready": "exempt",
+    # Long-polls sit idle for most of their lifetime; their latency is the wait
+    "/api/changes": "exempt",
+}
+
+# Fraction of the worker-wide limit each class may fill. Lower classes are
+# shed first, keeping headroom for the dashboard; critical requests are only
+# bound by their route's limit and exempt ones (cheap probes) by nothing.
+PRIORITY_SHARES = {
+    "interactive": 0.9,
+    "default": 0.7,
+}
+
+
+class AdaptiveLimit:
+    """
+    Gradient concurrency limit: compares a short-term latency average with the
+    route's no-load latency and shrinks the limit as requests slow down
+    (queueing), growing it again by about sqrt(limit) per sample while latency
+    holds and the limit is actually being used.
+    """
+
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int,
+                 tolerance: float, smoothing: float = 0.2, baseline_window: int = 100,
+                 normalised: bool = False):
+        self.name = name
+        # Samples are latency ratios (see AdmissionController.release), not seconds
+        self.normalised = normalised
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.baseline_window = baseline_window
+        self.in_flight = 0
+        self.admitted = 0
+        self.idle_ticket = 0
+        self.short_rtt = 0.0
+        self.baseline_rtt = 0.0
+        self.shed = 0
+
+    def try_acquire(self, share: float = 1.0) -> Optional[int]:
+        """Take a slot if fewer than ``share`` x limit are in flight; returns a ticket or None"""
+        if self.in_flight >= max(1, int(self.limit * share)):
+            self.shed += 1
+            return None
+        self.admitted += 1
+        if self.in_flight == 0:
+            self.idle_ticket = self.admitted
+        self.in_flight += 1
+        return self.admitted
+
+    def release(self, ticket: int, rtt: Optional[float]):
+        """Return a slot; ``rtt`` (seconds) updates the limit unless it is None"""
+        # Nothing else was in flight while this request ran
+        alone = self.idle_ticket == ticket == self.admitted
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        if rtt is not None:
+            self._update(rtt, in_flight, alone)
+
+    def _update(self, rtt: float, in_flight: int, alone: bool):
+        if not self.baseline_rtt:
+            self.short_rtt = self.baseline_rtt = rtt
+            return
+
+        self.short_rtt += (rtt - self.short_rtt) * 0.1
+        if rtt < self.baseline_rtt:
+            self.baseline_rtt = rtt
+        elif alone:
+            # Let the baseline follow a route that really got slower (more
+            # history), but never from requests that queued behind others,
+            # or it would ratchet up with the overload it should detect
+            self.baseline_rtt += (rtt - self.baseline_rtt) / self.baseline_window
+
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline_rtt / self.short_rtt))
+        if gradient == 1.0 and in_flight < self.limit / 2:
+            # Not using the limit we have; no evidence it could be higher
+            return
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        new_limit = self.limit * (1 - self.smoothing) + new_limit * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait: a couple of current request latencies"""
+        return max(1, math.ceil(2 * self.short_rtt))
+
+    def snapshot(self) -> dict:
+        if self.normalised:
+            latency = {"latency_ratio": round(self.short_rtt, 2), "baseline_ratio": round(self.baseline_rtt, 2)}
+        else:
+            latency = {"short_rtt_ms": round(self.short_rtt * 1000, 1),
+                       "baseline_rtt_ms": round(self.baseline_rtt * 1000, 1)}
+        return {"limit": round(self.limit, 1), "in_flight": self.in_flight, **latency, "shed": self.shed}
+
+
+@dataclass
+class Admission:
+    """Slots held by one admitted request"""
+    route: Optional[AdaptiveLimit]
+    route_ticket: Optional[int]
+    worker_ticket: Optional[int]
+
+
+class AdmissionController:
+    """
+    Per-worker admission state. The middleware runs on the event loop, so
+    counters need no locking; each gunicorn worker sheds independently.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, AdaptiveLimit] = {}
+        self.worker = self._new_limit("worker", normalised=True)
+
+    def _new_limit(self, name: str, normalised: bool = False) -> AdaptiveLimit:
+        return AdaptiveLimit(name, Config.ADMISSION_INITIAL_LIMIT, Config.ADMISSION_MIN_LIMIT,
+                             Config.ADMISSION_MAX_LIMIT, Config.ADMISSION_LATENCY_TOLERANCE,
+                             normalised=normalised)
+
+    def route_limit(self, path: str) -> AdaptiveLimit:
+        limit = self.routes.get(path)
+        if limit is None:
+            limit = self.routes[path] = self._new_limit(path)
+        return limit
+
+    def try_admit(self, path: Optional[str], priority: str) -> Tuple[Optional[Admission], Optional[AdaptiveLimit]]:
+        """(admission, None) if the request may run, else (None, the limit that shed it)"""
+        # Unknown paths (404s) only count against the worker limit
+        route = self.route_limit(path) if path else None
+        route_ticket = route.try_acquire() if route else None
+        if route and route_ticket is None:
+            return None, route
+
+        share = PRIORITY_SHARES.get(priority)
+        worker_ticket = self.worker.try_acquire(share) if share is not None else None
+        if share is not None and worker_ticket is None:
+            if route:
+                route.release(route_ticket, None)
+            return None, self.worker
+        return Admission(route, route_ticket, worker_ticket), None
+
+    def release(self, admission: Admission, rtt: Optional[float]):
+        """Return an admission's slots; ``rtt`` (seconds, None for failures) updates the limits"""
+        route = admission.route
+        if route:
+            route.release(admission.route_ticket, rtt)
+        if admission.worker_ticket is not None:
+            # Routes differ in speed by orders of magnitude, so the worker limit
+            # sees each latency relative to its own route's no-load latency
+            # (~1 when idle, growing as requests queue) rather than a mix
+            # of seconds that the fastest route's baseline would always beat
+            ratio = rtt / route.baseline_rtt if rtt is not None and route and route.baseline_rtt else None
+            self.worker.release(admission.worker_ticket, ratio)
+
+    def snapshot(self) -> dict:
+        return {
+            "worker": self.worker.snapshot(),
+            "routes": {path: limit.snapshot() for path, limit in self.routes.items()},
+        }
+
+
+def _route_path(app: FastAPI, request: Request) -> Optional[str]:
+    """Path template of the route serving ``request``, None if nothing matches"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", None)
+    return None
+
+
+def _overloaded(retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Server is busy, retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after), "Cache-Control": "no-store"},
+    )
+
+
+def install_admission_control(app: FastAPI) -> AdmissionController:
+    """Add the load-shedding middleware to ``app``; install it last so it runs first"""
+    controller = AdmissionController()
+
+    @app.middleware("http")
+    async def admit_request(request: Request, call_next):
+        path = _route_path(app, request)
+        priority = ROUTE_PRIORITIES.get(path, "default")
+        if priority == "exempt":
+            return await call_next(request)
+
+        admission, shed_by = controller.try_admit(path, priority)
+        if admission is None:
+            logger.debug(f"Shed {priority} request to {request.url.path} ({shed_by.name} limit)")
+            # The worker limit counts latency ratios; retry after a few of this route's requests
+            route = controller.routes.get(path)
+            return _overloaded(route.retry_after() if route else 1)
+
+        start = time.perf_counter()
+        rtt = None
+        try:
+            response = await call_next(request)
+            # Failures return fast and would read as spare capacity
+            if response.status_code < 500:
+                rtt = time.perf_counter() - start
+            return response
+        finally:
+            controller.release(admission, rtt)
+
+    logger.info(f"Load shedding enabled (initial route limit {Config.ADMISSION_INITIAL_LIMIT}, "
+                f"max {Config.ADMISSION_MAX_LIMIT})")
+    return controller
@@ -0,0 +1,351 @@
+"""
+Streaming anomaly detection and alert delivery for Taara Internet Monitor
+
+The detector runs inside the collector's ingest path and keeps O(1) state per
+(subscriber, plan) series: an exponentially weighted usage rate and variance
+for z-scores, plus the previous balance/expiry for threshold crossings.
+Alerts go to a bounded queue drained by a background thread that
+deduplicates, batches and retries webhook and email delivery, so a slow
+receiver never holds up collection.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import math
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Collection, Dict, List, Optional, Sequence, Set, Tuple
+
+import requests
+from sqlalchemy.orm import Session
+
+from app.config import Config
+from app.database import CurrentState, to_epoch
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+@dataclass
+class Alert:
+    kind: str
+    severity: str
+    subscriber_id: str
+    plan_id: str
+    plan_name: str
+    message: str
+    value: float
+    threshold: Optional[float]
+    timestamp: str
+
+    @property
+    def dedup_key(self) -> str:
+        return f"{self.kind}:{self.subscriber_id}:{self.plan_id}:{self.threshold}"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class SeriesState:
+    """Per-series detector state; every update is constant time"""
+    last_epoch: Optional[float] = None
+    last_balance_gb: Optional[float] = None
+    last_expires_in_days: Optional[int] = None
+    rate_mean: float = 0.0
+    rate_var: float = 0.0
+    samples: int = 0
+    depletion_alerted: bool = False
+
+
+def parse_thresholds(value: str) -> List[float]:
+    return sorted((float(v) for v in value.split(",") if v.strip()), reverse=True)
+
+
+class AnomalyDetector:
+    """Updates series state per reading and returns the alerts it triggers"""
+
+    def __init__(self):
+        self.states: Dict[Tuple[str, str], SeriesState] = {}
+        self.balance_thresholds = parse_thresholds(Config.ALERT_BALANCE_THRESHOLDS_GB)
+        self.expiry_thresholds = parse_thresholds(Config.ALERT_EXPIRY_THRESHOLDS_DAYS)
+
+    def refresh(self, db: Session, keys: Collection[Tuple[str, str]]):
+        """
+        Re-seed series from the materialized current state when it is newer
+        than what this process has seen: after a restart, or when another
+        process (a previous embedded-collector leader, a manual run) collected
+        in between.
+        """
+        rows = db.query(CurrentState).filter(
+            CurrentState.subscriber_id.in_({subscriber_id for subscriber_id, _ in keys})
+        )
+        for row in rows:
+            key = (row.subscriber_id, row.plan_id)
+            if key not in keys:
+                continue
+            epoch = row.timestamp
+            state = self.states.get(key)
+            if state is None or state.last_epoch is None or epoch > state.last_epoch:
+                self.states[key] = SeriesState(
+                    last_epoch=epoch,
+                    last_balance_gb=row.remaining_balance_bytes / GB,
+                    last_expires_in_days=row.expires_in_days,
+                )
+
+    def observe(self, record: dict, state: SeriesState) -> List[Alert]:
+        """Advance ``state`` (the series' state before ``record``) and return the alerts raised"""
+        epoch = to_epoch(record["timestamp"])
+        balance_gb = record["remaining_balance_bytes"] / GB
+        expires_in_days = record["expires_in_days"]
+        alerts: List[Alert] = []
+
+        def alert(kind: str, severity: str, message: str, value: float, threshold: Optional[float] = None):
+            alerts.append(Alert(
+                kind=kind,
+                severity=severity,
+                subscriber_id=record["subscriber_id"],
+                plan_id=record["plan_id"],
+                plan_name=record["plan_name"],
+                message=message,
+                value=round(value, 3),
+                threshold=threshold,
+                timestamp=record["timestamp"].isoformat(),
+            ))
+
+        if record["is_active"] and state.last_balance_gb is not None:
+            # Threshold crossings (downwards only)
+            for threshold in self.balance_thresholds:
+                if state.last_balance_gb > threshold >= balance_gb:
+                    alert("balance_low", "critical" if threshold == self.balance_thresholds[-1] else "warning",
+                          f"{record['plan_name']}: remaining balance fell below {threshold:g} GB "
+                          f"({balance_gb:.1f} GB left)", balance_gb, threshold)
+            for threshold in self.expiry_thresholds:
+                if (state.last_expires_in_days is not None
+                        and state.last_expires_in_days > threshold >= expires_in_days):
+                    alert("expiry_near", "warning",
+                          f"{record['plan_name']}: expires in {expires_in_days} days", expires_in_days, threshold)
+
+        if state.last_epoch is not None and epoch > state.last_epoch:
+            hours = (epoch - state.last_epoch) / 3600
+            rate = (state.last_balance_gb - balance_gb) / hours
+
+            if rate < 0:
+                # Top-up or new bundle: usage history no longer describes this balance
+                state.rate_mean, state.rate_var, state.samples = 0.0, 0.0, 0
+                state.depletion_alerted = False
+            else:
+                # z-score against the state before this reading
+                std = math.sqrt(state.rate_var)
+                if state.samples >= Config.ALERT_MIN_SAMPLES and std > 0:
+                    z = (rate - state.rate_mean) / std
+                    if z >= Config.ALERT_ZSCORE_THRESHOLD:
+                        alert("usage_spike", "warning",
+                              f"{record['plan_name']}: usage of {rate:.2f} GB/h is {z:.1f} "
+                              f"standard deviations above normal ({state.rate_mean:.2f} GB/h)", rate,
+                              Config.ALERT_ZSCORE_THRESHOLD)
+
+                # Exponentially weighted mean and variance
+                alpha = Config.ALERT_EWMA_ALPHA
+                diff = rate - state.rate_mean
+                increment = alpha * diff
+                state.rate_mean += increment
+                state.rate_var = (1 - alpha) * (state.rate_var + diff * increment)
+                state.samples += 1
+
+                # Forecast exhaustion at the smoothed rate
+                if (record["is_active"] and state.samples >= Config.ALERT_MIN_SAMPLES
+                        and state.rate_mean > 0 and not state.depletion_alerted):
+                    hours_left = balance_gb / state.rate_mean
+                    if hours_left <= Config.ALERT_DEPLETION_HOURS and hours_left < expires_in_days * 24:
+                        state.depletion_alerted = True
+                        alert("depletion_forecast", "warning",
+                              f"{record['plan_name']}: at {state.rate_mean:.2f} GB/h the balance runs out "
+                              f"in about {hours_left:.0f} hours", hours_left, Config.ALERT_DEPLETION_HOURS)
+
+        state.last_epoch = epoch
+        state.last_balance_gb = balance_gb
+        state.last_expires_in_days = expires_in_days
+        return alerts
+
+
+class AlertDispatcher:
+    """Background delivery: dedup -> batch -> webhook/email with retries"""
+
+    def __init__(self):
+        self.queue: "queue.Queue[Alert]" = queue.Queue(maxsize=Config.ALERT_QUEUE_SIZE)
+        # sent_at: delivered alerts (the dedup window); queued: dedup keys awaiting
+        # delivery; pending: alerts queued or in flight, for flush()
+        self.sent_at: Dict[str, float] = {}
+        self.queued: Set[str] = set()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.settled = threading.Condition(self.lock)
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(Config.WEBHOOK_URL or (Config.EMAIL_SMTP_HOST and Config.ALERT_EMAIL_TO))
+
+    def submit(self, alerts: Sequence[Alert]):
+        """Queue alerts without blocking; duplicates inside the dedup window are dropped"""
+        if not alerts or not self.enabled:
+            return
+
+        now = time.time()
+        for alert in alerts:
+            with self.lock:
+                last = self.sent_at.get(alert.dedup_key)
+                if alert.dedup_key in self.queued or (last is not None and now - last < Config.ALERT_DEDUP_SECONDS):
+                    continue
+                try:
+                    self.queue.put_nowait(alert)
+                except queue.Full:
+                    logger.warning(f"Alert queue full, dropping {alert.kind} alert")
+                    continue
+                self.queued.add(alert.dedup_key)
+                self.pending += 1
+
+        self._ensure_worker()
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until queued alerts are delivered or given up on (for short-lived processes)"""
+        with self.settled:
+            return self.settled.wait_for(lambda: self.pending == 0, timeout)
+
+    def _ensure_worker(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=60)
+            except queue.Empty:
+                continue
+
+            # Collect whatever else arrives within the batch window
+            batch = [first]
+            deadline = time.time() + Config.ALERT_BATCH_WINDOW_SECONDS
+            while len(batch) < Config.ALERT_BATCH_MAX_SIZE:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            delivered = False
+            try:
+                delivered = self._deliver(batch)
+            except Exception as e:
+                logger.error(f"Alert delivery error: {e}")
+            finally:
+                # Only delivered alerts start the dedup window; failed ones may be raised again
+                with self.settled:
+                    for alert in batch:
+                        self.queued.discard(alert.dedup_key)
+                        if delivered:
+                            self.sent_at[alert.dedup_key] = time.time()
+                    self.pending -= len(batch)
+                    self.settled.notify_all()
+
+    def _deliver(self, batch: List[Alert]) -> bool:
+        """True once any configured channel took the batch, so a dead one doesn't re-send the other"""
+        delivered = False
+        if Config.WEBHOOK_URL:
+            delivered |= self._with_retries("webhook", lambda: self._send_webhook(batch))
+        if Config.EMAIL_SMTP_HOST and Config.ALERT_EMAIL_TO:
+            delivered |= self._with_retries("email", lambda: self._send_email(batch))
+        return delivered
+
+    @staticmethod
+    def _with_retries(channel: str, send) -> bool:
+        for attempt in range(1, Config.MAX_RETRIES + 1):
+            try:
+                send()
+                logger.info(f"Delivered alert batch via {channel}")
+                return True
+            except Exception as e:
+                logger.warning(f"Alert {channel} delivery attempt {attempt} failed: {e}")
+                if attempt < Config.MAX_RETRIES:
+                    time.sleep(min(60, 2 ** attempt))
+        logger.error(f"Giving up on alert {channel} delivery after {Config.MAX_RETRIES} attempts")
+        return False
+
+    @staticmethod
+    def _send_webhook(batch: List[Alert]):
+        body = json.dumps({
+            "source": "taara-monitor",
+            "sent_at": datetime.utcnow().isoformat(),
+            "alerts": [alert.to_dict() for alert in batch],
+            "text": "\n".join(alert.message for alert in batch),
+        }).encode()
+        headers = {"content-type": "application/json"}
+        if Config.WEBHOOK_SECRET:
+            signature = hmac.new(Config.WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+            headers["x-taara-signature"] = f"sha256={signature}"
+
+        response = requests.post(Config.WEBHOOK_URL, data=body, headers=headers, timeout=Config.TIMEOUT_SECONDS)
+        response.raise_for_status()
+
+    @staticmethod
+    def _send_email(batch: List[Alert]):
+        message = EmailMessage()
+        message["Subject"] = f"Taara Monitor: {len(batch)} alert{'s' if len(batch) != 1 else ''}"
+        message["From"] = Config.EMAIL_FROM or Config.EMAIL_USERNAME
+        message["To"] = Config.ALERT_EMAIL_TO
+        message.set_content("\n".join(f"[{a.severity.upper()}] {a.message}" for a in batch))
+
+        with smtplib.SMTP(Config.EMAIL_SMTP_HOST, Config.EMAIL_SMTP_PORT, timeout=Config.TIMEOUT_SECONDS) as smtp:
+            if Config.EMAIL_TLS:
+                smtp.starttls()
+            if Config.EMAIL_USERNAME:
+                smtp.login(Config.EMAIL_USERNAME, Config.EMAIL_PASSWORD)
+            smtp.send_message(message)
+
+
+@dataclass
+class Detection:
+    """Alerts raised by a batch and the series states to keep once the batch is committed"""
+    detector: AnomalyDetector
+    alerts: List[Alert] = field(default_factory=list)
+    states: Dict[Tuple[str, str], SeriesState] = field(default_factory=dict)
+
+    def apply(self):
+        """Call after the readings are committed; a rolled-back batch leaves the detector as it was"""
+        self.detector.states.update(self.states)
+
+
+detector = AnomalyDetector()
+dispatcher = AlertDispatcher()
+
+
+def detect_anomalies(db: Session, records: Sequence[dict]) -> Detection:
+    """
+    Feed committed-reading dicts through the detector. Call before
+    current_state is updated, so series another process has collected
+    since can be re-seeded from it, and apply() the result after commit.
+    """
+    detection = Detection(detector)
+    if not Config.ALERTS_ENABLED or not records:
+        return detection
+
+    detector.refresh(db, {(record["subscriber_id"], record["plan_id"]) for record in records})
+    for record in records:
+        key = (record["subscriber_id"], record["plan_id"])
+        state = detection.states.get(key) or replace(detector.states.get(key) or SeriesState())
+        detection.alerts.extend(detector.observe(record, state))
+        detection.states[key] = state
+    return detection
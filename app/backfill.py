@@ -0,0 +1,117 @@
+"""
+Historical backfill for Taara Internet Monitor
+Loads every purchased plan period from the bundle's purchasedHistory into
+plan_purchases, from the raw responses already stored or from a fresh fetch
+"""
+
+import json
+import logging
+import time
+from typing import List, Set, Tuple
+
+from sqlalchemy import select
+
+from app.bundle_parser import bundle_to_purchases
+from app.database import RawResponse, SessionLocal, epoch_now, upsert_purchases
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def backfill_from_stored(batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Extract purchases from every stored raw response, newest first.
+
+    Each payload repeats the whole purchase history, so only the newest
+    observation of each purchase is kept; rows are upserted in batches of
+    ``batch_size``, one transaction per batch. Returns the rows written.
+    """
+    start = time.perf_counter()
+    seen: Set[Tuple[str, str]] = set()
+    pending: List[dict] = []
+    payloads = written = 0
+    last_id = None
+
+    db = SessionLocal()
+    try:
+        while True:
+            query = select(RawResponse.id, RawResponse.timestamp, RawResponse.raw_response)
+            if last_id is not None:
+                query = query.where(RawResponse.id < last_id)
+            rows = db.execute(query.order_by(RawResponse.id.desc()).limit(batch_size)).all()
+            if not rows:
+                break
+
+            for row in rows:
+                payloads += 1
+                try:
+                    purchases = bundle_to_purchases(json.loads(row.raw_response), row.timestamp)
+                except Exception as e:
+                    logger.warning(f"Skipping raw response {row.id}: {e}")
+                    continue
+                for purchase in purchases:
+                    key = (purchase["subscriber_id"], purchase["purchase_id"])
+                    if key not in seen:
+                        seen.add(key)
+                        pending.append(purchase)
+            last_id = rows[-1].id
+
+            if len(pending) >= batch_size:
+                written += _flush(db, pending)
+                pending = []
+
+        written += _flush(db, pending)
+    finally:
+        db.close()
+
+    logger.info(f"Backfilled {written} purchases from {payloads} stored responses "
+                f"in {time.perf_counter() - start:.2f}s")
+    return written
+
+
+def backfill_from_api() -> int:
+    """Fetch the bundle once (under the collection lease) and load its purchase history"""
+    from app.data_collector import DataCollector
+    from app.leases import collection_lease
+
+    collector = DataCollector()
+    with collection_lease(collector.account):
+        result = collector.api.get_customer_bundle()
+        collector.api.logout()
+    if not result["success"]:
+        raise RuntimeError(f"Bundle fetch failed: {result.get('error')}")
+
+    db = SessionLocal()
+    try:
+        written = _flush(db, bundle_to_purchases(result["data"], epoch_now()))
+    finally:
+        db.close()
+    logger.info(f"Backfilled {written} purchases from a fresh bundle fetch")
+    return written
+
+
+def _flush(db, purchases: List[dict]) -> int:
+    if not purchases:
+        return 0
+    written = upsert_purchases(db, purchases)
+    db.commit()
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import create_tables
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Backfill plan purchase history")
+    parser.add_argument("source", choices=["stored", "fetch"],
+                        help="stored: stored raw responses; fetch: a fresh bundle request")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    create_tables()
+    if args.source == "stored":
+        backfill_from_stored(args.batch_size)
+    else:
+        backfill_from_api()
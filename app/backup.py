@@ -0,0 +1,371 @@
+"""
+Online, incremental, compressed SQLite backups for Taara Internet Monitor
+
+A backup chain starts with a base snapshot taken with VACUUM INTO (a single
+read transaction, so the collector keeps writing under WAL) and streamed
+through gzip. Later runs only export rows added since the previous run:
+tables with an INTEGER PRIMARY KEY ``id`` are append-only here and are read
+past their last watermark; small tables without one, and tables whose rows
+are upserted in place, are copied whole.
+Each run therefore reads and stores data in proportion to what changed.
+
+    python -m app.backup run [--loop]
+    python -m app.backup list
+    python -m app.backup restore TARGET [--at BACKUP_ID]
+    python -m app.backup prune
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from app.config import Config
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+ID_FORMAT = "%Y%m%dT%H%M%SZ"
+# Tables with an integer id whose existing rows are rewritten by upserts; an
+# id watermark would miss those updates, so incrementals copy them whole
+UPDATED_IN_PLACE = {"plan_purchases"}
+
+
+class BackupError(Exception):
+    """Raised when a backup or restore cannot be performed"""
+
+
+class BackupManager:
+    """Takes, lists, prunes and restores backup chains for one SQLite database"""
+
+    def __init__(self, database_path: str, backup_dir: str):
+        self.database_path = Path(database_path)
+        self.backup_dir = Path(backup_dir)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+
+    # -------------------------------------------------------------- manifest
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.backup_dir / MANIFEST_NAME
+
+    def load_manifest(self) -> List[dict]:
+        if not self.manifest_path.exists():
+            return []
+        with open(self.manifest_path) as f:
+            return json.load(f)["entries"]
+
+    def save_manifest(self, entries: List[dict]):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": entries}, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    # ----------------------------------------------------------------- source
+
+    def _connect_readonly(self) -> sqlite3.Connection:
+        if not self.database_path.exists():
+            raise BackupError(f"Database not found: {self.database_path}")
+        conn = sqlite3.connect(f"file:{self.database_path}?mode=ro", uri=True, timeout=30)
+        conn.isolation_level = None
+        return conn
+
+    @staticmethod
+    def schema_hash(conn: sqlite3.Connection) -> str:
+        rows = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY type, name"
+        ).fetchall()
+        return hashlib.sha1(json.dumps(rows).encode()).hexdigest()
+
+    @staticmethod
+    def table_layout(conn: sqlite3.Connection) -> Dict[str, Optional[str]]:
+        """Map table name to its append-only key column ("id"), or None for full copies"""
+        layout = {}
+        tables = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        for (table,) in tables:
+            pk_columns = [
+                (name, col_type.upper())
+                for _, name, col_type, _, _, pk in conn.execute(f'PRAGMA table_info("{table}")')
+                if pk
+            ]
+            append_only = pk_columns == [("id", "INTEGER")] and table not in UPDATED_IN_PLACE
+            layout[table] = "id" if append_only else None
+        return layout
+
+    @staticmethod
+    def watermarks(conn: sqlite3.Connection, layout: Dict[str, Optional[str]]) -> Dict[str, int]:
+        return {
+            table: conn.execute(f'SELECT COALESCE(MAX("{key}"), 0) FROM "{table}"').fetchone()[0]
+            for table, key in layout.items() if key
+        }
+
+    # ------------------------------------------------------------------- run
+
+    def run(self) -> dict:
+        """Take a base snapshot or an incremental, whichever the chain needs"""
+        entries = self.load_manifest()
+        conn = self._connect_readonly()
+        try:
+            schema = self.schema_hash(conn)
+        finally:
+            conn.close()
+
+        bases = [e for e in entries if e["type"] == "base"]
+        last_base = bases[-1] if bases else None
+        needs_base = (
+            last_base is None
+            or last_base["schema"] != schema
+            or datetime.utcnow() - datetime.strptime(last_base["id"], ID_FORMAT)
+            >= timedelta(days=Config.BACKUP_FULL_INTERVAL_DAYS)
+        )
+
+        if needs_base:
+            entry = self._take_base()
+        else:
+            entry = self._take_incremental(entries[-1], last_base["id"])
+
+        entries.append(entry)
+        self.save_manifest(entries)
+        logger.info(f"Backup {entry['id']} ({entry['type']}): {entry['rows']} rows, {entry['bytes']} bytes")
+
+        self.prune()
+        return entry
+
+    def _new_id(self) -> str:
+        backup_id = datetime.utcnow().strftime(ID_FORMAT)
+        existing = {e["id"] for e in self.load_manifest()}
+        while backup_id in existing:
+            time.sleep(1)
+            backup_id = datetime.utcnow().strftime(ID_FORMAT)
+        return backup_id
+
+    def _take_base(self) -> dict:
+        backup_id = self._new_id()
+        file_name = f"{backup_id}.base.db.gz"
+
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as tmp_dir:
+            snapshot = Path(tmp_dir) / "snapshot.db"
+            conn = self._connect_readonly()
+            try:
+                # One consistent read transaction; writers continue under WAL
+                conn.execute("VACUUM INTO ?", (str(snapshot),))
+            finally:
+                conn.close()
+
+            snap = sqlite3.connect(snapshot)
+            try:
+                layout = self.table_layout(snap)
+                marks = self.watermarks(snap, layout)
+                schema = self.schema_hash(snap)
+                rows = sum(snap.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in layout)
+            finally:
+                snap.close()
+
+            with open(snapshot, "rb") as src, gzip.open(self.backup_dir / file_name, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        return {
+            "id": backup_id,
+            "type": "base",
+            "base": backup_id,
+            "file": file_name,
+            "schema": schema,
+            "watermarks": marks,
+            "rows": rows,
+            "bytes": (self.backup_dir / file_name).stat().st_size,
+        }
+
+    def _take_incremental(self, previous: dict, base_id: str) -> dict:
+        backup_id = self._new_id()
+        file_name = f"{backup_id}.incr.jsonl.gz"
+        since = previous["watermarks"]
+
+        conn = self._connect_readonly()
+        rows = 0
+        try:
+            conn.execute("BEGIN")  # consistent view across every table
+            layout = self.table_layout(conn)
+            marks = self.watermarks(conn, layout)
+            with gzip.open(self.backup_dir / file_name, "wt", encoding="utf-8") as out:
+                for table, key in layout.items():
+                    if key:
+                        cursor = conn.execute(
+                            f'SELECT * FROM "{table}" WHERE "{key}" > ? AND "{key}" <= ? ORDER BY "{key}"',
+                            (since.get(table, 0), marks[table])
+                        )
+                        mode = "append"
+                    else:
+                        cursor = conn.execute(f'SELECT * FROM "{table}"')
+                        mode = "replace"
+
+                    columns = [d[0] for d in cursor.description]
+                    out.write(json.dumps({"table": table, "mode": mode, "columns": columns}) + "\n")
+                    for row in cursor:
+                        out.write(json.dumps(row) + "\n")
+                        rows += 1
+            conn.execute("COMMIT")
+            schema = self.schema_hash(conn)
+        finally:
+            conn.close()
+
+        return {
+            "id": backup_id,
+            "type": "incr",
+            "base": base_id,
+            "file": file_name,
+            "schema": schema,
+            "watermarks": marks,
+            "rows": rows,
+            "bytes": (self.backup_dir / file_name).stat().st_size,
+        }
+
+    # ----------------------------------------------------------------- prune
+
+    def prune(self) -> List[str]:
+        """
+        Delete whole chains whose newest backup is older than
+        BACKUP_RETENTION_DAYS. The newest chain is always kept.
+        """
+        entries = self.load_manifest()
+        if not entries:
+            return []
+
+        cutoff = datetime.utcnow() - timedelta(days=Config.BACKUP_RETENTION_DAYS)
+        newest_base = entries[-1]["base"]
+        chains: Dict[str, List[dict]] = {}
+        for entry in entries:
+            chains.setdefault(entry["base"], []).append(entry)
+
+        expired = {
+            base for base, chain in chains.items()
+            if base != newest_base and datetime.strptime(chain[-1]["id"], ID_FORMAT) < cutoff
+        }
+        if not expired:
+            return []
+
+        removed = []
+        for entry in entries:
+            if entry["base"] in expired:
+                (self.backup_dir / entry["file"]).unlink(missing_ok=True)
+                removed.append(entry["id"])
+        self.save_manifest([e for e in entries if e["base"] not in expired])
+        logger.info(f"Pruned {len(removed)} expired backups")
+        return removed
+
+    # --------------------------------------------------------------- restore
+
+    def chain_for(self, backup_id: Optional[str] = None) -> List[dict]:
+        """The base plus incrementals needed to reach ``backup_id`` (default: newest)"""
+        entries = self.load_manifest()
+        if not entries:
+            raise BackupError("No backups available")
+
+        target = entries[-1] if backup_id is None else next((e for e in entries if e["id"] == backup_id), None)
+        if target is None:
+            raise BackupError(f"Unknown backup id: {backup_id}")
+        return [e for e in entries if e["base"] == target["base"] and e["id"] <= target["id"]]
+
+    @staticmethod
+    def _read_incremental(path: Path) -> Iterator[tuple]:
+        header = None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    header = item
+                    yield header, None
+                else:
+                    yield header, item
+
+    def restore(self, target: str, backup_id: Optional[str] = None) -> List[str]:
+        """Rebuild a database file at ``target`` from a backup chain"""
+        target_path = Path(target)
+        if target_path.exists():
+            raise BackupError(f"Refusing to overwrite existing file: {target_path}")
+
+        chain = self.chain_for(backup_id)
+        tmp_path = target_path.with_name(target_path.name + ".restoring")
+        with gzip.open(self.backup_dir / chain[0]["file"], "rb") as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        conn = sqlite3.connect(tmp_path)
+        try:
+            for entry in chain[1:]:
+                insert_sql = None
+                for header, row in self._read_incremental(self.backup_dir / entry["file"]):
+                    if row is None:
+                        table, columns = header["table"], header["columns"]
+                        if header["mode"] == "replace":
+                            conn.execute(f'DELETE FROM "{table}"')
+                        column_list = ", ".join(f'"{c}"' for c in columns)
+                        placeholders = ", ".join("?" for _ in columns)
+                        insert_sql = f'INSERT OR REPLACE INTO "{table}" ({column_list}) VALUES ({placeholders})'
+                    else:
+                        conn.execute(insert_sql, row)
+                conn.commit()
+        finally:
+            conn.close()
+
+        os.replace(tmp_path, target_path)
+        return [entry["id"] for entry in chain]
+
+
+def get_backup_manager() -> BackupManager:
+    if engine.dialect.name != "sqlite":
+        raise BackupError("Incremental backups support SQLite only; use pg_dump or WAL archiving for PostgreSQL")
+    return BackupManager(engine.url.database, os.path.join(Config.BACKUP_STORAGE_PATH, "db"))
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format=Config.LOG_FORMAT)
+    parser = argparse.ArgumentParser(description="Taara database backups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Take a base or incremental backup")
+    run_parser.add_argument("--loop", action="store_true", help="Repeat every BACKUP_INTERVAL seconds")
+    commands.add_parser("list", help="List backups")
+    commands.add_parser("prune", help="Delete chains past BACKUP_RETENTION_DAYS")
+    restore_parser = commands.add_parser("restore", help="Restore into a new database file")
+    restore_parser.add_argument("target")
+    restore_parser.add_argument("--at", dest="backup_id", help="Backup id to restore up to (default: newest)")
+    args = parser.parse_args()
+
+    try:
+        manager = get_backup_manager()
+        if args.command == "run":
+            while True:
+                if Config.BACKUP_ENABLED:
+                    try:
+                        manager.run()
+                    except (BackupError, sqlite3.Error) as e:
+                        if not args.loop:
+                            raise
+                        logger.error(f"Backup failed: {e}")
+                if not args.loop:
+                    break
+                time.sleep(Config.BACKUP_INTERVAL)
+        elif args.command == "list":
+            for entry in manager.load_manifest():
+                print(f"{entry['id']}  {entry['type']:<5} base={entry['base']}  "
+                      f"rows={entry['rows']:<8} bytes={entry['bytes']}")
+        elif args.command == "prune":
+            manager.prune()
+        elif args.command == "restore":
+            chain = manager.restore(args.target, args.backup_id)
+            print(f"Restored {args.target} from {', '.join(chain)}")
+    except BackupError as e:
+        logger.error(str(e))
+        sys.exit(1)
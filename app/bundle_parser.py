@@ -0,0 +1,269 @@
+"""
+Typed decoder for Taara get-customer-bundle responses
+Decodes the payload once and indexes purchase history by plan name in a single pass
+"""
+
+import calendar
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import (BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, ValidatorFunctionWrapHandler,
+                      field_validator)
+# pydantic needs the typing_extensions TypedDict before Python 3.12
+from typing_extensions import TypedDict
+
+logger = logging.getLogger(__name__)
+
+# Binary multipliers, matching how the dashboard has always converted GB/MB
+SIZE_UNITS = {
+    "": 1,
+    "B": 1,
+    "KB": 1024,
+    "MB": 1024 ** 2,
+    "GB": 1024 ** 3,
+    "TB": 1024 ** 4,
+}
+
+DURATION_UNITS_IN_DAYS = {
+    "minute": 1 / 1440,
+    "hour": 1 / 24,
+    "day": 1,
+    "week": 7,
+    "month": 30,
+}
+
+# Thousands may be grouped with commas ("1,024 GB"); the decimal mark is always a point
+_SIZE_RE = re.compile(r"^\s*([0-9]{1,3}(?:,[0-9]{3})+|[0-9]+)(\.[0-9]+)?\s*([KMGT]?B)?\s*$", re.IGNORECASE)
+_DURATION_RE = re.compile(r"^\s*([0-9]+(?:\.[0-9]+)?)\s*(minute|hour|day|week|month)s?\s*$", re.IGNORECASE)
+
+
+class _Model(BaseModel):
+    # The API sends null for values it doesn't have, so every field is Optional;
+    # the record builders below fall back to the defaults
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+
+
+def _skip_bad_items(value: Any, validate: Callable[[Any], list], what: str,
+                    salvage: Optional[Callable[[Any], Any]] = None) -> list:
+    """
+    Validate a whole list in one call, falling back to item by item only when it fails
+
+    Items that don't fit are logged and skipped, so one malformed plan doesn't
+    cost the readings of the others. ``salvage`` gets a chance to rescue a bad
+    item before it is dropped.
+    """
+    if value is None:
+        return []
+    try:
+        return validate(value)
+    except ValidationError:
+        if not isinstance(value, list):
+            logger.warning(f"Skipping {what} list of unexpected type {type(value).__name__}")
+            return []
+    valid = []
+    for item in value:
+        try:
+            valid.extend(validate([item]))
+        except ValidationError as e:
+            rescued = salvage(item) if salvage else None
+            if rescued is not None:
+                valid.append(rescued)
+            else:
+                logger.warning(f"Skipping unparseable {what}: {e.errors()[0]['msg']} in {item!r:.200}")
+    return valid
+
+
+# Leaf objects stay plain dicts: a model instance per purchased plan doubles the decode time
+class DataUsage(TypedDict, total=False):
+    totalDataUsage: Optional[float]
+
+
+class Price(TypedDict, total=False):
+    currencyCode: Optional[str]
+    units: Optional[float]
+
+
+class HistoryPlan(_Model):
+    purchase_id: Optional[str] = Field("", alias="_id")
+    plan_display_name: Optional[str] = Field("", alias="planDisplayName")
+    hotspot_name: Optional[str] = Field("", alias="hotspotName")
+    reseller_price: Optional[Price] = Field(None, alias="resellerPrice")
+    is_reward_plan: Optional[bool] = Field(False, alias="isRewardPlan")
+    history_type: Optional[str] = Field("", alias="historyType")
+    data_usage: Optional[DataUsage] = Field(None, alias="dataUsage")
+
+    @property
+    def usage_bytes(self) -> int:
+        return int((self.data_usage or {}).get("totalDataUsage") or 0)
+
+
+class PurchaseHistory(_Model):
+    purchased_at: Optional[str] = Field("", alias="purchasedAt")
+    plans: Optional[List[HistoryPlan]] = Field(default_factory=list, alias="purchasedHistoryPlans")
+
+
+_HISTORY_PLANS = TypeAdapter(List[HistoryPlan])
+
+
+def _salvage_purchase(item: Any) -> Optional[PurchaseHistory]:
+    """Keep the valid plans of a purchase that failed because of some of its plans"""
+    if not isinstance(item, dict):
+        return None
+    try:
+        purchase = PurchaseHistory.model_validate({**item, "purchasedHistoryPlans": None})
+    except ValidationError:
+        return None
+    purchase.plans = _skip_bad_items(item.get("purchasedHistoryPlans"), _HISTORY_PLANS.validate_python,
+                                     "purchase history plan")
+    return purchase
+
+
+class ActivePlan(_Model):
+    plan_id: Optional[str] = Field("", alias="planId")
+    plan_name: Optional[str] = Field("", alias="planName")
+    remaining_balance: Optional[str] = Field("0 GB", alias="remainingBalance")
+    expires_in: Optional[str] = Field("0 days", alias="expiresIn")
+    is_active: Optional[bool] = Field(False, alias="isActive")
+    is_home_plan: Optional[bool] = Field(False, alias="isHomePlan")
+
+
+class BundleData(_Model):
+    subscriber_id: Optional[str] = Field("", alias="subscriberId")
+    active_plans: Optional[List[ActivePlan]] = Field(default_factory=list, alias="subscriberActiveAndUnusedPlans")
+    purchased_history: Optional[List[PurchaseHistory]] = Field(default_factory=list, alias="purchasedHistory")
+
+    @field_validator("active_plans", mode="wrap")
+    @classmethod
+    def _skip_bad_active_plans(cls, value: Any, handler: ValidatorFunctionWrapHandler) -> list:
+        return _skip_bad_items(value, handler, "active plan")
+
+    @field_validator("purchased_history", mode="wrap")
+    @classmethod
+    def _skip_bad_purchases(cls, value: Any, handler: ValidatorFunctionWrapHandler) -> list:
+        return _skip_bad_items(value, handler, "purchase", salvage=_salvage_purchase)
+
+
+class BundleResponse(_Model):
+    data: Optional[BundleData] = Field(default_factory=BundleData)
+    message: Optional[str] = ""
+
+
+def parse_size_to_bytes(value: str) -> int:
+    """
+    Convert a balance string such as "885.1 GB", "1,024 MB" or "12 kb" to bytes
+
+    Commas group thousands; a decimal comma ("1,5 GB") is ambiguous and,
+    like anything else that cannot be parsed, logs a warning and returns 0.
+    """
+    match = _SIZE_RE.match(value or "")
+    if not match:
+        if value:
+            logger.warning(f"Unparseable size {value!r}, counting it as 0 bytes")
+        return 0
+    number = float(match.group(1).replace(",", "") + (match.group(2) or ""))
+    unit = (match.group(3) or "").upper()
+    return int(number * SIZE_UNITS[unit])
+
+
+def parse_expires_in_days(value: str) -> int:
+    """
+    Convert an expiry string such as "27 days", "1 day" or "5 hours" to whole days
+
+    Returns 0 for anything that cannot be parsed.
+    """
+    match = _DURATION_RE.match(value or "")
+    if not match:
+        return 0
+    return int(float(match.group(1)) * DURATION_UNITS_IN_DAYS[match.group(2).lower()])
+
+
+def parse_purchase_date(value: str) -> Optional[int]:
+    """Convert a purchasedAt date ("08/21/2025") to epoch seconds at 00:00 UTC, or None"""
+    try:
+        return calendar.timegm(datetime.strptime(value, "%m/%d/%Y").timetuple())
+    except (TypeError, ValueError):
+        return None
+
+
+def index_usage_by_plan(history: List[PurchaseHistory]) -> Dict[str, int]:
+    """
+    Map plan display name to total data usage in one pass over the history
+
+    The first (most recent) purchase of a plan wins.
+    """
+    usage: Dict[str, int] = {}
+    for purchase in history:
+        for plan in purchase.plans or ():
+            name = plan.plan_display_name or ""
+            if name not in usage:
+                usage[name] = plan.usage_bytes
+    return usage
+
+
+def decode_bundle(bundle_response: Dict[str, Any]) -> BundleResponse:
+    """Validate a raw bundle response into typed models"""
+    return BundleResponse.model_validate(bundle_response)
+
+
+def bundle_to_records(bundle_response: Dict[str, Any],
+                      bundle: Optional[BundleResponse] = None) -> List[Dict[str, Any]]:
+    """
+    Turn a raw bundle response into DataUsageRecord field dicts
+
+    Pass ``bundle`` when the response has already been decoded.
+    """
+    data = (bundle or decode_bundle(bundle_response)).data or BundleData()
+    usage_by_plan = index_usage_by_plan(data.purchased_history)
+    raw_response = json.dumps(bundle_response)
+
+    records = []
+    for plan in data.active_plans:
+        remaining_balance_bytes = parse_size_to_bytes(plan.remaining_balance)
+        records.append({
+            "subscriber_id": data.subscriber_id or "",
+            "plan_name": plan.plan_name or "",
+            "plan_id": plan.plan_id or "",
+            "remaining_balance_gb": remaining_balance_bytes / SIZE_UNITS["GB"],
+            "remaining_balance_bytes": remaining_balance_bytes,
+            "total_data_usage_bytes": usage_by_plan.get(plan.plan_name or "", 0),
+            "expires_in_days": parse_expires_in_days(plan.expires_in),
+            "is_active": bool(plan.is_active),
+            "is_home_plan": bool(plan.is_home_plan),
+            "raw_response": raw_response
+        })
+    return records
+
+
+def bundle_to_purchases(bundle_response: Dict[str, Any], observed_at: int,
+                        bundle: Optional[BundleResponse] = None) -> List[Dict[str, Any]]:
+    """
+    Flatten purchasedHistory into one dict per purchased plan period.
+
+    ``observed_at`` (epoch seconds) is when the payload was fetched; usage
+    totals of running plans grow, so later observations replace earlier ones.
+    Plans without an ``_id`` are keyed by date, name and position instead.
+    Pass ``bundle`` when the response has already been decoded.
+    """
+    data = (bundle or decode_bundle(bundle_response)).data or BundleData()
+
+    purchases = []
+    for purchase in data.purchased_history:
+        for position, plan in enumerate(purchase.plans or ()):
+            price = plan.reseller_price
+            purchases.append({
+                "subscriber_id": data.subscriber_id or "",
+                "purchase_id": plan.purchase_id or f"{purchase.purchased_at or ''}:{plan.plan_display_name or ''}:{position}",
+                "purchased_at": parse_purchase_date(purchase.purchased_at),
+                "plan_name": plan.plan_display_name or "",
+                "hotspot_name": plan.hotspot_name or "",
+                "price_units": int(price.get("units") or 0) if price is not None else None,
+                "currency_code": price.get("currencyCode") if price is not None else None,
+                "is_reward_plan": bool(plan.is_reward_plan),
+                "history_type": plan.history_type or "",
+                "total_data_usage_bytes": plan.usage_bytes,
+                "observed_at": observed_at,
+            })
+    return purchases
@@ -0,0 +1,55 @@
+"""
+Proxy cache refresh for Taara Internet Monitor
+After a successful collection the hot read URLs are re-fetched through
+nginx's internal refresh listener, which bypasses and replaces its cache
+"""
+
+import logging
+import threading
+from typing import List, Optional
+
+import requests
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_proxy_cache(paths: Optional[List[str]] = None, wait: bool = False) -> Optional[threading.Thread]:
+    """
+    Re-prime cached URLs in the background so collection never waits on nginx.
+
+    Does nothing unless PROXY_CACHE_REFRESH_URL is configured.
+    """
+    if not Config.PROXY_CACHE_REFRESH_URL:
+        return None
+
+    paths = paths or Config.PROXY_CACHE_REFRESH_PATHS
+    thread = threading.Thread(target=_refresh, args=(paths,), name="proxy-cache-refresh", daemon=True)
+    thread.start()
+    if wait:
+        thread.join()
+    return thread
+
+
+def refresh_urls(paths: List[str]) -> List[str]:
+    """Full refresh-listener URLs for ``paths``; blanks from the comma-separated setting are skipped"""
+    base_url = Config.PROXY_CACHE_REFRESH_URL.rstrip("/")
+    return [f"{base_url}/{path.strip().lstrip('/')}" for path in paths if path.strip()]
+
+
+def _refresh(paths: List[str]):
+    urls = refresh_urls(paths)
+    refreshed = 0
+    with requests.Session() as session:
+        for url in urls:
+            try:
+                response = session.get(url, timeout=Config.CONNECTION_TIMEOUT)
+                if response.status_code == 200:
+                    refreshed += 1
+                else:
+                    logger.warning(f"Cache refresh of {url} returned HTTP {response.status_code}")
+            except requests.RequestException as e:
+                logger.warning(f"Cache refresh of {url} failed: {e}")
+
+    logger.info(f"Refreshed {refreshed}/{len(urls)} proxy cache entries")
@@ -0,0 +1,109 @@
+"""
+Change feed for Taara Internet Monitor
+Readings in insert order, addressed by offset (the data_usage_records id):
+consumers pass the last offset they saw and get only newer readings,
+optionally long-polling until the collector stores some
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.config import Config
+from app.database import DataUsageRecord, SessionLocal, engine, epoch_now
+from app.heartbeat import read_heartbeat
+
+
+def read_changes(after: int, limit: int) -> Tuple[List[DataUsageRecord], bool]:
+    """
+    Up to ``limit`` readings with an offset above ``after``, oldest first,
+    and whether more are already available.
+    """
+    db = SessionLocal()
+    try:
+        records = db.execute(
+            select(DataUsageRecord)
+            .where(DataUsageRecord.id > after)
+            .order_by(DataUsageRecord.id)
+            .limit(limit + 1)
+        ).scalars().all()
+    finally:
+        db.close()
+
+    has_more = len(records) > limit
+    records = records[:limit]
+    if engine.dialect.name != "sqlite" and records:
+        # Concurrent writers can commit ids out of order; stop before readings
+        # young enough that a lower id might still be in flight, so a consumer
+        # never advances its offset past one it hasn't seen
+        horizon = epoch_now() - Config.CHANGE_FEED_SETTLE_SECONDS
+        for position, record in enumerate(records):
+            if record.created_at > horizon:
+                records, has_more = records[:position], True
+                break
+    return records, has_more
+
+
+# One event per event loop (asyncio events belong to the loop that first waits
+# on them), set and replaced when this process stores readings, to wake its
+# long-polls without waiting for the next heartbeat check
+_readings_events: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Event]" = \
+    weakref.WeakKeyDictionary()
+_readings_events_lock = threading.Lock()
+
+
+def notify_new_readings():
+    """Wake long-polls in this process after a collection; safe to call from any thread"""
+    with _readings_events_lock:
+        waiting = list(_readings_events.items())
+        _readings_events.clear()
+    for loop, event in waiting:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # the loop has closed
+
+
+def _new_readings_event() -> asyncio.Event:
+    loop = asyncio.get_running_loop()
+    with _readings_events_lock:
+        event = _readings_events.get(loop)
+        if event is None:
+            event = _readings_events[loop] = asyncio.Event()
+    return event
+
+
+def _collection_marker() -> Optional[float]:
+    heartbeat = read_heartbeat()
+    return heartbeat["last_success"] if heartbeat else None
+
+
+async def wait_for_changes(after: int, limit: int, wait_seconds: float) -> Tuple[List[DataUsageRecord], bool]:
+    """
+    read_changes(), but if nothing is newer than ``after`` wait up to
+    ``wait_seconds`` for a collection to store some. While waiting only the
+    collector heartbeat is checked (or an embedded collector wakes the wait),
+    so idle long-polls don't query the database.
+    """
+    loop = asyncio.get_running_loop()
+    marker = _collection_marker()
+    records, has_more = await loop.run_in_executor(None, read_changes, after, limit)
+
+    deadline = time.monotonic() + wait_seconds
+    while not records and time.monotonic() < deadline:
+        event = _new_readings_event()
+        try:
+            await asyncio.wait_for(event.wait(), min(Config.CHANGE_FEED_POLL_SECONDS,
+                                                     max(0.0, deadline - time.monotonic())))
+        except asyncio.TimeoutError:
+            pass
+        current = _collection_marker()
+        if event.is_set() or current != marker or has_more:
+            # has_more with no records: readings held back by the settle window
+            marker = current
+            records, has_more = await loop.run_in_executor(None, read_changes, after, limit)
+    return records, has_more
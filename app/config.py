@@ -6,7 +6,7 @@ Handles environment variables and application settings
 import os
 import secrets
 from pathlib import Path
-from typing import Optional, List
+from typing import List
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -23,12 +23,21 @@ class Config:
     TAARA_PASSCODE: str = os.getenv("TAARA_PASSCODE", "")
     TAARA_PARTNER_ID: str = os.getenv("TAARA_PARTNER_ID", "")
     TAARA_HOTSPOT_ID: str = os.getenv("TAARA_HOTSPOT_ID", "")
+    TAARA_API_BASE_URL: str = os.getenv("TAARA_API_BASE_URL", "https://share.taara.company")
     
     # =============================================================================
     # DATABASE CONFIGURATION
     # =============================================================================
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./data/taara_monitoring.db")
     
+    # Usage history read backend: "sql" (data_usage_records) or "columnar"
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "sql").lower()
+    COLUMNAR_STORAGE_PATH: str = os.getenv("COLUMNAR_STORAGE_PATH", "./data/columnar")
+    
+    # PostgreSQL monthly partitions (ignored on SQLite)
+    PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+    PARTITION_RETENTION_MONTHS: int = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+    
     # =============================================================================
     # APPLICATION SETTINGS
     # =============================================================================
@@ -49,9 +58,18 @@ class Config:
     # =============================================================================
     COLLECTION_INTERVAL: int = int(os.getenv("COLLECTION_INTERVAL", "900"))
     SCRAPING_INTERVAL_MINUTES: int = int(os.getenv("SCRAPING_INTERVAL_MINUTES", "15"))
+    
+    # "scheduler": the scheduler container collects; "embedded": one web worker
+    # (elected via COLLECTOR_LOCK_PATH) collects inside the app
+    COLLECTOR_MODE: str = os.getenv("COLLECTOR_MODE", "scheduler").lower()
+    COLLECTOR_LOCK_PATH: str = os.getenv("COLLECTOR_LOCK_PATH", "./data/collector.lock")
+    COLLECTOR_ELECTION_RETRY_SECONDS: int = int(os.getenv("COLLECTOR_ELECTION_RETRY_SECONDS", "30"))
     MAX_RETRIES: int = int(os.getenv("MAX_RETRIES", "3"))
     TIMEOUT_SECONDS: int = int(os.getenv("TIMEOUT_SECONDS", "30"))
     
+    # Per-account collection lock; a crashed collector's lease expires after this
+    COLLECTION_LEASE_SECONDS: int = int(os.getenv("COLLECTION_LEASE_SECONDS", "300"))
+    
     # API Rate Limiting
     API_RATE_LIMIT: int = int(os.getenv("API_RATE_LIMIT", "100"))
     API_BURST_LIMIT: int = int(os.getenv("API_BURST_LIMIT", "20"))
@@ -75,8 +93,13 @@ class Config:
     # =============================================================================
     # PERFORMANCE SETTINGS
     # =============================================================================
-    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    # gunicorn worker processes; gunicorn reads the same WEB_CONCURRENCY as its --workers default
+    WORKERS: int = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # PostgreSQL's max_connections, shared by the workers, DB_OTHER_PROCESSES
+    # (scheduler, backup, CLI tools) and DB_RESERVED_CONNECTIONS for superuser/psql sessions
     MAX_CONNECTIONS: int = int(os.getenv("MAX_CONNECTIONS", "100"))
+    DB_OTHER_PROCESSES: int = int(os.getenv("DB_OTHER_PROCESSES", "3"))
+    DB_RESERVED_CONNECTIONS: int = int(os.getenv("DB_RESERVED_CONNECTIONS", "5"))
     CONNECTION_TIMEOUT: int = int(os.getenv("CONNECTION_TIMEOUT", "30"))
     KEEPALIVE_TIMEOUT: int = int(os.getenv("KEEPALIVE_TIMEOUT", "65"))
     
@@ -85,6 +108,33 @@ class Config:
     CACHE_TTL: int = int(os.getenv("CACHE_TTL", "300"))
     CACHE_MAX_SIZE: int = int(os.getenv("CACHE_MAX_SIZE", "1000"))
     
+    # Load shedding: adaptive per-route and per-worker concurrency limits; requests
+    # over them get 503 + Retry-After. Limits shrink once latency exceeds
+    # ADMISSION_LATENCY_TOLERANCE x its long-term baseline.
+    LOAD_SHEDDING_ENABLED: bool = os.getenv("LOAD_SHEDDING_ENABLED", "True").lower() == "true"
+    ADMISSION_INITIAL_LIMIT: int = int(os.getenv("ADMISSION_INITIAL_LIMIT", "4"))
+    ADMISSION_MIN_LIMIT: int = int(os.getenv("ADMISSION_MIN_LIMIT", "1"))
+    ADMISSION_MAX_LIMIT: int = int(os.getenv("ADMISSION_MAX_LIMIT", "50"))
+    ADMISSION_LATENCY_TOLERANCE: float = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+    
+    # Default per-trace point budget for dashboard charts (0 = no downsampling)
+    CHART_MAX_POINTS: int = int(os.getenv("CHART_MAX_POINTS", "500"))
+    
+    # Change feed (/api/changes): default batch, longest long-poll (keep below
+    # nginx's proxy_read_timeout for /api/changes), heartbeat check interval while
+    # waiting, and how old readings must be before they are served on PostgreSQL
+    CHANGE_FEED_BATCH_SIZE: int = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "500"))
+    CHANGE_FEED_MAX_WAIT_SECONDS: int = int(os.getenv("CHANGE_FEED_MAX_WAIT_SECONDS", "25"))
+    CHANGE_FEED_POLL_SECONDS: float = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+    CHANGE_FEED_SETTLE_SECONDS: int = int(os.getenv("CHANGE_FEED_SETTLE_SECONDS", "5"))
+    
+    # nginx micro-cache refresh after each collection (empty disables)
+    PROXY_CACHE_REFRESH_URL: str = os.getenv("PROXY_CACHE_REFRESH_URL", "")
+    PROXY_CACHE_REFRESH_PATHS: List[str] = os.getenv(
+        "PROXY_CACHE_REFRESH_PATHS",
+        "/,/api/data,/api/stats,/api/history,/api/history?days=1,/api/history?days=30"
+    ).split(",")
+    
     # =============================================================================
     # MONITORING & LOGGING
     # =============================================================================
@@ -92,6 +142,10 @@ class Config:
     HEALTH_CHECK_INTERVAL: int = int(os.getenv("HEALTH_CHECK_INTERVAL", "60"))
     HEALTH_CHECK_TIMEOUT: int = int(os.getenv("HEALTH_CHECK_TIMEOUT", "10"))
     
+    # Collector heartbeat read by /health/ready; stale after three missed 15-minute cycles
+    HEARTBEAT_PATH: str = os.getenv("HEARTBEAT_PATH", "./data/collector_heartbeat.json")
+    HEARTBEAT_MAX_AGE_SECONDS: int = int(os.getenv("HEARTBEAT_MAX_AGE_SECONDS", "2700"))
+    
     # Logging
     LOG_FORMAT: str = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     LOG_FILE_MAX_SIZE: int = int(os.getenv("LOG_FILE_MAX_SIZE", "10485760"))
@@ -117,6 +171,20 @@ class Config:
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
     WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
     
+    # Alerts (delivered to WEBHOOK_URL and/or ALERT_EMAIL_TO)
+    ALERTS_ENABLED: bool = os.getenv("ALERTS_ENABLED", "True").lower() == "true"
+    ALERT_EMAIL_TO: str = os.getenv("ALERT_EMAIL_TO", "")
+    ALERT_BALANCE_THRESHOLDS_GB: str = os.getenv("ALERT_BALANCE_THRESHOLDS_GB", "100,50,10")
+    ALERT_EXPIRY_THRESHOLDS_DAYS: str = os.getenv("ALERT_EXPIRY_THRESHOLDS_DAYS", "3,1")
+    ALERT_ZSCORE_THRESHOLD: float = float(os.getenv("ALERT_ZSCORE_THRESHOLD", "3.0"))
+    ALERT_EWMA_ALPHA: float = float(os.getenv("ALERT_EWMA_ALPHA", "0.1"))
+    ALERT_MIN_SAMPLES: int = int(os.getenv("ALERT_MIN_SAMPLES", "8"))
+    ALERT_DEPLETION_HOURS: float = float(os.getenv("ALERT_DEPLETION_HOURS", "24"))
+    ALERT_DEDUP_SECONDS: int = int(os.getenv("ALERT_DEDUP_SECONDS", "21600"))
+    ALERT_BATCH_WINDOW_SECONDS: float = float(os.getenv("ALERT_BATCH_WINDOW_SECONDS", "5"))
+    ALERT_BATCH_MAX_SIZE: int = int(os.getenv("ALERT_BATCH_MAX_SIZE", "50"))
+    ALERT_QUEUE_SIZE: int = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+    
     # Third-party APIs
     SENTRY_DSN: str = os.getenv("SENTRY_DSN", "")
     ANALYTICS_API_KEY: str = os.getenv("ANALYTICS_API_KEY", "")
@@ -129,7 +197,7 @@ class Config:
     DOCKER_NETWORK: str = os.getenv("DOCKER_NETWORK", "taara-network")
     
     # Health Check URLs
-    HEALTH_CHECK_URL: str = os.getenv("HEALTH_CHECK_URL", "http://localhost:8000/api/data")
+    HEALTH_CHECK_URL: str = os.getenv("HEALTH_CHECK_URL", "http://localhost:8000/health")
     EXTERNAL_HEALTH_CHECK_URL: str = os.getenv("EXTERNAL_HEALTH_CHECK_URL", "")
     
     # =============================================================================
@@ -139,6 +207,7 @@ class Config:
     BACKUP_INTERVAL: int = int(os.getenv("BACKUP_INTERVAL", "86400"))
     BACKUP_RETENTION_DAYS: int = int(os.getenv("BACKUP_RETENTION_DAYS", "30"))
     BACKUP_STORAGE_PATH: str = os.getenv("BACKUP_STORAGE_PATH", "/app/backups")
+    BACKUP_FULL_INTERVAL_DAYS: int = int(os.getenv("BACKUP_FULL_INTERVAL_DAYS", "7"))
     
     # Database Maintenance
     AUTO_VACUUM_ENABLED: bool = os.getenv("AUTO_VACUUM_ENABLED", "True").lower() == "true"
@@ -149,6 +218,10 @@ class Config:
     # =============================================================================
     ENABLE_API_DOCS: bool = os.getenv("ENABLE_API_DOCS", "False").lower() == "true"
     ENABLE_DEBUG_ROUTES: bool = os.getenv("ENABLE_DEBUG_ROUTES", "False").lower() == "true"
+    
+    # Request profiling (only with ENABLE_DEBUG_ROUTES)
+    SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "100"))
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1"))
     ENABLE_MAINTENANCE_MODE: bool = os.getenv("ENABLE_MAINTENANCE_MODE", "False").lower() == "true"
     ENABLE_RATE_LIMITING: bool = os.getenv("ENABLE_RATE_LIMITING", "True").lower() == "true"
     
@@ -1,9 +1,19 @@
 import asyncio
 import logging
 from datetime import datetime
+from typing import Dict, Optional
+import requests
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, DataUsageRecord, ApiLog
+from app.database import SessionLocal, ApiLog, engine, insert_readings, to_epoch, upsert_current_state, upsert_purchases
+from app.bundle_parser import BundleResponse, bundle_to_purchases, decode_bundle
+from app.partitions import maintain_partitions
 from app.taara_api import TaaraAPI
+from app.storage import append_committed
+from app.cache_refresh import refresh_proxy_cache
+from app.alerts import detect_anomalies, dispatcher
+from app.heartbeat import record_heartbeat
+from app.leases import Lease, LeaseHeld, collection_lease, fence
 from app.config import Config
 import os
 
@@ -12,14 +22,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class DataCollector:
-    def __init__(self):
-        self.api = TaaraAPI(
+    def __init__(self, api: Optional[TaaraAPI] = None, session: Optional[requests.Session] = None):
+        self.api = api or TaaraAPI(
             phone_country_code=Config.TAARA_PHONE_COUNTRY_CODE,
             phone_number=Config.TAARA_PHONE_NUMBER,
             passcode=Config.TAARA_PASSCODE,
             partner_id=Config.TAARA_PARTNER_ID,
-            hotspot_id=Config.TAARA_HOTSPOT_ID
+            hotspot_id=Config.TAARA_HOTSPOT_ID,
+            base_url=Config.TAARA_API_BASE_URL,
+            session=session
         )
+        self.account = f"{self.api.phone_country_code}{self.api.phone_number}"
     
     def log_api_call(self, db: Session, endpoint: str, method: str, 
                      success: bool, status_code: int = None, 
@@ -37,11 +50,20 @@ class DataCollector:
         db.commit()
     
     def collect_data(self):
-        """Collect data from Taara API and store in database"""
+        """
+        Collect data from Taara API and store in database.
+        
+        Raises LeaseHeld if another process is already collecting for this account.
+        """
+        with collection_lease(self.account) as lease:
+            return self._collect_data(lease)
+    
+    def _collect_data(self, lease: Lease):
         db = SessionLocal()
         
         try:
             logger.info("Starting data collection...")
+            maintain_partitions(engine)
             
             # Get bundle data
             bundle_result = self.api.get_customer_bundle()
@@ -57,16 +79,39 @@ class DataCollector:
             )
             
             if bundle_result["success"]:
-                # Parse and store data
-                parsed_data = self.api.parse_bundle_data(bundle_result["data"])
-                
-                for record_data in parsed_data:
-                    # Create database record
-                    db_record = DataUsageRecord(**record_data)
-                    db.add(db_record)
+                # Decode once and parse everything before touching the session,
+                # so only database errors can fail the transaction
+                try:
+                    bundle = decode_bundle(bundle_result["data"])
+                except ValidationError as e:
+                    logger.error(f"Error parsing bundle data: {e}")
+                    bundle = BundleResponse()
+                parsed_data = self.api.parse_bundle_data(bundle_result["data"], bundle)
+                # History is stored at whole-second (epoch) resolution
+                timestamp = datetime.utcnow().replace(microsecond=0)
+                purchases = bundle_to_purchases(bundle_result["data"], to_epoch(timestamp), bundle)
                 
+                record_ids = insert_readings(db, parsed_data, timestamp)
+                committed = [
+                    dict(record_data, id=record_id, timestamp=timestamp)
+                    for record_data, record_id in zip(parsed_data, record_ids)
+                ]
+                upsert_purchases(db, purchases)
+                # Detect against the previous state before it is overwritten
+                detection = detect_anomalies(db, committed)
+                upsert_current_state(db, committed)
+                # Refuse to commit if our lease expired and another collector took over
+                fence(db, lease)
                 db.commit()
+                detection.apply()
+                # Committed is committed: a store that falls behind is rebuilt, not a failed cycle
+                append_committed(db, committed)
                 logger.info(f"Successfully stored {len(parsed_data)} data usage records")
+                record_heartbeat(success=True, records=len(parsed_data))
+                refresh_proxy_cache()
+                if detection.alerts:
+                    logger.info(f"Raised {len(detection.alerts)} usage alerts")
+                    dispatcher.submit(detection.alerts)
                 
                 # Log out to be nice to the API
                 logout_result = self.api.logout()
@@ -82,21 +127,39 @@ class DataCollector:
                 return True
             else:
                 logger.error(f"Failed to collect data: {bundle_result.get('error')}")
+                record_heartbeat(success=False, error=bundle_result.get("error"))
                 return False
                 
         except Exception as e:
             logger.error(f"Data collection error: {str(e)}")
             db.rollback()
+            record_heartbeat(success=False, error=str(e))
             return False
         finally:
             db.close()
 
-async def run_data_collection():
-    """Run data collection asynchronously"""
-    collector = DataCollector()
-    return collector.collect_data()
+# In-flight collections in this process, by account, so concurrent callers join them
+_in_flight: Dict[str, asyncio.Future] = {}
+
+async def run_data_collection(collector: Optional[DataCollector] = None):
+    """
+    Run data collection in a worker thread. Callers in the same process share
+    one in-flight collection; LeaseHeld propagates if another process has it.
+    """
+    collector = collector or DataCollector()
+    future = _in_flight.get(collector.account)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(None, collector.collect_data)
+        _in_flight[collector.account] = future
+        future.add_done_callback(lambda _: _in_flight.pop(collector.account, None))
+    return await asyncio.shield(future)
 
 if __name__ == "__main__":
     # Run data collection once
     collector = DataCollector()
-    collector.collect_data()
+    try:
+        collector.collect_data()
+    except LeaseHeld as e:
+        logger.warning(str(e))
+    # Give queued alerts a chance to go out before the process exits
+    dispatcher.flush()
@@ -1,15 +1,64 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, BigInteger
+from sqlalchemy import (
+    event, create_engine, insert, Column, Integer, SmallInteger, String, Float, DateTime, Boolean, Text,
+    BigInteger, ForeignKey, UniqueConstraint
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.sql import func
 from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+import calendar
+import logging
 import os
+import time
 
-# Use SQLite for easier setup - can be changed to PostgreSQL later
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# SQLite by default; PostgreSQL URLs get a sized pool and monthly partitions
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./taara_monitoring.db")
+IS_POSTGRES = SQLALCHEMY_DATABASE_URL.startswith(("postgresql", "postgres://"))
+
+def postgres_pool_settings() -> dict:
+    """
+    Split the server's connection budget evenly across every process that opens an engine
+
+    Config.MAX_CONNECTIONS (PostgreSQL's max_connections) minus the
+    Config.DB_RESERVED_CONNECTIONS held back for superuser and psql sessions is
+    shared by the gunicorn workers and Config.DB_OTHER_PROCESSES (scheduler,
+    backup, one-off CLI tools), each of which builds this same pool.
+    """
+    processes = max(1, Config.WORKERS) + max(0, Config.DB_OTHER_PROCESSES)
+    per_process = (Config.MAX_CONNECTIONS - Config.DB_RESERVED_CONNECTIONS) // processes
+    if per_process < 2:
+        logger.warning(f"MAX_CONNECTIONS={Config.MAX_CONNECTIONS} leaves under 2 connections for each of "
+                       f"{processes} processes; using 2, raise max_connections or lower WEB_CONCURRENCY")
+        per_process = 2
+    pool_size = max(1, per_process // 2)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": per_process - pool_size,
+        "pool_timeout": Config.CONNECTION_TIMEOUT,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    }
 
 if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
     engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+    
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers (dashboard, online backups) run alongside the collector's writes
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+elif IS_POSTGRES:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **postgres_pool_settings())
 else:
     engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
@@ -17,37 +66,181 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-class DataUsageRecord(Base):
-    __tablename__ = "data_usage_records"
+def partitioned_by_time(column: str = "timestamp") -> dict:
+    """
+    Table args for monthly range partitioning on PostgreSQL
+
+    Postgres requires the partition key in the primary key, so the partition
+    column is marked primary_key=IS_POSTGRES and the table key becomes
+    (id, <column>) there, while the ORM keeps identifying rows by id.
+    Other databases get a plain table.
+    """
+    if not IS_POSTGRES:
+        return {}
+    return {"postgresql_partition_by": f"RANGE ({column})"}
+
+def to_epoch(dt: datetime) -> int:
+    """Naive datetimes are UTC, matching what the collector stores"""
+    return calendar.timegm(dt.utctimetuple())
+
+def from_epoch(epoch: int) -> datetime:
+    return datetime.utcfromtimestamp(int(epoch))
+
+def epoch_now() -> int:
+    return int(time.time())
+
+GB = 1024 ** 3
+
+class Subscriber(Base):
+    """Subscriber id strings, stored once and referenced by a small integer key"""
+    __tablename__ = "subscribers"
     
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=func.now(), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subscriber_id = Column(String, nullable=False, unique=True)
+
+class Plan(Base):
+    """Plan dimension: one row per (subscriber, plan id)"""
+    __tablename__ = "plans"
+    __table_args__ = (UniqueConstraint("subscriber_key", "plan_id"),)
     
-    # Bundle Information
-    subscriber_id = Column(String, nullable=False)
-    plan_name = Column(String, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subscriber_key = Column(Integer, ForeignKey("subscribers.id"), nullable=False)
     plan_id = Column(String, nullable=False)
+    plan_name = Column(String, nullable=False)
+    
+    subscriber = relationship(Subscriber, lazy="joined")
+
+class RawResponse(Base):
+    """Raw bundle response of one collection, shared by all of its readings"""
+    __tablename__ = "raw_responses"
+    __table_args__ = partitioned_by_time()
+    __mapper_args__ = {"primary_key": ["id"]}
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(BigInteger, nullable=False, primary_key=IS_POSTGRES)  # epoch seconds, UTC
+    raw_response = Column(Text, nullable=False)
+
+class DataUsageRecord(Base):
+    """
+    One plan balance reading. Timestamps are epoch seconds, balances are
+    bytes only (GB is derived on read), and subscriber/plan strings live in
+    the plans and subscribers dimension tables.
+    """
+    __tablename__ = "data_usage_records"
+    __table_args__ = partitioned_by_time()
+    __mapper_args__ = {"primary_key": ["id"]}
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(BigInteger, nullable=False, index=True, primary_key=IS_POSTGRES)  # epoch seconds, UTC
+    plan_key = Column(Integer, ForeignKey("plans.id"), nullable=False)
     
     # Usage Data
-    remaining_balance_gb = Column(Float, nullable=False)
     remaining_balance_bytes = Column(BigInteger, nullable=False)
     total_data_usage_bytes = Column(BigInteger, nullable=False)
-    expires_in_days = Column(Integer, nullable=False)
+    expires_in_days = Column(SmallInteger, nullable=False)
     
     # Status
     is_active = Column(Boolean, nullable=False)
     is_home_plan = Column(Boolean, default=False)
     
-    # Raw response for debugging
-    raw_response = Column(Text, nullable=True)
+    # raw_responses.id of the collection (no FK: both tables are partitioned on PostgreSQL)
+    response_id = Column(Integer, nullable=True)
+    
+    created_at = Column(BigInteger, default=epoch_now)
+    
+    plan = relationship(Plan, lazy="joined")
+    
+    @property
+    def recorded_at(self) -> datetime:
+        return from_epoch(self.timestamp)
+    
+    @property
+    def subscriber_id(self) -> str:
+        return self.plan.subscriber.subscriber_id
     
-    created_at = Column(DateTime, default=func.now())
+    @property
+    def plan_id(self) -> str:
+        return self.plan.plan_id
+    
+    @property
+    def plan_name(self) -> str:
+        return self.plan.plan_name
+    
+    @property
+    def remaining_balance_gb(self) -> float:
+        return self.remaining_balance_bytes / GB
+
+class PlanPurchase(Base):
+    """One purchased plan period from the bundle's purchasedHistory"""
+    __tablename__ = "plan_purchases"
+    __table_args__ = (UniqueConstraint("subscriber_key", "purchase_id"),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subscriber_key = Column(Integer, ForeignKey("subscribers.id"), nullable=False)
+    purchase_id = Column(String, nullable=False)
+    purchased_at = Column(BigInteger, nullable=True, index=True)  # epoch seconds of the purchase date
+    plan_name = Column(String, nullable=False)
+    hotspot_name = Column(String, nullable=True)
+    price_units = Column(Integer, nullable=True)
+    currency_code = Column(String, nullable=True)
+    is_reward_plan = Column(Boolean, default=False)
+    history_type = Column(String, nullable=True)
+    total_data_usage_bytes = Column(BigInteger, nullable=False)
+    # Timestamp of the payload the usage figure came from; newer observations win
+    observed_at = Column(BigInteger, nullable=False)
+    
+    subscriber = relationship(Subscriber, lazy="joined")
+
+PURCHASE_FIELDS = (
+    "purchased_at", "plan_name", "hotspot_name", "price_units", "currency_code", "is_reward_plan",
+    "history_type", "total_data_usage_bytes", "observed_at",
+)
+
+class CurrentState(Base):
+    """
+    Latest reading per (subscriber, plan), upserted alongside each history
+    insert. Same compact layout as data_usage_records: epoch seconds and bytes.
+    """
+    __tablename__ = "current_state"
+    
+    subscriber_id = Column(String, primary_key=True)
+    plan_id = Column(String, primary_key=True)
+    record_id = Column(Integer, nullable=False)
+    timestamp = Column(BigInteger, nullable=False)  # epoch seconds, UTC
+    
+    plan_name = Column(String, nullable=False)
+    remaining_balance_bytes = Column(BigInteger, nullable=False)
+    total_data_usage_bytes = Column(BigInteger, nullable=False)
+    expires_in_days = Column(SmallInteger, nullable=False)
+    is_active = Column(Boolean, nullable=False)
+    is_home_plan = Column(Boolean, default=False)
+    
+    @property
+    def recorded_at(self) -> datetime:
+        return from_epoch(self.timestamp)
+    
+    @property
+    def remaining_balance_gb(self) -> float:
+        return self.remaining_balance_bytes / GB
+
+CURRENT_STATE_FIELDS = (
+    "plan_name", "remaining_balance_bytes", "total_data_usage_bytes", "expires_in_days", "is_active",
+    "is_home_plan",
+)
+
+# Bumped by each current_state write in this process, so in-process caches of it
+# (app.storage) reload; other processes' writes reach them through the collector heartbeat
+current_state_writes = 0
 
 class ApiLog(Base):
     __tablename__ = "api_logs"
+    __table_args__ = partitioned_by_time()
+    __mapper_args__ = {"primary_key": ["id"]}
     
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=func.now(), nullable=False)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # Set in Python: a server-side now() follows the session time zone and could
+    # file a row under the wrong monthly partition
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True, primary_key=IS_POSTGRES)
     endpoint = Column(String, nullable=False)
     method = Column(String, nullable=False)
     status_code = Column(Integer, nullable=True)
@@ -55,6 +248,16 @@ class ApiLog(Base):
     error_message = Column(Text, nullable=True)
     success = Column(Boolean, nullable=False)
 
+class CollectionLease(Base):
+    """Per-account collection lock shared by every process that can collect"""
+    __tablename__ = "collection_leases"
+    
+    account = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    fencing_token = Column(BigInteger, nullable=False, default=0)
+    acquired_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -62,6 +265,205 @@ def get_db():
     finally:
         db.close()
 
+def get_subscriber_keys(db: Session, subscriber_ids) -> Dict[str, int]:
+    """Map subscriber ids to subscribers.id, creating missing rows in the caller's transaction"""
+    subscriber_ids = set(subscriber_ids)
+    keys = {
+        row.subscriber_id: row.id
+        for row in db.query(Subscriber).filter(Subscriber.subscriber_id.in_(subscriber_ids))
+    }
+    for subscriber_id in subscriber_ids - keys.keys():
+        subscriber = Subscriber(subscriber_id=subscriber_id)
+        db.add(subscriber)
+        db.flush()
+        keys[subscriber_id] = subscriber.id
+    return keys
+
+def get_plan_keys(db: Session, pairs: Sequence[Tuple[str, str, str]]) -> Dict[Tuple[str, str], int]:
+    """
+    Map (subscriber_id, plan_id) to plans.id for the given
+    (subscriber_id, plan_id, plan_name) triples, creating missing dimension
+    rows in the caller's transaction
+    """
+    wanted = {(subscriber_id, plan_id): plan_name for subscriber_id, plan_id, plan_name in pairs}
+    if not wanted:
+        return {}
+    
+    subscribers = get_subscriber_keys(db, {subscriber_id for subscriber_id, _ in wanted})
+    keys = {
+        (row.subscriber.subscriber_id, row.plan_id): row.id
+        for row in db.query(Plan).filter(Plan.subscriber_key.in_(subscribers.values()))
+    }
+    for (subscriber_id, plan_id), plan_name in wanted.items():
+        if (subscriber_id, plan_id) not in keys:
+            plan = Plan(subscriber_key=subscribers[subscriber_id], plan_id=plan_id, plan_name=plan_name)
+            db.add(plan)
+            db.flush()
+            keys[(subscriber_id, plan_id)] = plan.id
+    return keys
+
+def insert_readings(db: Session, records: Sequence[dict], timestamp: datetime) -> List[int]:
+    """
+    Insert parsed bundle records (app.bundle_parser field dicts) taken at
+    ``timestamp`` in the caller's transaction and return their ids in order.
+    Records sharing a raw_response string store it once.
+    """
+    if not records:
+        return []
+    
+    epoch = to_epoch(timestamp)
+    plan_keys = get_plan_keys(db, [(r["subscriber_id"], r["plan_id"], r["plan_name"]) for r in records])
+    
+    response_ids: Dict[str, int] = {}
+    for raw in {r["raw_response"] for r in records if r.get("raw_response")}:
+        response_ids[raw] = db.execute(
+            insert(RawResponse).values(timestamp=epoch, raw_response=raw).returning(RawResponse.id)
+        ).scalar_one()
+    
+    rows = [
+        {
+            "timestamp": epoch,
+            "plan_key": plan_keys[(r["subscriber_id"], r["plan_id"])],
+            "remaining_balance_bytes": r["remaining_balance_bytes"],
+            "total_data_usage_bytes": r["total_data_usage_bytes"],
+            "expires_in_days": r["expires_in_days"],
+            "is_active": r["is_active"],
+            "is_home_plan": r.get("is_home_plan", False),
+            "response_id": response_ids.get(r.get("raw_response")),
+            "created_at": epoch_now(),
+        }
+        for r in records
+    ]
+    result = db.execute(
+        insert(DataUsageRecord).returning(DataUsageRecord.id, sort_by_parameter_order=True), rows
+    )
+    return list(result.scalars())
+
+def upsert_purchases(db: Session, purchases: Sequence[dict]) -> int:
+    """
+    Insert or refresh plan purchases (app.bundle_parser.bundle_to_purchases
+    dicts) in the caller's transaction with one executemany. Re-running is
+    safe: a row only changes when the incoming observation is at least as new.
+    """
+    if not purchases:
+        return 0
+    
+    subscriber_keys = get_subscriber_keys(db, {p["subscriber_id"] for p in purchases})
+    rows = [
+        dict(
+            {field: p[field] for field in PURCHASE_FIELDS},
+            subscriber_key=subscriber_keys[p["subscriber_id"]],
+            purchase_id=p["purchase_id"],
+        )
+        for p in purchases
+    ]
+    
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        stmt = insert(PlanPurchase)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["subscriber_key", "purchase_id"],
+            set_={name: stmt.excluded[name] for name in PURCHASE_FIELDS},
+            where=stmt.excluded.observed_at >= PlanPurchase.observed_at
+        )
+        db.execute(stmt, rows)
+    else:
+        for row in rows:
+            existing = db.query(PlanPurchase).filter_by(
+                subscriber_key=row["subscriber_key"], purchase_id=row["purchase_id"]
+            ).first()
+            if existing is None:
+                db.add(PlanPurchase(**row))
+            elif row["observed_at"] >= existing.observed_at:
+                for field in PURCHASE_FIELDS:
+                    setattr(existing, field, row[field])
+    return len(rows)
+
+def upsert_current_state(db: Session, records: list):
+    """
+    Replace the current state of each subscriber in ``records`` within the
+    caller's transaction. ``records`` are committed-reading dicts carrying the
+    history row ``id``; plans missing from them are no longer current and are
+    removed.
+    """
+    global current_state_writes
+    if not records:
+        return
+    current_state_writes += 1
+    
+    rows = [
+        dict(
+            {field: record[field] for field in CURRENT_STATE_FIELDS},
+            subscriber_id=record["subscriber_id"],
+            plan_id=record["plan_id"],
+            record_id=record["id"],
+            timestamp=to_epoch(record["timestamp"]),
+        )
+        for record in records
+    ]
+    
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+        stmt = insert(CurrentState).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["subscriber_id", "plan_id"],
+            set_={name: stmt.excluded[name] for name in rows[0] if name not in ("subscriber_id", "plan_id")}
+        )
+        db.execute(stmt)
+    else:
+        for row in rows:
+            db.merge(CurrentState(**row))
+    
+    for subscriber_id in {row["subscriber_id"] for row in rows}:
+        current_plans = [row["plan_id"] for row in rows if row["subscriber_id"] == subscriber_id]
+        db.query(CurrentState).filter(
+            CurrentState.subscriber_id == subscriber_id,
+            CurrentState.plan_id.notin_(current_plans)
+        ).delete(synchronize_session=False)
+
+def rebuild_current_state(db: Session):
+    """
+    Populate current_state from the newest history row of each plan,
+    leaving out plans missing from their subscriber's latest collection
+    """
+    global current_state_writes
+    current_state_writes += 1
+    newest = db.query(func.max(DataUsageRecord.id).label("id")).group_by(DataUsageRecord.plan_key).subquery()
+    rows = db.query(DataUsageRecord).join(newest, DataUsageRecord.id == newest.c.id).all()
+    latest_collection: Dict[str, int] = {}
+    for row in rows:
+        latest_collection[row.subscriber_id] = max(latest_collection.get(row.subscriber_id, 0), row.timestamp)
+    rows = [row for row in rows if row.timestamp == latest_collection[row.subscriber_id]]
+    
+    db.query(CurrentState).delete(synchronize_session=False)
+    for row in rows:
+        db.add(CurrentState(
+            subscriber_id=row.subscriber_id,
+            plan_id=row.plan_id,
+            record_id=row.id,
+            timestamp=row.timestamp,
+            **{field: getattr(row, field) for field in CURRENT_STATE_FIELDS}
+        ))
+    db.commit()
+
 # Create tables
 def create_tables():
+    # Databases from before the compact layout are converted in place first
+    from app.migrations import migrate_current_state, migrate_to_compact_schema
+    migrate_to_compact_schema(engine)
+    migrate_current_state(engine)
+    
     Base.metadata.create_all(bind=engine)
+    if IS_POSTGRES:
+        from app.partitions import ensure_partitions
+        ensure_partitions(engine)
+    
+    # Existing databases get their current state materialized once
+    db = SessionLocal()
+    try:
+        if db.query(CurrentState).first() is None and db.query(DataUsageRecord.id).first() is not None:
+            rebuild_current_state(db)
+    finally:
+        db.close()
@@ -0,0 +1,71 @@
+"""
+Chart downsampling for Taara Internet Monitor
+Largest-Triangle-Three-Buckets keeps the visual shape of a series while
+capping how many points are sent to (and drawn by) the browser
+"""
+
+from typing import List
+
+import numpy as np
+
+from app.storage import UsageSeries
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of at most ``max_points`` points of (x, y) chosen by LTTB.
+
+    The first and last points are always kept. Each bucket in between keeps
+    the point forming the largest triangle with the previously kept point and
+    the next bucket's average. Bucket averages and triangle areas are computed
+    with numpy; only the walk over buckets is a Python loop, so the cost is
+    O(len(x)) array work plus O(max_points) iterations.
+
+    ``max_points`` <= 0 (or >= len(x)) keeps everything.
+    """
+    n = len(x)
+    if max_points <= 0 or n <= max_points:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1][:max_points])
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # max_points - 2 buckets over the interior points, with the reference
+    # implementation's edges floor(i * every) + 1 (float products included,
+    # so buckets split identically); every bucket is non-empty
+    every = (n - 2) / (max_points - 2)
+    edges = np.floor(np.arange(max_points - 1) * every).astype(np.int64) + 1
+    counts = np.diff(edges)
+    # Per-bucket sums rather than one running total, which would lose
+    # precision on long series of byte counts
+    avg_x = np.add.reduceat(x[:edges[-1]], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:edges[-1]], edges[:-1]) / counts
+
+    # The third triangle vertex: next bucket's average; after the last bucket,
+    # the average of what remains (the last point, unless rounding in
+    # ``every`` left the final edge one short)
+    next_x = np.append(avg_x[1:], x[edges[-1]:].mean())
+    next_y = np.append(avg_y[1:], y[edges[-1]:].mean())
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(max_points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        ax, ay = x[anchor], y[anchor]
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        area = np.abs((ax - next_x[bucket]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[bucket] - ay))
+        anchor = lo + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+
+    return selected
+
+
+def downsample_series(usage_history: List[UsageSeries], max_points: int) -> List[UsageSeries]:
+    """LTTB-downsample each series' balance curve to at most ``max_points`` readings"""
+    return [
+        series.take(lttb_indices(series.epoch, series.balance_bytes, max_points))
+        for series in usage_history
+    ]
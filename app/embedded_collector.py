@@ -0,0 +1,137 @@
+"""
+Embedded collector for Taara Internet Monitor
+With COLLECTOR_MODE=embedded, collection runs as an asyncio task in the web
+app's lifespan instead of the separate scheduler process. One gunicorn
+worker is elected through an exclusive lock on COLLECTOR_LOCK_PATH; the
+others keep retrying so a replacement worker takes over when it exits.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+from typing import Optional
+
+import requests
+
+from app.alerts import dispatcher
+from app.changefeed import notify_new_readings
+from app.config import Config
+from app.data_collector import DataCollector, run_data_collection
+from app.leases import HOLDER_ID, LeaseHeld
+from app.storage import refresh_current_state
+
+logger = logging.getLogger(__name__)
+
+
+class CollectorElection:
+    """Exclusive, non-blocking flock; the OS releases it if the worker dies"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # For operators: who is collecting
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{HOLDER_ID}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class EmbeddedCollector:
+    """
+    Collects every ``interval_seconds`` on the app's event loop. The blocking
+    work runs through run_data_collection(), so it uses the app's engine and
+    joins a concurrent /api/collect in this worker; the Taara client and its
+    HTTP session are kept across cycles. After each collection the worker's
+    cached current state is reloaded, so its requests read it from memory.
+    """
+
+    def __init__(self, interval_seconds: int, lock_path: str, election_retry_seconds: int):
+        self.interval = interval_seconds
+        self.election = CollectorElection(lock_path)
+        self.election_retry = election_retry_seconds
+        self.session = requests.Session()
+        self.collector = DataCollector(session=self.session)
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="embedded-collector")
+
+    async def stop(self, timeout: float = Config.TIMEOUT_SECONDS):
+        """Let a running collection finish (up to ``timeout``), then shut down"""
+        self._stop.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Embedded collection still running at shutdown; its lease will expire")
+        self.election.release()
+        self.session.close()
+        # Deliver alerts raised by the last cycles before the worker exits
+        await asyncio.get_running_loop().run_in_executor(None, dispatcher.flush, 5.0)
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Sleep, returning True early if the collector is stopping"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _run(self):
+        while not self.election.try_acquire():
+            if await self._sleep(self.election_retry):
+                return
+        logger.info(f"Embedded collector elected in {HOLDER_ID}, collecting every {self.interval}s")
+
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while not self._stop.is_set():
+            await self._collect()
+            # Fixed-rate schedule; a slow or skipped cycle doesn't shift the next ones
+            next_run += self.interval
+            while next_run <= loop.time():
+                next_run += self.interval
+            if await self._sleep(next_run - loop.time()):
+                return
+
+    async def _collect(self):
+        try:
+            if await run_data_collection(self.collector):
+                # Publish the new state to this worker before waking its long-polls
+                await asyncio.get_running_loop().run_in_executor(None, refresh_current_state)
+                notify_new_readings()
+            else:
+                logger.error("Embedded data collection failed")
+        except LeaseHeld as e:
+            logger.info(f"Skipping embedded data collection: {e}")
+        except Exception as e:
+            logger.error(f"Error in embedded data collection: {str(e)}")
+
+
+def create_embedded_collector() -> Optional[EmbeddedCollector]:
+    """The embedded collector if COLLECTOR_MODE is "embedded", else None"""
+    if Config.COLLECTOR_MODE != "embedded":
+        return None
+    return EmbeddedCollector(
+        interval_seconds=Config.SCRAPING_INTERVAL_MINUTES * 60,
+        lock_path=Config.COLLECTOR_LOCK_PATH,
+        election_retry_seconds=Config.COLLECTOR_ELECTION_RETRY_SECONDS,
+    )
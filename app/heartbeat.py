@@ -0,0 +1,109 @@
+"""
+Collector heartbeat for Taara Internet Monitor
+Each collection cycle records its outcome in memory and in a small JSON file
+on the shared data volume, so readiness probes in any process can report
+how fresh the data is without touching the database
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Latest heartbeat written by this process
+_local: Optional[dict] = None
+# Last heartbeat read from the file, keyed by its mtime so probes only stat() it
+_file_cache: tuple = (None, None)
+
+
+def record_heartbeat(success: bool, records: int = 0, error: Optional[str] = None) -> dict:
+    """Record the outcome of a collection cycle"""
+    global _local
+    with _lock:
+        previous = _latest() or {}
+        now = time.time()
+        heartbeat = {
+            "pid": os.getpid(),
+            "last_attempt": now,
+            "last_success": now if success else previous.get("last_success"),
+            "records": records if success else previous.get("records", 0),
+            "consecutive_failures": 0 if success else previous.get("consecutive_failures", 0) + 1,
+            "last_error": None if success else error,
+        }
+        _local = heartbeat
+
+    path = Path(Config.HEARTBEAT_PATH)
+    try:
+        # Write-then-rename so readers never see a half-written file
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text(json.dumps(heartbeat))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write collector heartbeat to {path}: {e}")
+    return heartbeat
+
+
+def read_heartbeat() -> Optional[dict]:
+    """Newest heartbeat from this process or the file, None if there has been none"""
+    with _lock:
+        return _latest()
+
+
+def _latest() -> Optional[dict]:
+    global _file_cache
+    from_file = None
+    try:
+        mtime = os.stat(Config.HEARTBEAT_PATH).st_mtime_ns
+        if mtime == _file_cache[0]:
+            from_file = _file_cache[1]
+        else:
+            with open(Config.HEARTBEAT_PATH) as f:
+                from_file = json.load(f)
+            _file_cache = (mtime, from_file)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read collector heartbeat: {e}")
+
+    candidates = [heartbeat for heartbeat in (_local, from_file) if heartbeat]
+    return max(candidates, key=lambda heartbeat: heartbeat["last_attempt"]) if candidates else None
+
+
+def readiness(max_age_seconds: Optional[int] = None) -> dict:
+    """
+    Summarise the heartbeat for a readiness probe. ``ready`` is False until a
+    collection has succeeded and again once the last success is older than
+    ``max_age_seconds``.
+    """
+    max_age = max_age_seconds or Config.HEARTBEAT_MAX_AGE_SECONDS
+    heartbeat = read_heartbeat()
+    if not heartbeat or not heartbeat.get("last_success"):
+        return {
+            "ready": False,
+            "status": "no_data",
+            "max_age_seconds": max_age,
+            "consecutive_failures": heartbeat["consecutive_failures"] if heartbeat else 0,
+            "last_error": heartbeat["last_error"] if heartbeat else None,
+        }
+
+    now = time.time()
+    age = now - heartbeat["last_success"]
+    return {
+        "ready": age <= max_age,
+        "status": "ok" if age <= max_age else "stale",
+        "data_age_seconds": round(age, 1),
+        "max_age_seconds": max_age,
+        "last_success": heartbeat["last_success"],
+        "last_attempt": heartbeat["last_attempt"],
+        "records": heartbeat["records"],
+        "consecutive_failures": heartbeat["consecutive_failures"],
+        "last_error": heartbeat["last_error"],
+    }
@@ -0,0 +1,129 @@
+"""
+Per-account collection leases for Taara Internet Monitor
+A row in collection_leases acts as a lock shared by the scheduler, every
+gunicorn worker and one-off CLI runs. Leases expire on their own so a
+crashed holder can't wedge collection, and each acquisition bumps a
+fencing token that writers re-check inside their transaction.
+"""
+
+import logging
+import os
+import socket
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import Config
+from app.database import CollectionLease, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseHeld(Exception):
+    """Another holder has an unexpired lease on the account"""
+
+    def __init__(self, account: str, holder: str, expires_at: datetime):
+        super().__init__(f"Collection for {account} is already running on {holder} (lease expires {expires_at.isoformat()})")
+        self.account = account
+        self.holder = holder
+        self.expires_at = expires_at
+
+
+class LeaseLost(Exception):
+    """The lease expired and was taken over before the holder could write"""
+
+
+@dataclass
+class Lease:
+    account: str
+    holder: str
+    token: int
+    expires_at: datetime
+
+
+def acquire_lease(account: str, ttl_seconds: Optional[int] = None, holder: str = HOLDER_ID) -> Lease:
+    """Take the account's lease if it is free or expired, otherwise raise LeaseHeld"""
+    ttl = timedelta(seconds=ttl_seconds or Config.COLLECTION_LEASE_SECONDS)
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        expires_at = now + ttl
+        result = db.execute(
+            update(CollectionLease)
+            .where(CollectionLease.account == account, CollectionLease.expires_at <= now)
+            .values(holder=holder, fencing_token=CollectionLease.fencing_token + 1,
+                    acquired_at=now, expires_at=expires_at)
+        )
+
+        if result.rowcount == 1:
+            # Still inside the write transaction, so nobody can have bumped it since
+            token = db.query(CollectionLease.fencing_token).filter(CollectionLease.account == account).scalar()
+            db.commit()
+            return Lease(account, holder, token, expires_at)
+
+        current = db.get(CollectionLease, account)
+        if current is None:
+            db.add(CollectionLease(account=account, holder=holder, fencing_token=1,
+                                   acquired_at=now, expires_at=expires_at))
+            try:
+                db.commit()
+                return Lease(account, holder, 1, expires_at)
+            except IntegrityError:
+                # Lost the race to create the row
+                db.rollback()
+                current = db.get(CollectionLease, account)
+
+        raise LeaseHeld(account, current.holder, current.expires_at)
+    finally:
+        db.close()
+
+
+def fence(db: Session, lease: Lease, ttl_seconds: Optional[int] = None):
+    """
+    Check, inside the caller's write transaction, that ``lease`` is still the
+    newest one for its account and extend it. Raises LeaseLost otherwise, in
+    which case the caller must roll back.
+    """
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds or Config.COLLECTION_LEASE_SECONDS)
+    result = db.execute(
+        update(CollectionLease)
+        .where(CollectionLease.account == lease.account, CollectionLease.fencing_token == lease.token)
+        .values(expires_at=expires_at)
+    )
+    if result.rowcount != 1:
+        raise LeaseLost(f"Lease {lease.token} on {lease.account} was taken over")
+    lease.expires_at = expires_at
+
+
+def release_lease(lease: Lease):
+    """Expire the lease now, unless someone else already holds a newer one"""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(CollectionLease)
+            .where(CollectionLease.account == lease.account, CollectionLease.fencing_token == lease.token)
+            .values(expires_at=datetime.utcnow())
+        )
+        db.commit()
+    except Exception as e:
+        logger.warning(f"Failed to release lease on {lease.account}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+@contextmanager
+def collection_lease(account: str):
+    lease = acquire_lease(account)
+    logger.info(f"Acquired collection lease {lease.token} on {account}")
+    try:
+        yield lease
+    finally:
+        release_lease(lease)
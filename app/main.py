@@ -1,20 +1,57 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import desc
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import json
+import numpy as np
 import plotly.graph_objs as go
+import plotly.io as pio
 import plotly.utils
 
-from app.database import get_db, DataUsageRecord, ApiLog, create_tables
+from app.config import Config
+from app.database import get_db, PlanPurchase, create_tables, engine, from_epoch
+from app.admission import install_admission_control
+from app.profiling import TimedJSONResponse, install_profiling, timed
+from app.storage import UsageStore, get_usage_store, readings_in_order
+from app.downsample import downsample_series, lttb_indices
 from app.data_collector import run_data_collection
+from app.changefeed import notify_new_readings, wait_for_changes
+from app.embedded_collector import create_embedded_collector
+from app.heartbeat import readiness
+from app.leases import LeaseHeld
 from app.timezone_utils import utc_to_local, format_local_time, get_timezone_info
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the embedded collector (COLLECTOR_MODE=embedded) for the app's lifetime"""
+    collector = create_embedded_collector()
+    if collector:
+        collector.start()
+    yield
+    if collector:
+        await collector.stop()
+
 # Create FastAPI app
-app = FastAPI(title="Taara Internet Monitor", version="1.0.0")
+app = FastAPI(title="Taara Internet Monitor", version="1.0.0", default_response_class=TimedJSONResponse,
+              lifespan=lifespan)
+
+# Server-Timing, ?profile=1 and slow-query logging
+if Config.ENABLE_DEBUG_ROUTES:
+    install_profiling(app, engine)
+
+# Load shedding; added last so it runs before any other middleware
+if Config.LOAD_SHEDDING_ENABLED:
+    admission = install_admission_control(app)
+    
+    if Config.ENABLE_DEBUG_ROUTES:
+        @app.get("/debug/admission")
+        def admission_state():
+            """Current concurrency limits, in-flight counts and shed totals of this worker"""
+            return admission.snapshot()
 
 # Create database tables
 create_tables()
@@ -30,20 +67,24 @@ def local_time_filter(dt):
 
 templates.env.filters['local_time'] = local_time_filter
 
+def round_gb(value: float) -> float:
+    """GB for API responses: derived from bytes, so 885.1 GB reads back as 885.0999999996275"""
+    return round(value, 3)
+
+def get_store(db: Session = Depends(get_db)) -> UsageStore:
+    """Usage storage backend selected by Config.STORAGE_BACKEND"""
+    return get_usage_store(db)
+
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+def dashboard(request: Request, max_points: int = Query(Config.CHART_MAX_POINTS, ge=0),
+              store: UsageStore = Depends(get_store)):
     """Main dashboard"""
     
     # Get latest data for each plan
-    latest_records = db.query(DataUsageRecord).filter(
-        DataUsageRecord.is_active == True
-    ).order_by(desc(DataUsageRecord.timestamp)).limit(10).all()
+    latest_records = store.current_state()
     
     # Get usage over time for charts
-    usage_history = db.query(DataUsageRecord).filter(
-        DataUsageRecord.is_active == True,
-        DataUsageRecord.timestamp >= datetime.now() - timedelta(days=30)
-    ).order_by(DataUsageRecord.timestamp).all()
+    usage_history = store.series_since(datetime.now() - timedelta(days=30))
     
     # Calculate statistics
     stats = {
@@ -66,21 +107,33 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
                 stats["usage_rate_gb_per_day"] = used_gb / days_elapsed
     
     # Create charts
-    charts = create_charts(usage_history)
+    with timed("serialize"):
+        charts = create_charts(usage_history, max_points)
     
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "latest_records": latest_records,
-        "stats": stats,
-        "charts": charts
-    })
+    with timed("render"):
+        return templates.TemplateResponse("dashboard.html", {
+            "request": request,
+            "latest_records": latest_records,
+            "stats": stats,
+            "charts": charts
+        })
+
+@app.get("/health")
+async def liveness():
+    """Liveness probe: the process is serving requests (no database access)"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness_probe():
+    """Readiness probe: 503 until the collector's heartbeat shows fresh data (no database access)"""
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503,
+                        headers={"Cache-Control": "no-store"})
 
 @app.get("/api/data")
-async def get_latest_data(db: Session = Depends(get_db)):
+def get_latest_data(store: UsageStore = Depends(get_store)):
     """API endpoint to get latest data"""
-    records = db.query(DataUsageRecord).filter(
-        DataUsageRecord.is_active == True
-    ).order_by(desc(DataUsageRecord.timestamp)).limit(5).all()
+    records = store.current_state()
     
     return [
         {
@@ -88,7 +141,7 @@ async def get_latest_data(db: Session = Depends(get_db)):
             "timestamp": record.timestamp.isoformat(),
             "timestamp_local": format_local_time(record.timestamp),
             "plan_name": record.plan_name,
-            "remaining_balance_gb": record.remaining_balance_gb,
+            "remaining_balance_gb": round_gb(record.remaining_balance_gb),
             "expires_in_days": record.expires_in_days,
             "is_active": record.is_active
         }
@@ -96,69 +149,114 @@ async def get_latest_data(db: Session = Depends(get_db)):
     ]
 
 @app.get("/api/history")
-async def get_usage_history(days: int = 7, db: Session = Depends(get_db)):
-    """Get usage history for specified number of days"""
+def get_usage_history(days: int = 7, max_points: int = Query(0, ge=0),
+                      store: UsageStore = Depends(get_store)):
+    """Get usage history for specified number of days; max_points > 0 caps readings per plan"""
     cutoff_date = datetime.now() - timedelta(days=days)
     
-    records = db.query(DataUsageRecord).filter(
-        DataUsageRecord.timestamp >= cutoff_date,
-        DataUsageRecord.is_active == True
-    ).order_by(DataUsageRecord.timestamp).all()
+    records = readings_in_order(downsample_series(store.series_since(cutoff_date), max_points))
     
     return [
         {
             "timestamp": record.timestamp.isoformat(),
-            "remaining_balance_gb": record.remaining_balance_gb,
+            "remaining_balance_gb": round_gb(record.remaining_balance_gb),
             "plan_name": record.plan_name
         }
         for record in records
     ]
 
+@app.get("/api/changes")
+async def get_changes(after: int = Query(0, ge=0),
+                      limit: int = Query(Config.CHANGE_FEED_BATCH_SIZE, ge=1, le=5000),
+                      wait: float = Query(0, ge=0, le=Config.CHANGE_FEED_MAX_WAIT_SECONDS)):
+    """
+    Readings stored after offset `after`, oldest first. Pass the returned
+    next_offset back as `after`; with `wait` the request long-polls (up to
+    that many seconds) until new readings arrive.
+    """
+    records, has_more = await wait_for_changes(after, limit, wait)
+    
+    return JSONResponse({
+        "records": [
+            {
+                "offset": record.id,
+                "timestamp": record.recorded_at.isoformat(),
+                "subscriber_id": record.subscriber_id,
+                "plan_id": record.plan_id,
+                "plan_name": record.plan_name,
+                "remaining_balance_bytes": record.remaining_balance_bytes,
+                "remaining_balance_gb": round_gb(record.remaining_balance_gb),
+                "total_data_usage_bytes": record.total_data_usage_bytes,
+                "expires_in_days": record.expires_in_days,
+                "is_active": record.is_active,
+                "is_home_plan": record.is_home_plan
+            }
+            for record in records
+        ],
+        "next_offset": records[-1].id if records else after,
+        "has_more": has_more
+    }, headers={"Cache-Control": "no-store"})
+
 @app.post("/api/collect")
 async def trigger_collection():
     """Manually trigger data collection"""
     try:
         success = await run_data_collection()
         if success:
+            notify_new_readings()
             return {"status": "success", "message": "Data collection completed"}
         else:
             return {"status": "error", "message": "Data collection failed"}
+    except LeaseHeld as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/purchases")
+def get_purchases(limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    """Purchased plan periods (from purchasedHistory), newest first"""
+    purchases = db.query(PlanPurchase).order_by(
+        desc(PlanPurchase.purchased_at), desc(PlanPurchase.id)
+    ).limit(limit).all()
+    
+    return [
+        {
+            "purchase_id": purchase.purchase_id,
+            "purchased_at": from_epoch(purchase.purchased_at).date().isoformat() if purchase.purchased_at else None,
+            "plan_name": purchase.plan_name,
+            "hotspot_name": purchase.hotspot_name,
+            "price": purchase.price_units,
+            "currency": purchase.currency_code,
+            "total_data_usage_gb": purchase.total_data_usage_bytes / (1024**3),
+        }
+        for purchase in purchases
+    ]
+
 @app.get("/api/timezone")
 async def get_timezone_info_endpoint():
     """Get timezone information"""
     return get_timezone_info()
 
 @app.get("/api/stats")
-async def get_statistics(db: Session = Depends(get_db)):
+def get_statistics(store: UsageStore = Depends(get_store)):
     """Get usage statistics"""
     
     # Latest record
-    latest = db.query(DataUsageRecord).filter(
-        DataUsageRecord.is_active == True
-    ).order_by(desc(DataUsageRecord.timestamp)).first()
+    latest_records = store.current_state()
     
-    if not latest:
+    if not latest_records:
         return {"error": "No data available"}
+    latest = latest_records[0]
     
     # Usage over last 7 days
     week_ago = datetime.now() - timedelta(days=7)
-    week_records = db.query(DataUsageRecord).filter(
-        DataUsageRecord.timestamp >= week_ago,
-        DataUsageRecord.is_active == True
-    ).order_by(DataUsageRecord.timestamp).all()
+    week_series = store.series_since(week_ago)
     
-    # Calculate daily usage
+    # Calculate daily usage (balance drops between consecutive readings of a plan)
     daily_usage = []
-    if len(week_records) > 1:
-        for i in range(1, len(week_records)):
-            prev_balance = week_records[i-1].remaining_balance_gb
-            curr_balance = week_records[i].remaining_balance_gb
-            usage = prev_balance - curr_balance
-            if usage > 0:  # Only count positive usage
-                daily_usage.append(usage)
+    for series in week_series:
+        usage = -np.diff(series.balance_gb)
+        daily_usage.extend(usage[usage > 0].tolist())  # Only count positive usage
     
     avg_daily_usage = sum(daily_usage) / len(daily_usage) if daily_usage else 0
     
@@ -169,33 +267,37 @@ async def get_statistics(db: Session = Depends(get_db)):
         days_remaining = min(days_remaining, predicted_days)
     
     return {
-        "current_balance_gb": latest.remaining_balance_gb,
+        "current_balance_gb": round_gb(latest.remaining_balance_gb),
         "expires_in_days": latest.expires_in_days,
-        "avg_daily_usage_gb": avg_daily_usage,
+        "avg_daily_usage_gb": round_gb(avg_daily_usage),
         "predicted_days_remaining": days_remaining,
         "plan_name": latest.plan_name,
         "last_updated": latest.timestamp.isoformat()
     }
 
-def create_charts(usage_history):
-    """Create Plotly charts for the dashboard"""
+def create_charts(usage_history, max_points: int = 0):
+    """
+    Create Plotly charts for the dashboard from per-plan usage series, with
+    each trace LTTB-downsampled to at most max_points points (0 = all)
+    """
     if not usage_history:
         return {"balance_chart": "", "usage_chart": ""}
     
-    # Prepare data
-    timestamps = [record.timestamp for record in usage_history]
-    balances = [record.remaining_balance_gb for record in usage_history]
+    # One colour per plan from the template's colorway, the same in both charts
+    colorway = pio.templates['plotly_white'].layout.colorway
+    colors = {series.key: colorway[i % len(colorway)] for i, series in enumerate(usage_history)}
     
     # Balance over time chart
     balance_fig = go.Figure()
-    balance_fig.add_trace(go.Scatter(
-        x=timestamps,
-        y=balances,
-        mode='lines+markers',
-        name='Remaining Balance (GB)',
-        line=dict(color='#007bff', width=3),
-        marker=dict(size=6)
-    ))
+    for series in downsample_series(usage_history, max_points):
+        balance_fig.add_trace(go.Scatter(
+            x=series.timestamps,
+            y=series.balance_gb,
+            mode='lines+markers',
+            name=series.key.plan_name,
+            line=dict(color=colors[series.key], width=3),
+            marker=dict(size=6)
+        ))
     
     balance_fig.update_layout(
         title='Data Balance Over Time',
@@ -206,26 +308,19 @@ def create_charts(usage_history):
     )
     
     # Usage rate chart (calculated from balance changes)
-    usage_rates = []
-    usage_dates = []
-    
-    for i in range(1, len(usage_history)):
-        prev_balance = usage_history[i-1].remaining_balance_gb
-        curr_balance = usage_history[i].remaining_balance_gb
-        usage = prev_balance - curr_balance
-        
-        if usage >= 0:  # Only show positive usage
-            usage_rates.append(usage)
-            usage_dates.append(usage_history[i].timestamp)
-    
     usage_fig = go.Figure()
-    if usage_rates:
-        usage_fig.add_trace(go.Bar(
-            x=usage_dates,
-            y=usage_rates,
-            name='Data Usage (GB)',
-            marker_color='#28a745'
-        ))
+    for series in usage_history:
+        usage = -np.diff(series.balance_gb)
+        positive = usage >= 0  # Only show positive usage
+        if positive.any():
+            timestamps, usage = series.timestamps[1:][positive], usage[positive]
+            keep = lttb_indices(timestamps.astype(np.int64), usage, max_points)
+            usage_fig.add_trace(go.Bar(
+                x=timestamps[keep],
+                y=usage[keep],
+                name=series.key.plan_name,
+                marker_color=colors[series.key]
+            ))
     
     usage_fig.update_layout(
         title='Daily Data Usage',
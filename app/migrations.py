@@ -0,0 +1,203 @@
+"""
+Schema migrations for Taara Internet Monitor
+Converts data_usage_records from the original wide layout (DateTime
+timestamps, GB float next to bytes, subscriber/plan strings and the raw
+bundle JSON repeated in every row) to the compact layout in app.database,
+and drops current_state tables of the old layout to be rebuilt
+"""
+
+import logging
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import MetaData, Table, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import Base, DataUsageRecord, Plan, RawResponse, Subscriber, to_epoch
+
+logger = logging.getLogger(__name__)
+
+LEGACY_TABLE = "data_usage_records_legacy"
+
+
+def is_legacy_layout(bind) -> bool:
+    inspector = inspect(bind)
+    if "data_usage_records" not in inspector.get_table_names():
+        return False
+    return "plan_name" in {column["name"] for column in inspector.get_columns("data_usage_records")}
+
+
+def migrate_to_compact_schema(engine: Engine, batch_size: int = 10000) -> bool:
+    """
+    Rewrite a legacy data_usage_records table into the compact layout in one
+    transaction, keeping row ids. Does nothing (and returns False) if the
+    database is new or already migrated.
+    """
+    if not is_legacy_layout(engine):
+        return False
+
+    logger.info("Migrating data_usage_records to the compact layout...")
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            # pysqlite only opens transactions before DML; make the DDL part of this one
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        elif conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('taara_compact_migration'))"))
+
+        # Another process (worker, scheduler) may have migrated while we waited
+        if not is_legacy_layout(conn):
+            return False
+
+        _detach_legacy_table(conn)
+        Base.metadata.create_all(bind=conn)
+        if conn.dialect.name == "postgresql":
+            from app.partitions import ensure_partitions
+            first = conn.execute(text(f"SELECT MIN(timestamp) FROM {LEGACY_TABLE}")).scalar()
+            ensure_partitions(conn, start=date(first.year, first.month, 1) if first else None)
+
+        copied = _copy_rows(conn, batch_size)
+
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('data_usage_records', 'id'), "
+                "COALESCE((SELECT MAX(id) FROM data_usage_records), 0) + 1, false)"
+            ))
+        conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+
+    logger.info(f"Migrated {copied} readings in {time.perf_counter() - start:.1f}s")
+    return True
+
+
+def has_legacy_current_state(bind) -> bool:
+    inspector = inspect(bind)
+    if "current_state" not in inspector.get_table_names():
+        return False
+    return "remaining_balance_gb" in {column["name"] for column in inspector.get_columns("current_state")}
+
+
+def migrate_current_state(engine: Engine) -> bool:
+    """
+    Drop a current_state table from before it used the compact layout
+    (DateTime timestamp, GB float). It only holds derived rows, so
+    create_tables() recreates it and rebuilds them from data_usage_records.
+    Returns whether it was dropped.
+    """
+    if not has_legacy_current_state(engine):
+        return False
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('taara_current_state_migration'))"))
+        if not has_legacy_current_state(conn):
+            return False
+        conn.execute(text("DROP TABLE current_state"))
+
+    logger.info("Dropped the legacy current_state table; it is rebuilt from data_usage_records")
+    return True
+
+
+def _detach_legacy_table(conn: Connection):
+    """
+    Rename the legacy table out of the way, first dropping the index,
+    constraint and sequence names the new table is about to reuse
+    """
+    conn.execute(text("DROP INDEX IF EXISTS ix_data_usage_records_id"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_data_usage_records_timestamp"))
+
+    if conn.dialect.name == "postgresql":
+        from app.partitions import list_partitions, partition_name
+        months = list_partitions(conn, "data_usage_records")
+        conn.execute(text("ALTER TABLE data_usage_records DROP CONSTRAINT IF EXISTS data_usage_records_pkey"))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS data_usage_records_id_seq RENAME TO {LEGACY_TABLE}_id_seq"))
+        for month in months:
+            conn.execute(text(
+                f"ALTER TABLE {partition_name('data_usage_records', month)} "
+                f"RENAME TO {partition_name(LEGACY_TABLE, month)}"
+            ))
+
+    conn.execute(text(f"ALTER TABLE data_usage_records RENAME TO {LEGACY_TABLE}"))
+
+
+def _copy_rows(conn: Connection, batch_size: int) -> int:
+    legacy = Table(LEGACY_TABLE, MetaData(), autoload_with=conn)
+    subscriber_keys: Dict[str, int] = {}
+    plan_keys: Dict[Tuple[str, str], int] = {}
+    last_response: Tuple[Optional[int], Optional[str], Optional[int]] = (None, None, None)
+    copied = 0
+    last_id = 0
+
+    while True:
+        rows = conn.execute(
+            select(legacy).where(legacy.c.id > last_id).order_by(legacy.c.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            return copied
+
+        batch = []
+        for row in rows:
+            subscriber_key = subscriber_keys.get(row["subscriber_id"])
+            if subscriber_key is None:
+                subscriber_key = conn.execute(
+                    insert(Subscriber).values(subscriber_id=row["subscriber_id"]).returning(Subscriber.id)
+                ).scalar_one()
+                subscriber_keys[row["subscriber_id"]] = subscriber_key
+
+            plan = (row["subscriber_id"], row["plan_id"])
+            plan_key = plan_keys.get(plan)
+            if plan_key is None:
+                plan_key = conn.execute(
+                    insert(Plan).values(subscriber_key=subscriber_key, plan_id=row["plan_id"],
+                                        plan_name=row["plan_name"]).returning(Plan.id)
+                ).scalar_one()
+                plan_keys[plan] = plan_key
+
+            epoch = to_epoch(row["timestamp"])
+            response_id = None
+            if row["raw_response"]:
+                # Readings of one collection are adjacent and carry the same payload
+                if last_response[:2] == (epoch, row["raw_response"]):
+                    response_id = last_response[2]
+                else:
+                    response_id = conn.execute(
+                        insert(RawResponse).values(timestamp=epoch, raw_response=row["raw_response"])
+                        .returning(RawResponse.id)
+                    ).scalar_one()
+                    last_response = (epoch, row["raw_response"], response_id)
+
+            batch.append({
+                "id": row["id"],
+                "timestamp": epoch,
+                "plan_key": plan_key,
+                "remaining_balance_bytes": row["remaining_balance_bytes"],
+                "total_data_usage_bytes": row["total_data_usage_bytes"],
+                "expires_in_days": row["expires_in_days"],
+                "is_active": row["is_active"],
+                "is_home_plan": bool(row["is_home_plan"]),
+                "response_id": response_id,
+                "created_at": to_epoch(row["created_at"]) if row["created_at"] else epoch,
+            })
+
+        conn.execute(insert(DataUsageRecord.__table__), batch)
+        copied += len(batch)
+        last_id = rows[-1]["id"]
+        logger.info(f"Copied {copied} readings")
+
+
+if __name__ == "__main__":
+    import sys
+    from app.database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python -m app.migrations compact")
+        sys.exit(1)
+
+    migrated_state = migrate_current_state(engine)
+    if not migrate_to_compact_schema(engine):
+        print("Current state will be rebuilt on startup" if migrated_state else "Nothing to migrate")
+    elif engine.dialect.name == "sqlite":
+        # Return the legacy table's pages to the filesystem
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
@@ -0,0 +1,256 @@
+"""
+Monthly partition maintenance for PostgreSQL
+Creates data_usage_records / raw_responses / api_logs partitions ahead of
+time (converting tables created before partitioning) and expires old data by
+dropping whole partitions instead of deleting rows
+"""
+
+import calendar
+import logging
+import re
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Table -> type of its partition key: "epoch" (integer seconds) or "timestamp"
+PARTITION_KEYS = {
+    "data_usage_records": "epoch",
+    "raw_responses": "epoch",
+    "api_logs": "timestamp",
+}
+PARTITIONED_TABLES = tuple(PARTITION_KEYS)
+
+# Last month each table has been ensured through, per process
+_ensured_through: Dict[str, date] = {}
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_bound(table: str, month: date) -> str:
+    """SQL literal for the start of ``month`` in ``table``'s partition key"""
+    if PARTITION_KEYS[table] == "epoch":
+        return str(calendar.timegm(month.timetuple()))
+    return f"'{month.isoformat()}'"
+
+
+@contextmanager
+def _begin(bind: Union[Engine, Connection]):
+    """Use the caller's connection (and transaction) if given one"""
+    if isinstance(bind, Connection):
+        yield bind
+    else:
+        with bind.begin() as conn:
+            yield conn
+
+
+def is_partitioned(conn: Connection, table: str) -> Optional[bool]:
+    """Whether ``table`` is a partitioned table; None if it doesn't exist"""
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    ).scalar()
+    return None if relkind is None else relkind == "p"
+
+
+def _create_partitions(conn: Connection, table: str, first: date, last: date) -> List[str]:
+    names = []
+    month = first
+    while month <= last:
+        name = partition_name(table, month)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES "
+            f"FROM ({partition_bound(table, month)}) TO ({partition_bound(table, add_months(month, 1))})"
+        ))
+        names.append(name)
+        month = add_months(month, 1)
+    return names
+
+
+def partition_existing_table(conn: Connection, table: str, last: date) -> int:
+    """
+    Convert a plain ``table`` (created before partitioning was enabled) into
+    the partitioned layout in the caller's transaction: rename it aside,
+    create the partitioned table, partitions covering its rows through
+    ``last``, and copy the rows over keeping their ids.
+
+    Returns the number of rows copied.
+    """
+    from app.database import Base
+
+    conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"taara_partition_{table}"})
+    # Another process may have converted it while we waited
+    if is_partitioned(conn, table) is not False:
+        return 0
+
+    model = Base.metadata.tables[table]
+    old = f"{table}_unpartitioned"
+    logger.warning(f"{table} is not partitioned; converting it (writes to it wait until the copy commits)")
+
+    # Free the index, constraint and sequence names the new table reuses
+    for index in model.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_pkey"))
+    conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {old}_id_seq"))
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+    model.create(conn)
+
+    oldest = conn.execute(text(f"SELECT MIN({model.c.timestamp.name}) FROM {old}")).scalar()
+    if oldest is not None:
+        oldest = datetime.utcfromtimestamp(oldest) if PARTITION_KEYS[table] == "epoch" else oldest
+        _create_partitions(conn, table, month_start(oldest), last)
+
+    old_columns = set(conn.execute(text(f"SELECT * FROM {old} LIMIT 0")).keys())
+    columns = ", ".join(column.name for column in model.columns if column.name in old_columns)
+    copied = conn.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")).rowcount
+    conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+    ))
+    conn.execute(text(f"DROP TABLE {old}"))
+
+    logger.info(f"Partitioned {table} ({copied} rows copied)")
+    return copied
+
+
+def ensure_partitions(engine: Union[Engine, Connection], start: Optional[date] = None,
+                      months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Create monthly partitions from ``start`` (default: this month) through
+    ``months_ahead`` months from now. Existing partitions are left alone, and
+    tables that exist unpartitioned are converted first.
+    ``engine`` may also be a Connection, to create them in its transaction.
+
+    Returns the names of partitions that were checked.
+    """
+    if months_ahead is None:
+        months_ahead = Config.PARTITION_MONTHS_AHEAD
+    current = month_start(datetime.utcnow())
+    first = month_start(start) if start else current
+    last = add_months(current, months_ahead)
+
+    names = []
+    with _begin(engine) as conn:
+        # Concurrent CREATE ... PARTITION OF for the same name can fail on pg_type's
+        # unique index despite IF NOT EXISTS, so processes take turns
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('taara_ensure_partitions'))"))
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(conn, table) is False:
+                partition_existing_table(conn, table, last)
+            names.extend(_create_partitions(conn, table, first, last))
+            _ensured_through[table] = max(last, _ensured_through.get(table, last))
+
+    logger.info(f"Ensured {len(names)} partitions through {last:%Y-%m}")
+    return names
+
+
+def list_partitions(engine: Union[Engine, Connection], table: str) -> List[date]:
+    """Months that currently have a partition for ``table``, oldest first"""
+    pattern = re.compile(rf"^{table}_p(\d{{4}})(\d{{2}})$")
+    with _begin(engine) as conn:
+        rows = conn.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ), {"table": table}).scalars().all()
+
+    months = []
+    for name in rows:
+        match = pattern.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def drop_partitions_before(engine: Engine, cutoff: date) -> List[str]:
+    """
+    Drop every monthly partition that ends on or before ``cutoff``'s month.
+
+    Dropping a partition is a catalog operation, so it costs the same whatever
+    the number of rows it holds.
+    """
+    cutoff_month = month_start(cutoff)
+    dropped = []
+    for table in PARTITIONED_TABLES:
+        for month in list_partitions(engine, table):
+            if add_months(month, 1) <= cutoff_month:
+                name = partition_name(table, month)
+                with engine.begin() as conn:
+                    # Don't queue behind long readers and block every insert meanwhile
+                    conn.execute(text("SET LOCAL lock_timeout = '10s'"))
+                    conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                dropped.append(name)
+
+    if dropped:
+        logger.info(f"Dropped partitions: {', '.join(dropped)}")
+    return dropped
+
+
+def apply_retention(engine: Engine) -> List[str]:
+    """Drop partitions older than Config.PARTITION_RETENTION_MONTHS (0 keeps everything)"""
+    if Config.PARTITION_RETENTION_MONTHS <= 0:
+        return []
+    cutoff = add_months(month_start(datetime.utcnow()), -Config.PARTITION_RETENTION_MONTHS)
+    return drop_partitions_before(engine, cutoff)
+
+
+def maintain_partitions(engine: Engine):
+    """
+    Cheap per-cycle hook for the collector: on PostgreSQL, create upcoming
+    partitions and apply retention once per process per month.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    target = add_months(month_start(datetime.utcnow()), Config.PARTITION_MONTHS_AHEAD)
+    if all(_ensured_through.get(table) == target for table in PARTITIONED_TABLES):
+        return
+
+    ensure_partitions(engine)
+    apply_retention(engine)
+
+
+if __name__ == "__main__":
+    import sys
+    from app.database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    usage = ("Usage: python -m app.partitions ensure [YYYY-MM] | list | "
+             "drop-before YYYY-MM | apply-retention")
+
+    if engine.dialect.name != "postgresql":
+        print("Partitioning is only available with a PostgreSQL DATABASE_URL")
+        sys.exit(1)
+
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("", [])
+    if command == "ensure":
+        start = datetime.strptime(args[0], "%Y-%m").date() if args else None
+        ensure_partitions(engine, start=start)
+    elif command == "list":
+        for table in PARTITIONED_TABLES:
+            months = list_partitions(engine, table)
+            print(f"{table}: {', '.join(f'{m:%Y-%m}' for m in months) or 'none'}")
+    elif command == "drop-before" and args:
+        drop_partitions_before(engine, datetime.strptime(args[0], "%Y-%m").date())
+    elif command == "apply-retention":
+        apply_retention(engine)
+    else:
+        print(usage)
+        sys.exit(1)
@@ -0,0 +1,213 @@
+"""
+Request profiling and slow-query logging for Taara Internet Monitor
+Installed only when ENABLE_DEBUG_ROUTES is set: adds a Server-Timing header
+with db/serialize/render time, on-demand sampling profiles (?profile=1) and
+logging of slow SQL with its query plan
+"""
+
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Set
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+TIMED_PHASES = ("db", "serialize", "render")
+
+# Milliseconds per phase for the request being handled (None when not instrumented)
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+# Threads running the request being profiled (None when not profiling). Sync
+# handlers run in the threadpool, whose threads add themselves here through
+# ProfiledRoute; the context is copied into the worker, so the set is shared.
+_profile_threads: ContextVar[Optional[Set[int]]] = ContextVar("profile_threads", default=None)
+
+
+@contextmanager
+def timed(phase: str):
+    """Add the time spent in the block to ``phase`` of the current request"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + (time.perf_counter() - start) * 1000
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that books its encoding time under "serialize" """
+
+    def render(self, content) -> bytes:
+        with timed("serialize"):
+            return super().render(content)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of a set of threads at a fixed interval and
+    aggregates them in collapsed ("folded") form, ready for flamegraph.pl or
+    speedscope. The set may grow while sampling (threadpool handlers join late).
+    """
+
+    def __init__(self, thread_ids: Set[int], interval: float):
+        self.thread_ids = thread_ids
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+def _join_profile(endpoint: Callable) -> Callable:
+    """Wrap a sync endpoint so the threadpool thread running it is sampled too"""
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        threads = _profile_threads.get()
+        if threads is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        threads.add(thread_id)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            threads.discard(thread_id)
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose sync endpoints register their worker thread for ?profile=1"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _join_profile(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def server_timing(timings: Dict[str, float], total_ms: float) -> str:
+    parts = [f"{phase};dur={timings.get(phase, 0.0):.1f}" for phase in TIMED_PHASES]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def install_slow_query_log(engine: Engine, threshold_ms: float):
+    """Time every statement for Server-Timing and log the slow ones with their plan"""
+    explain_prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+
+        timings = _timings.get()
+        if timings is not None:
+            timings["db"] = timings.get("db", 0.0) + elapsed_ms
+
+        if elapsed_ms < threshold_ms:
+            return
+
+        plan = ""
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            try:
+                # Raw DBAPI cursor so the EXPLAIN doesn't re-enter these events
+                explain_cursor = conn.connection.cursor()
+                explain_cursor.execute(explain_prefix + statement, parameters)
+                plan = "\n".join(" ".join(str(col) for col in row) for row in explain_cursor.fetchall())
+                explain_cursor.close()
+            except Exception as e:
+                plan = f"(plan unavailable: {e})"
+
+        logger.warning(f"Slow query ({elapsed_ms:.1f} ms): {statement} {parameters!r}\n{plan}".rstrip())
+
+
+def install_profiling(app: FastAPI, engine: Engine):
+    """
+    Wire the slow-query log and the timing/profiling middleware into ``app``.
+    Call before routes are declared so they are created as ProfiledRoute.
+    """
+    install_slow_query_log(engine, Config.SLOW_QUERY_MS)
+    interval = Config.PROFILE_SAMPLE_INTERVAL_MS / 1000
+    app.router.route_class = ProfiledRoute
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        sampler = threads_token = None
+        if request.query_params.get("profile") == "1":
+            # The event loop thread (async handlers) plus any threadpool thread
+            # a sync handler registers while the request runs
+            threads = {threading.get_ident()}
+            threads_token = _profile_threads.set(threads)
+            sampler = StackSampler(threads, interval)
+            sampler.start()
+
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            if sampler:
+                sampler.stop()
+                _profile_threads.reset(threads_token)
+            _timings.reset(token)
+
+        header = server_timing(timings, total_ms)
+        if sampler:
+            return PlainTextResponse(
+                sampler.folded(),
+                headers={
+                    "Server-Timing": header,
+                    "X-Profile-Samples": str(sum(sampler.samples.values())),
+                    "Cache-Control": "no-store",
+                },
+            )
+
+        response.headers["Server-Timing"] = header
+        return response
+
+    logger.info(f"Request profiling enabled (slow query threshold {Config.SLOW_QUERY_MS} ms)")
@@ -0,0 +1,528 @@
+"""
+Usage storage backends for Taara Internet Monitor
+The read paths in app.main go through UsageStore so the ORM table can be
+swapped for an append-only columnar store with memory-mapped series files
+"""
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import desc, select
+from sqlalchemy.orm import Session
+
+from app import database
+from app.config import Config
+from app.database import CurrentState, DataUsageRecord, Plan, SessionLocal, from_epoch, to_epoch
+from app.heartbeat import read_heartbeat
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+FLAG_ACTIVE = 1
+FLAG_HOME_PLAN = 2
+
+# Column name -> dtype; every series directory holds one file per column
+COLUMNS: Dict[str, np.dtype] = {
+    "row_id": np.dtype("<i8"),
+    "epoch": np.dtype("<i8"),
+    "balance_bytes": np.dtype("<i8"),
+    "usage_bytes": np.dtype("<i8"),
+    "expires_in_days": np.dtype("<i4"),
+    "flags": np.dtype("u1"),
+}
+
+
+@dataclass(frozen=True)
+class SeriesKey:
+    """Identity of one balance time series"""
+    subscriber_id: str
+    plan_id: str
+    plan_name: str
+
+
+@dataclass
+class UsageReading:
+    """One balance reading, shaped like the DataUsageRecord fields the views use"""
+    id: int
+    timestamp: datetime
+    subscriber_id: str
+    plan_id: str
+    plan_name: str
+    remaining_balance_bytes: int
+    total_data_usage_bytes: int
+    expires_in_days: int
+    is_active: bool
+    is_home_plan: bool
+
+    @property
+    def remaining_balance_gb(self) -> float:
+        return self.remaining_balance_bytes / GB
+
+
+@dataclass
+class UsageSeries:
+    """Columnar readings of one series, ordered by time"""
+    key: SeriesKey
+    row_id: np.ndarray
+    epoch: np.ndarray
+    balance_bytes: np.ndarray
+    usage_bytes: np.ndarray
+    expires_in_days: np.ndarray
+    flags: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.epoch)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.epoch.astype("datetime64[s]")
+
+    @property
+    def balance_gb(self) -> np.ndarray:
+        return self.balance_bytes / GB
+
+    def reading(self, index: int) -> UsageReading:
+        flags = int(self.flags[index])
+        return UsageReading(
+            id=int(self.row_id[index]),
+            timestamp=from_epoch(self.epoch[index]),
+            subscriber_id=self.key.subscriber_id,
+            plan_id=self.key.plan_id,
+            plan_name=self.key.plan_name,
+            remaining_balance_bytes=int(self.balance_bytes[index]),
+            total_data_usage_bytes=int(self.usage_bytes[index]),
+            expires_in_days=int(self.expires_in_days[index]),
+            is_active=bool(flags & FLAG_ACTIVE),
+            is_home_plan=bool(flags & FLAG_HOME_PLAN),
+        )
+
+    def take(self, selector) -> "UsageSeries":
+        """Slice or mask every column (slices stay views of the underlying files)"""
+        return UsageSeries(self.key, *(getattr(self, name)[selector] for name in COLUMNS))
+
+    def active_only(self) -> "UsageSeries":
+        active = (self.flags & FLAG_ACTIVE).astype(bool)
+        if active.all():
+            return self
+        return self.take(active)
+
+
+def readings_in_order(series_list: Sequence[UsageSeries]) -> List[UsageReading]:
+    """Merge several series into one list of readings ordered by timestamp"""
+    order = []
+    for series_index, series in enumerate(series_list):
+        order.extend((int(epoch), series_index, i) for i, epoch in enumerate(series.epoch))
+    order.sort()
+    return [series_list[s].reading(i) for _, s, i in order]
+
+
+class UsageStore(ABC):
+    """Read/append interface for balance readings"""
+
+    @abstractmethod
+    def append(self, records: Sequence[Dict[str, Any]]) -> None:
+        """Record committed readings (dicts with DataUsageRecord field names and id)"""
+
+    @abstractmethod
+    def current_state(self) -> List[UsageReading]:
+        """Latest reading of each active plan, newest first"""
+
+    @abstractmethod
+    def series_since(self, since: datetime) -> List[UsageSeries]:
+        """Active readings at or after ``since``, one series per plan"""
+
+
+class SqlUsageStore(UsageStore):
+    """Reads data_usage_records for history and current_state for the latest readings"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def append(self, records: Sequence[Dict[str, Any]]) -> None:
+        # The collector's session already wrote the DataUsageRecord rows
+        pass
+
+    def current_state(self) -> List[UsageReading]:
+        global _current_state_cache
+        key = _current_state_key()
+        cached = _current_state_cache
+        if cached is not None and cached[0] == key:
+            return list(cached[1])
+        readings = self._query_current_state()
+        _current_state_cache = (key, readings)
+        return list(readings)
+
+    def _query_current_state(self) -> List[UsageReading]:
+        # current_state holds one row per plan, keyed by (subscriber_id, plan_id)
+        rows = self.db.query(CurrentState).filter(
+            CurrentState.is_active == True
+        ).order_by(desc(CurrentState.timestamp), desc(CurrentState.record_id)).all()
+        return [
+            UsageReading(
+                id=row.record_id,
+                timestamp=row.recorded_at,
+                subscriber_id=row.subscriber_id,
+                plan_id=row.plan_id,
+                plan_name=row.plan_name,
+                remaining_balance_bytes=row.remaining_balance_bytes,
+                total_data_usage_bytes=row.total_data_usage_bytes,
+                expires_in_days=row.expires_in_days,
+                is_active=bool(row.is_active),
+                is_home_plan=bool(row.is_home_plan),
+            )
+            for row in rows
+        ]
+
+    def series_since(self, since: datetime) -> List[UsageSeries]:
+        # Plain column rows: timestamps are already epochs and plans are joined once per series
+        rows = self.db.execute(
+            select(
+                DataUsageRecord.plan_key, DataUsageRecord.id, DataUsageRecord.timestamp,
+                DataUsageRecord.remaining_balance_bytes, DataUsageRecord.total_data_usage_bytes,
+                DataUsageRecord.expires_in_days, DataUsageRecord.is_active, DataUsageRecord.is_home_plan,
+            ).where(
+                DataUsageRecord.is_active == True,
+                DataUsageRecord.timestamp >= to_epoch(since)
+            ).order_by(DataUsageRecord.timestamp)
+        ).all()
+
+        grouped: Dict[int, list] = {}
+        for row in rows:
+            grouped.setdefault(row.plan_key, []).append(row)
+        if not grouped:
+            return []
+
+        plans = {plan.id: plan for plan in self.db.query(Plan).filter(Plan.id.in_(grouped))}
+        return [
+            series_from_rows(plan_series_key(plans[plan_key]), group)
+            for plan_key, group in grouped.items()
+        ]
+
+
+def plan_series_key(plan: Plan) -> SeriesKey:
+    return SeriesKey(plan.subscriber.subscriber_id, plan.plan_id, plan.plan_name)
+
+
+def record_flags(record) -> int:
+    get = record.get if isinstance(record, dict) else lambda name: getattr(record, name)
+    return (FLAG_ACTIVE if get("is_active") else 0) | (FLAG_HOME_PLAN if get("is_home_plan") else 0)
+
+
+def series_from_rows(key: SeriesKey, rows: Sequence) -> UsageSeries:
+    """Build a series from data_usage_records rows (epoch ``timestamp``) of one plan"""
+    return UsageSeries(
+        key=key,
+        row_id=np.fromiter((r.id for r in rows), COLUMNS["row_id"], len(rows)),
+        epoch=np.fromiter((r.timestamp for r in rows), COLUMNS["epoch"], len(rows)),
+        balance_bytes=np.fromiter((r.remaining_balance_bytes for r in rows), COLUMNS["balance_bytes"], len(rows)),
+        usage_bytes=np.fromiter((r.total_data_usage_bytes for r in rows), COLUMNS["usage_bytes"], len(rows)),
+        expires_in_days=np.fromiter((r.expires_in_days for r in rows), COLUMNS["expires_in_days"], len(rows)),
+        flags=np.fromiter((record_flags(r) for r in rows), COLUMNS["flags"], len(rows)),
+    )
+
+
+class ColumnarUsageStore(UsageStore):
+    """
+    Append-only columnar store
+
+    Layout under ``root``::
+
+        series.json           dictionary of series keys -> small integer ids
+        <series id>/<column>  raw little-endian array per column (see COLUMNS)
+
+    Readers memory-map the column files, so range reads are slices of the
+    mapped arrays. Appends from several processes are serialized with flock.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._keys: List[SeriesKey] = []
+        self._keys_mtime: Optional[float] = None
+        self._maps: Dict[Path, Tuple[int, np.ndarray]] = {}
+
+    # ------------------------------------------------------------------ keys
+
+    @property
+    def _keys_path(self) -> Path:
+        return self.root / "series.json"
+
+    def _load_keys(self) -> List[SeriesKey]:
+        try:
+            mtime = self._keys_path.stat().st_mtime
+        except FileNotFoundError:
+            return self._keys
+        if mtime != self._keys_mtime:
+            with open(self._keys_path) as f:
+                self._keys = [SeriesKey(**entry) for entry in json.load(f)]
+            self._keys_mtime = mtime
+        return self._keys
+
+    def _save_keys(self, keys: List[SeriesKey]):
+        tmp_path = self._keys_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump([key.__dict__ for key in keys], f)
+        os.replace(tmp_path, self._keys_path)
+        self._keys = keys
+        self._keys_mtime = self._keys_path.stat().st_mtime
+
+    # --------------------------------------------------------------- columns
+
+    def _column_path(self, series_id: int, column: str) -> Path:
+        return self.root / str(series_id) / column
+
+    def _column(self, series_id: int, column: str) -> np.ndarray:
+        """Memory-map a column file, remapping only when the file has grown"""
+        path = self._column_path(series_id, column)
+        dtype = COLUMNS[column]
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.empty(0, dtype)
+
+        cached = self._maps.get(path)
+        if cached and cached[0] == size:
+            return cached[1]
+        length = size // dtype.itemsize
+        array = np.memmap(path, dtype=dtype, mode="r", shape=(length,)) if length else np.empty(0, dtype)
+        self._maps[path] = (size, array)
+        return array
+
+    def _series(self, series_id: int, key: SeriesKey) -> UsageSeries:
+        columns = {name: self._column(series_id, name) for name in COLUMNS}
+        # A torn append can leave some columns longer than others
+        length = min(len(array) for array in columns.values())
+        return UsageSeries(key, **{name: array[:length] for name, array in columns.items()})
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self.root / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------- interface
+
+    def append(self, records: Sequence[Dict[str, Any]]) -> None:
+        if not records:
+            return
+
+        with self._write_lock():
+            self._keys_mtime = None
+            keys = list(self._load_keys())
+            ids = {(k.subscriber_id, k.plan_id): i for i, k in enumerate(keys)}
+
+            grouped: Dict[int, List[Dict[str, Any]]] = {}
+            for record in records:
+                ident = (record["subscriber_id"], record["plan_id"])
+                if ident not in ids:
+                    ids[ident] = len(keys)
+                    keys.append(SeriesKey(record["subscriber_id"], record["plan_id"], record["plan_name"]))
+                elif keys[ids[ident]].plan_name != record["plan_name"]:
+                    keys[ids[ident]] = SeriesKey(record["subscriber_id"], record["plan_id"], record["plan_name"])
+                grouped.setdefault(ids[ident], []).append(record)
+
+            if keys != self._keys:
+                self._save_keys(keys)
+
+            for series_id, group in grouped.items():
+                self._append_series(series_id, group)
+
+    def _append_series(self, series_id: int, records: List[Dict[str, Any]]):
+        series_dir = self.root / str(series_id)
+        series_dir.mkdir(exist_ok=True)
+
+        values = {
+            "row_id": [r["id"] for r in records],
+            "epoch": [to_epoch(r["timestamp"]) for r in records],
+            "balance_bytes": [r["remaining_balance_bytes"] for r in records],
+            "usage_bytes": [r["total_data_usage_bytes"] for r in records],
+            "expires_in_days": [r["expires_in_days"] for r in records],
+            "flags": [record_flags(r) for r in records],
+        }
+
+        # Drop any torn tail so every column has the same length, then append
+        # with epoch last: a reader never sees a timestamp without its values
+        lengths = [self._column_path(series_id, c).stat().st_size // d.itemsize
+                   if self._column_path(series_id, c).exists() else 0
+                   for c, d in COLUMNS.items()]
+        length = min(lengths)
+        for column in sorted(COLUMNS, key=lambda c: c == "epoch"):
+            dtype = COLUMNS[column]
+            with open(self._column_path(series_id, column), "ab") as f:
+                f.truncate(length * dtype.itemsize)
+                f.write(np.asarray(values[column], dtype=dtype).tobytes())
+
+    def current_state(self) -> List[UsageReading]:
+        latest: List[UsageSeries] = []
+        newest: Dict[str, int] = {}
+        for series_id, key in enumerate(self._load_keys()):
+            series = self._series(series_id, key)
+            if len(series):
+                latest.append(series)
+                newest[key.subscriber_id] = max(newest.get(key.subscriber_id, 0), int(series.epoch[-1]))
+
+        # A collection stores all of a subscriber's plans under one timestamp;
+        # as in the current_state table, plans missing from the subscriber's
+        # latest collection are no longer current
+        readings = [
+            series.reading(len(series) - 1)
+            for series in latest
+            if series.epoch[-1] == newest[series.key.subscriber_id] and series.flags[-1] & FLAG_ACTIVE
+        ]
+        readings.sort(key=lambda reading: (reading.timestamp, reading.id), reverse=True)
+        return readings
+
+    def series_since(self, since: datetime) -> List[UsageSeries]:
+        since_epoch = to_epoch(since)
+        result = []
+        for series_id, key in enumerate(self._load_keys()):
+            series = self._series(series_id, key)
+            start = int(np.searchsorted(series.epoch, since_epoch, side="left"))
+            window = series.take(slice(start, None)).active_only()
+            if len(window):
+                result.append(window)
+        return result
+
+    # ---------------------------------------------------------------- rebuild
+
+    @property
+    def _rebuild_marker(self) -> Path:
+        return self.root / "REBUILD_NEEDED"
+
+    def mark_for_rebuild(self, reason: str):
+        """Record that the store no longer matches data_usage_records"""
+        self._rebuild_marker.write_text(reason + "\n")
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self._rebuild_marker.exists()
+
+    @classmethod
+    def rebuild(cls, root: str, db: Session, batch_size: int = 10000) -> "ColumnarUsageStore":
+        """Rebuild the store from data_usage_records into a fresh directory"""
+        tmp_root = Path(f"{root}.rebuild")
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        store = cls(str(tmp_root))
+
+        query = db.query(DataUsageRecord).order_by(DataUsageRecord.timestamp, DataUsageRecord.id)
+        batch = []
+        for row in query.yield_per(batch_size):
+            batch.append({
+                "id": row.id,
+                "timestamp": row.recorded_at,
+                "subscriber_id": row.subscriber_id,
+                "plan_id": row.plan_id,
+                "plan_name": row.plan_name,
+                "remaining_balance_bytes": row.remaining_balance_bytes,
+                "total_data_usage_bytes": row.total_data_usage_bytes,
+                "expires_in_days": row.expires_in_days,
+                "is_active": row.is_active,
+                "is_home_plan": row.is_home_plan,
+            })
+            if len(batch) >= batch_size:
+                store.append(batch)
+                batch = []
+        store.append(batch)
+
+        shutil.rmtree(root, ignore_errors=True)
+        os.replace(tmp_root, root)
+        return cls(root)
+
+
+# SqlUsageStore.current_state() of this process and the key it was read under;
+# refreshed by the embedded collector right after it collects
+_current_state_cache: Optional[Tuple[tuple, List[UsageReading]]] = None
+
+
+def _current_state_key() -> tuple:
+    """Changes whenever current_state may have: a write here or a collection anywhere"""
+    heartbeat = read_heartbeat()
+    return database.current_state_writes, heartbeat["last_success"] if heartbeat else None
+
+
+def refresh_current_state() -> None:
+    """Reload the cached current state, so requests after a collection don't query it"""
+    global _current_state_cache
+    if Config.STORAGE_BACKEND != "sql":
+        return
+    _current_state_cache = None
+    db = SessionLocal()
+    try:
+        SqlUsageStore(db).current_state()
+    finally:
+        db.close()
+
+
+_columnar_store: Optional[ColumnarUsageStore] = None
+
+
+def get_usage_store(db: Session) -> UsageStore:
+    """Return the configured store (Config.STORAGE_BACKEND: "sql" or "columnar")"""
+    global _columnar_store
+    if Config.STORAGE_BACKEND == "columnar":
+        if _columnar_store is None:
+            _columnar_store = ColumnarUsageStore(Config.COLUMNAR_STORAGE_PATH)
+        return _columnar_store
+    return SqlUsageStore(db)
+
+
+def append_committed(db: Session, records: Sequence[Dict[str, Any]]) -> bool:
+    """
+    Add readings the collector has just committed to the configured store.
+
+    The database already holds them, so a failed append is logged and the
+    columnar store marked for rebuild rather than raised; the next call
+    rebuilds it from data_usage_records (which includes ``records``).
+    """
+    global _columnar_store
+    store = get_usage_store(db)
+    if not isinstance(store, ColumnarUsageStore):
+        store.append(records)
+        return True
+
+    try:
+        if store.needs_rebuild:
+            logger.info(f"Rebuilding columnar store at {store.root}")
+            _columnar_store = ColumnarUsageStore.rebuild(str(store.root), db)
+        else:
+            store.append(records)
+        return True
+    except Exception as e:
+        logger.error(f"Could not update columnar store, marking it for rebuild: {e}")
+        try:
+            store.mark_for_rebuild(str(e))
+        except OSError as marker_error:
+            logger.error(f"Could not mark columnar store for rebuild: {marker_error}")
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+    from app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] != ["rebuild"]:
+        print("Usage: python -m app.storage rebuild")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        store = ColumnarUsageStore.rebuild(Config.COLUMNAR_STORAGE_PATH, db)
+        logger.info(f"Rebuilt columnar store at {Config.COLUMNAR_STORAGE_PATH} "
+                    f"with {len(store._load_keys())} series")
+    finally:
+        db.close()
@@ -5,11 +5,16 @@ from datetime import datetime
 from typing import Optional, Dict, Any
 import logging
 
+from app.bundle_parser import BundleResponse, bundle_to_records
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_BASE_URL = "https://share.taara.company"
+
 class TaaraAPI:
     def __init__(self, phone_country_code: str, phone_number: str, passcode: str, 
-                 partner_id: str, hotspot_id: str):
+                 partner_id: str, hotspot_id: str, base_url: Optional[str] = None,
+                 session: Optional[requests.Session] = None):
         self.phone_country_code = phone_country_code
         self.phone_number = phone_number
         self.passcode = passcode
@@ -17,12 +22,15 @@ class TaaraAPI:
         self.hotspot_id = hotspot_id
         self.access_token: Optional[str] = None
         self.subscriber_id: Optional[str] = None
+        # Pass a long-lived session to reuse connections across collections
+        self.session = session or requests.Session()
         
-        # API URLs
-        self.login_url = "https://share.taara.company/v1/users/subscriber/login"
-        self.bundle_url = f"https://share.taara.company/v1/customers/get-customer-bundle?hotspotId={hotspot_id}"
-        self.hotspot_config_url = f"https://share.taara.company/v1/hotspot/GetHotspotConfig?hotspotId={hotspot_id}"
-        self.logout_url = "https://share.taara.company/v1/users/subscriber/logout"
+        # API URLs (base URL is configurable so the client can target a local simulator)
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.login_url = f"{self.base_url}/v1/users/subscriber/login"
+        self.bundle_url = f"{self.base_url}/v1/customers/get-customer-bundle?hotspotId={hotspot_id}"
+        self.hotspot_config_url = f"{self.base_url}/v1/hotspot/GetHotspotConfig?hotspotId={hotspot_id}"
+        self.logout_url = f"{self.base_url}/v1/users/subscriber/logout"
         
         # Headers template
         self.base_headers = {
@@ -50,11 +58,11 @@ class TaaraAPI:
         }
         
         headers = self.base_headers.copy()
-        headers["referer"] = f"https://share.taara.company/cp/customers/login?hotspotId={self.hotspot_id}"
+        headers["referer"] = f"{self.base_url}/cp/customers/login?hotspotId={self.hotspot_id}"
         
         try:
             start_time = time.time()
-            response = requests.post(
+            response = self.session.post(
                 self.login_url, 
                 json=payload, 
                 headers=headers,
@@ -106,7 +114,7 @@ class TaaraAPI:
                 "response_time_ms": 0
             }
 
-    def get_customer_bundle(self) -> Dict[str, Any]:
+    def get_customer_bundle(self, retry_on_expired: bool = True) -> Dict[str, Any]:
         """Get customer bundle information"""
         if not self.access_token:
             login_result = self.login()
@@ -115,11 +123,11 @@ class TaaraAPI:
         
         headers = self.base_headers.copy()
         headers["authorization"] = f"Bearer {self.access_token}"
-        headers["referer"] = f"https://share.taara.company/cp/customers/home?hotspotId={self.hotspot_id}"
+        headers["referer"] = f"{self.base_url}/cp/customers/home?hotspotId={self.hotspot_id}"
         
         try:
             start_time = time.time()
-            response = requests.get(
+            response = self.session.get(
                 self.bundle_url,
                 headers=headers,
                 timeout=30
@@ -134,6 +142,11 @@ class TaaraAPI:
                     "data": data,
                     "response_time_ms": response_time
                 }
+            elif response.status_code == 401 and retry_on_expired:
+                # Cached token expired or was revoked - log in again once
+                logger.warning("Access token rejected, logging in again")
+                self.access_token = None
+                return self.get_customer_bundle(retry_on_expired=False)
             else:
                 logger.error(f"Bundle request failed: {response.status_code} - {response.text}")
                 return {
@@ -157,11 +170,11 @@ class TaaraAPI:
         
         logout_url = f"{self.logout_url}/{self.subscriber_id}"
         headers = self.base_headers.copy()
-        headers["referer"] = f"https://share.taara.company/cp/customers/home?hotspotId={self.hotspot_id}"
+        headers["referer"] = f"{self.base_url}/cp/customers/home?hotspotId={self.hotspot_id}"
         
         try:
             start_time = time.time()
-            response = requests.get(logout_url, headers=headers, timeout=30)
+            response = self.session.get(logout_url, headers=headers, timeout=30)
             response_time = (time.time() - start_time) * 1000
             
             self.access_token = None
@@ -181,70 +194,11 @@ class TaaraAPI:
                 "response_time_ms": 0
             }
 
-    def parse_bundle_data(self, bundle_response: Dict[str, Any]) -> list:
-        """Parse bundle response and extract usage data"""
-        parsed_data = []
-        
+    def parse_bundle_data(self, bundle_response: Dict[str, Any],
+                          bundle: Optional[BundleResponse] = None) -> list:
+        """Parse bundle response (or its already decoded ``bundle``) and extract usage data"""
         try:
-            data = bundle_response.get("data", {})
-            subscriber_id = data.get("subscriberId", "")
-            active_plans = data.get("subscriberActiveAndUnusedPlans", [])
-            
-            for plan in active_plans:
-                # Parse remaining balance
-                remaining_balance_str = plan.get("remainingBalance", "0 GB")
-                remaining_balance_gb = 0
-                remaining_balance_bytes = 0
-                
-                if "GB" in remaining_balance_str:
-                    try:
-                        remaining_balance_gb = float(remaining_balance_str.replace("GB", "").strip())
-                        remaining_balance_bytes = int(remaining_balance_gb * 1024 * 1024 * 1024)
-                    except ValueError:
-                        pass
-                elif "MB" in remaining_balance_str:
-                    try:
-                        remaining_balance_mb = float(remaining_balance_str.replace("MB", "").strip())
-                        remaining_balance_gb = remaining_balance_mb / 1024
-                        remaining_balance_bytes = int(remaining_balance_mb * 1024 * 1024)
-                    except ValueError:
-                        pass
-                
-                # Parse expires in days
-                expires_in_str = plan.get("expiresIn", "0 days")
-                expires_in_days = 0
-                try:
-                    expires_in_days = int(expires_in_str.replace("days", "").strip())
-                except ValueError:
-                    pass
-                
-                # Get total data usage from purchase history if available
-                total_data_usage_bytes = 0
-                purchase_history = data.get("purchasedHistory", [])
-                if purchase_history:
-                    for history in purchase_history:
-                        for history_plan in history.get("purchasedHistoryPlans", []):
-                            if history_plan.get("planDisplayName") == plan.get("planName"):
-                                usage_data = history_plan.get("dataUsage", {})
-                                total_data_usage_bytes = usage_data.get("totalDataUsage", 0)
-                                break
-                
-                parsed_record = {
-                    "subscriber_id": subscriber_id,
-                    "plan_name": plan.get("planName", ""),
-                    "plan_id": plan.get("planId", ""),
-                    "remaining_balance_gb": remaining_balance_gb,
-                    "remaining_balance_bytes": remaining_balance_bytes,
-                    "total_data_usage_bytes": total_data_usage_bytes,
-                    "expires_in_days": expires_in_days,
-                    "is_active": plan.get("isActive", False),
-                    "is_home_plan": plan.get("isHomePlan", False),
-                    "raw_response": json.dumps(bundle_response)
-                }
-                
-                parsed_data.append(parsed_record)
-                
+            return bundle_to_records(bundle_response, bundle)
         except Exception as e:
             logger.error(f"Error parsing bundle data: {str(e)}")
-            
-        return parsed_data
+            return []
@@ -9,7 +9,9 @@ import time
 import os
 import logging
 from datetime import datetime
+from app.config import Config
 from app.data_collector import DataCollector
+from app.leases import LeaseHeld
 
 # Configure logging
 logging.basicConfig(
@@ -35,6 +37,8 @@ def run_collection():
         else:
             logger.error("Scheduled data collection failed")
             
+    except LeaseHeld as e:
+        logger.info(f"Skipping scheduled data collection: {e}")
     except Exception as e:
         logger.error(f"Error in scheduled data collection: {str(e)}")
 
@@ -44,6 +48,9 @@ def main():
     interval_minutes = int(os.getenv("SCRAPING_INTERVAL_MINUTES", "15"))
     
     logger.info(f"Starting Taara data collection scheduler with {interval_minutes} minute interval")
+    if Config.COLLECTOR_MODE == "embedded":
+        # Harmless (the collection lease skips duplicate runs) but this process isn't needed
+        logger.warning("COLLECTOR_MODE=embedded: the web app already collects; this scheduler can be removed")
     
     # Schedule the job
     schedule.every(interval_minutes).minutes.do(run_collection)
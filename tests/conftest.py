@@ -0,0 +1,76 @@
+"""
+Test setup for Taara Internet Monitor
+Points every path the app writes to at a temporary directory before app
+modules are imported, and gives each test an empty database.
+Tests marked ``postgres`` run only when TEST_POSTGRES_URL names a database
+they may drop and recreate tables in.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="taara-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_tmp}/taara_test.db",
+    "STORAGE_BACKEND": "sql",
+    "COLUMNAR_STORAGE_PATH": os.path.join(_tmp, "columnar"),
+    "BACKUP_STORAGE_PATH": os.path.join(_tmp, "backups"),
+    "HEARTBEAT_PATH": os.path.join(_tmp, "collector_heartbeat.json"),
+    "COLLECTOR_LOCK_PATH": os.path.join(_tmp, "collector.lock"),
+    "ALERTS_ENABLED": "False",
+    "PROXY_CACHE_REFRESH_URL": "",
+})
+
+import pytest  # noqa: E402
+
+from app import storage  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables"""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    storage._current_state_cache = None
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: needs the PostgreSQL database at TEST_POSTGRES_URL")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("TEST_POSTGRES_URL"):
+        return
+    skip = pytest.mark.skip(reason="set TEST_POSTGRES_URL to run PostgreSQL tests")
+    for item in items:
+        if "postgres" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def run_on_postgres():
+    """
+    Run a script in a fresh interpreter whose app modules use TEST_POSTGRES_URL
+
+    app.database picks its dialect (and the partitioned table layout) at
+    import, so PostgreSQL code can't share this process's SQLite models.
+    Returns the script's stdout and fails the test if it exits non-zero.
+    """
+    def run(script: str) -> str:
+        env = dict(os.environ, DATABASE_URL=os.environ["TEST_POSTGRES_URL"])
+        result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                                capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+    return run
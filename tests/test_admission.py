@@ -0,0 +1,69 @@
+import pytest
+
+from app.admission import AdmissionController
+from app.config import Config
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(Config, "ADMISSION_INITIAL_LIMIT", 4)
+    monkeypatch.setattr(Config, "ADMISSION_MIN_LIMIT", 1)
+    monkeypatch.setattr(Config, "ADMISSION_MAX_LIMIT", 50)
+    monkeypatch.setattr(Config, "ADMISSION_LATENCY_TOLERANCE", 2.0)
+
+
+def drive(controller, routes, concurrency, latency, rounds=2000):
+    """
+    Offer ``concurrency`` requests at a time, spread over ``routes``
+    ({path: no-load seconds}), completing each with ``latency(base, admitted)``.
+    Returns how many were shed in the second half of the run.
+    """
+    paths = list(routes)
+    shed = 0
+    for round_number in range(rounds):
+        admitted = []
+        for i in range(concurrency):
+            path = paths[(round_number + i) % len(paths)]
+            admission, _ = controller.try_admit(path, "default")
+            if admission is None:
+                shed += round_number >= rounds // 2
+            else:
+                admitted.append((path, admission))
+        for path, admission in admitted:
+            controller.release(admission, latency(routes[path], len(admitted)))
+    return shed
+
+
+def test_mixed_fast_and_slow_routes_grow_without_overload():
+    controller = AdmissionController()
+    shed = drive(controller, {"/api/data": 0.002, "/api/history": 0.050}, concurrency=20,
+                 latency=lambda base, in_flight: base)
+
+    assert shed == 0
+    # Default traffic gets 70% of the worker limit; 20 concurrent need a limit of ~29
+    assert controller.worker.limit * 0.7 >= 20
+    assert controller.route_limit("/api/history").limit >= 10
+
+
+def test_sheds_when_latency_climbs_with_concurrency():
+    controller = AdmissionController()
+    # Capacity for 4 at a time; beyond that requests queue and latency grows linearly
+    shed = drive(controller, {"/api/data": 0.002, "/api/history": 0.050}, concurrency=40,
+                 latency=lambda base, in_flight: base * max(1.0, in_flight / 4))
+
+    assert shed > 0
+    assert controller.worker.limit < 20
+    assert controller.snapshot()["worker"]["shed"] > 0
+
+
+def test_shed_request_returns_its_route_slot():
+    controller = AdmissionController()
+    route = controller.route_limit("/api/data")
+    controller.worker.limit = 1
+    first, _ = controller.try_admit("/api/data", "default")
+    second, shed_by = controller.try_admit("/api/data", "default")
+
+    assert second is None and shed_by is controller.worker
+    assert route.in_flight == 1
+    controller.release(first, 0.01)
+    assert route.in_flight == 0 and controller.worker.in_flight == 0
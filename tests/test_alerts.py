@@ -0,0 +1,123 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from app import alerts
+from app.alerts import Alert, AlertDispatcher, AnomalyDetector, detect_anomalies
+from app.config import Config
+from app.database import insert_readings, upsert_current_state
+
+GB = 1024 ** 3
+
+
+@pytest.fixture(autouse=True)
+def fresh_detector(monkeypatch):
+    monkeypatch.setattr(Config, "ALERTS_ENABLED", True)
+    monkeypatch.setattr(alerts, "detector", AnomalyDetector())
+
+
+def committed(db, balance_gb, timestamp):
+    record = {
+        "subscriber_id": "sub-1",
+        "plan_id": "plan-1",
+        "plan_name": "1 Month Unlimited",
+        "remaining_balance_gb": balance_gb,
+        "remaining_balance_bytes": int(balance_gb * GB),
+        "total_data_usage_bytes": 0,
+        "expires_in_days": 20,
+        "is_active": True,
+        "is_home_plan": True,
+    }
+    [record_id] = insert_readings(db, [record], timestamp)
+    return [dict(record, id=record_id, timestamp=timestamp)]
+
+
+def collect(db, balance_gb, timestamp):
+    """A collection cycle in this process: detect, store, commit, apply"""
+    records = committed(db, balance_gb, timestamp)
+    detection = detect_anomalies(db, records)
+    upsert_current_state(db, records)
+    db.commit()
+    detection.apply()
+    return detection.alerts
+
+
+def thresholds(raised):
+    return [alert.threshold for alert in raised if alert.kind == "balance_low"]
+
+
+def test_rolled_back_batch_leaves_detector_state(db):
+    collect(db, 120, datetime(2024, 1, 1, 12, 0))
+
+    records = committed(db, 90, datetime(2024, 1, 1, 12, 15))
+    assert thresholds(detect_anomalies(db, records).alerts) == [100]
+    db.rollback()  # e.g. the lease was lost; the detection is never applied
+
+    assert thresholds(collect(db, 95, datetime(2024, 1, 1, 12, 30))) == [100]
+
+
+def test_reseeds_series_another_process_advanced(db):
+    collect(db, 120, datetime(2024, 1, 1, 12, 0))
+
+    # Another process collects and commits the 100 GB crossing
+    records = committed(db, 60, datetime(2024, 1, 1, 12, 15))
+    upsert_current_state(db, records)
+    db.commit()
+
+    # Only the 50 GB crossing is new here, not 120 -> 45 crossing both
+    assert thresholds(collect(db, 45, datetime(2024, 1, 1, 12, 30))) == [50]
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    """Deliveries to a fake webhook; set ``failing`` to make them raise"""
+    monkeypatch.setattr(Config, "WEBHOOK_URL", "http://hooks.invalid/alerts")
+    monkeypatch.setattr(Config, "EMAIL_SMTP_HOST", "")
+    monkeypatch.setattr(Config, "MAX_RETRIES", 1)
+    monkeypatch.setattr(Config, "ALERT_BATCH_WINDOW_SECONDS", 0)
+    sent = []
+
+    def send(batch):
+        time.sleep(0.05)
+        if send.failing:
+            raise ConnectionError("webhook down")
+        sent.append([alert.message for alert in batch])
+
+    send.failing = False
+    send.sent = sent
+    monkeypatch.setattr(AlertDispatcher, "_send_webhook", staticmethod(send))
+    return send
+
+
+def balance_alert():
+    return Alert("balance_low", "warning", "sub-1", "plan-1", "1 Month Unlimited",
+                 "Balance under 50 GB", 45.0, 50.0, "2024-01-01T12:00:00")
+
+
+def test_failed_delivery_does_not_start_the_dedup_window(webhook):
+    dispatcher = AlertDispatcher()
+
+    webhook.failing = True
+    dispatcher.submit([balance_alert()])
+    assert dispatcher.flush(5)
+    assert dispatcher.sent_at == {}
+
+    webhook.failing = False
+    dispatcher.submit([balance_alert()])
+    assert dispatcher.flush(5)
+    assert webhook.sent == [["Balance under 50 GB"]]
+
+    dispatcher.submit([balance_alert()])
+    assert dispatcher.flush(5)
+    assert len(webhook.sent) == 1
+
+
+def test_flush_waits_for_alerts_submitted_before_it(webhook):
+    dispatcher = AlertDispatcher()
+    assert dispatcher.flush(0)
+
+    # Duplicates queued behind an undelivered alert are dropped too
+    dispatcher.submit([balance_alert(), balance_alert()])
+    assert dispatcher.flush(5)
+    assert webhook.sent == [["Balance under 50 GB"]]
@@ -0,0 +1,43 @@
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import insert_readings, upsert_current_state
+from app.main import app
+
+GB = 1024 ** 3
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+
+def store(db, balance_bytes, timestamp):
+    records = [{
+        "subscriber_id": "sub-1",
+        "plan_id": "plan-1",
+        "plan_name": "1 Month Unlimited",
+        "remaining_balance_gb": balance_bytes / GB,
+        "remaining_balance_bytes": balance_bytes,
+        "total_data_usage_bytes": 0,
+        "expires_in_days": 20,
+        "is_active": True,
+        "is_home_plan": True,
+        "raw_response": "{}",
+    }]
+    ids = insert_readings(db, records, timestamp)
+    upsert_current_state(db, [dict(records[0], id=ids[0], timestamp=timestamp)])
+    db.commit()
+
+
+def test_gb_values_are_rounded_at_the_api_edge(db, client):
+    now = datetime.utcnow().replace(microsecond=0)
+    store(db, int(885.1 * GB), now)
+
+    [latest] = client.get("/api/data").json()
+    assert latest["remaining_balance_gb"] == 885.1
+    [reading] = client.get("/api/history").json()
+    assert reading["remaining_balance_gb"] == 885.1
+    assert client.get("/api/stats").json()["current_balance_gb"] == 885.1
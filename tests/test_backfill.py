@@ -0,0 +1,40 @@
+import json
+
+from app.backfill import backfill_from_stored
+from app.database import PlanPurchase, RawResponse
+
+
+def payload(*purchases):
+    return json.dumps({"data": {"subscriberId": "sub-1", "subscriberActiveAndUnusedPlans": [], "purchasedHistory": [
+        {"purchasedAt": purchased_at, "purchasedHistoryPlans": [plan]} for purchased_at, plan in purchases
+    ]}})
+
+
+def plan(name, usage, purchase_id=None):
+    entry = {"planDisplayName": name, "dataUsage": {"totalDataUsage": usage}}
+    if purchase_id:
+        entry["_id"] = purchase_id
+    return entry
+
+
+def test_rerun_over_overlapping_history_keeps_one_row_per_purchase(db):
+    # Each payload repeats the history so far; the running plan's usage grows
+    db.add_all([
+        RawResponse(timestamp=1000, raw_response=payload(
+            ("08/01/2025", plan("1 Week 50 GB", 10, "p1")),
+            ("07/01/2025", plan("1 Day 5 GB", 5)),
+        )),
+        RawResponse(timestamp=2000, raw_response=payload(
+            ("08/08/2025", plan("1 Month Unlimited", 1, "p2")),
+            ("08/01/2025", plan("1 Week 50 GB", 40, "p1")),
+            ("07/01/2025", plan("1 Day 5 GB", 5)),
+        )),
+    ])
+    db.commit()
+
+    backfill_from_stored(batch_size=1)
+    backfill_from_stored(batch_size=1)
+
+    rows = {row.purchase_id: row for row in db.query(PlanPurchase).all()}
+    assert sorted(rows) == ["07/01/2025:1 Day 5 GB:0", "p1", "p2"]
+    assert (rows["p1"].total_data_usage_bytes, rows["p1"].observed_at) == (40, 2000)
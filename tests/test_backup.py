@@ -0,0 +1,66 @@
+import sqlite3
+from datetime import datetime
+
+from app.backup import BackupManager
+from app.database import engine, insert_readings, upsert_purchases
+
+
+def purchase(usage_bytes, observed_at):
+    return {
+        "subscriber_id": "sub-1",
+        "purchase_id": "purchase-1",
+        "purchased_at": 1700000000,
+        "plan_name": "Monthly 100GB",
+        "hotspot_name": "Home",
+        "price_units": 2500,
+        "currency_code": "KES",
+        "is_reward_plan": False,
+        "history_type": "PURCHASE",
+        "total_data_usage_bytes": usage_bytes,
+        "observed_at": observed_at,
+    }
+
+
+def reading(balance_bytes):
+    return {
+        "subscriber_id": "sub-1",
+        "plan_id": "plan-1",
+        "plan_name": "Monthly 100GB",
+        "remaining_balance_bytes": balance_bytes,
+        "total_data_usage_bytes": 100 * 2**30 - balance_bytes,
+        "expires_in_days": 20,
+        "is_active": True,
+        "is_home_plan": True,
+        "raw_response": '{"status": true}',
+    }
+
+
+def table_rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f'SELECT * FROM "{table}" ORDER BY 1').fetchall()
+    finally:
+        conn.close()
+
+
+def test_restore_round_trip_includes_updated_purchases(db, tmp_path):
+    manager = BackupManager(engine.url.database, tmp_path / "backups")
+
+    insert_readings(db, [reading(60 * 2**30)], datetime(2024, 1, 1, 12, 0))
+    upsert_purchases(db, [purchase(40 * 2**30, 1704110400)])
+    db.commit()
+    assert manager.run()["type"] == "base"
+
+    # New readings are appended; the purchase row is rewritten in place
+    insert_readings(db, [reading(55 * 2**30)], datetime(2024, 1, 1, 12, 15))
+    upsert_purchases(db, [purchase(45 * 2**30, 1704111300)])
+    db.commit()
+    assert manager.run()["type"] == "incr"
+
+    restored = tmp_path / "restored.db"
+    assert len(manager.restore(str(restored))) == 2
+    for table in ("subscribers", "plans", "raw_responses", "data_usage_records", "plan_purchases"):
+        assert table_rows(restored, table) == table_rows(engine.url.database, table), table
+
+    usage = table_rows(restored, "plan_purchases")[0]
+    assert 45 * 2**30 in usage
@@ -0,0 +1,69 @@
+from app.bundle_parser import SIZE_UNITS, bundle_to_purchases, bundle_to_records, parse_size_to_bytes
+
+
+def payload(active_plans, purchased_history):
+    return {
+        "data": {
+            "subscriberId": "sub-1",
+            "subscriberActiveAndUnusedPlans": active_plans,
+            "purchasedHistory": purchased_history,
+        },
+        "message": "List Customers Bundles",
+    }
+
+
+def active_plan(plan_id, **overrides):
+    plan = {
+        "planId": plan_id,
+        "planName": "1 Month Unlimited",
+        "remainingBalance": "885.1 GB",
+        "expiresIn": "27 days",
+        "isActive": True,
+        "isHomePlan": True,
+    }
+    plan.update(overrides)
+    return plan
+
+
+def test_nulls_and_float_usage_fall_back_to_defaults():
+    bundle = payload(
+        [active_plan("plan-1", isHomePlan=None, expiresIn=None)],
+        [{"purchasedAt": "08/21/2025", "purchasedHistoryPlans": [
+            {"_id": "p1", "planDisplayName": "1 Month Unlimited", "dataUsage": {"totalDataUsage": 1234.0}},
+            {"_id": "p2", "planDisplayName": "1 Day 5 GB", "dataUsage": {"totalDataUsage": None}},
+        ]}],
+    )
+
+    [record] = bundle_to_records(bundle)
+    assert record["is_home_plan"] is False
+    assert record["expires_in_days"] == 0
+    assert record["total_data_usage_bytes"] == 1234
+
+    usage = {p["purchase_id"]: p["total_data_usage_bytes"] for p in bundle_to_purchases(bundle, 0)}
+    assert usage == {"p1": 1234, "p2": 0}
+
+
+def test_null_purchase_history_keeps_readings():
+    assert len(bundle_to_records(payload([active_plan("plan-1")], None))) == 1
+
+
+def test_malformed_plan_is_skipped_not_the_payload(caplog):
+    bundle = payload(
+        [active_plan("plan-1"), active_plan("plan-2", isActive={"unexpected": "object"}), "garbage"],
+        [{"purchasedAt": "08/21/2025", "purchasedHistoryPlans": [
+            {"_id": "p1", "planDisplayName": "1 Month Unlimited", "dataUsage": {"totalDataUsage": "lots"}},
+            {"_id": "p2", "planDisplayName": "1 Day 5 GB", "dataUsage": {"totalDataUsage": 10}},
+        ]}],
+    )
+
+    assert [r["plan_id"] for r in bundle_to_records(bundle)] == ["plan-1"]
+    assert [p["purchase_id"] for p in bundle_to_purchases(bundle, 0)] == ["p2"]
+    assert "Skipping unparseable active plan" in caplog.text
+
+
+def test_commas_group_thousands_in_sizes(caplog):
+    assert parse_size_to_bytes("1,024 GB") == 1024 * SIZE_UNITS["GB"]
+    assert parse_size_to_bytes("1,000.5 MB") == int(1000.5 * SIZE_UNITS["MB"])
+    assert parse_size_to_bytes("885.1 GB") == int(885.1 * SIZE_UNITS["GB"])
+    assert parse_size_to_bytes("1,5 GB") == 0
+    assert "Unparseable size '1,5 GB'" in caplog.text
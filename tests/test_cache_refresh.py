@@ -0,0 +1,42 @@
+from app import cache_refresh
+from app.cache_refresh import refresh_proxy_cache, refresh_urls
+from app.config import Config
+
+
+def test_refresh_urls_join_base_and_paths(monkeypatch):
+    monkeypatch.setattr(Config, "PROXY_CACHE_REFRESH_URL", "http://nginx:8080/")
+
+    assert refresh_urls(["/", "/api/data", " /api/history?days=1", "api/stats", ""]) == [
+        "http://nginx:8080/",
+        "http://nginx:8080/api/data",
+        "http://nginx:8080/api/history?days=1",
+        "http://nginx:8080/api/stats",
+    ]
+
+
+def test_refresh_fetches_each_url_and_is_off_without_a_base(monkeypatch):
+    fetched = []
+
+    class Response:
+        status_code = 200
+
+    class Session:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def get(self, url, timeout):
+            fetched.append(url)
+            return Response()
+
+    monkeypatch.setattr(cache_refresh.requests, "Session", Session)
+
+    monkeypatch.setattr(Config, "PROXY_CACHE_REFRESH_URL", "")
+    assert refresh_proxy_cache(["/api/data"]) is None
+
+    monkeypatch.setattr(Config, "PROXY_CACHE_REFRESH_URL", "http://nginx:8080")
+    monkeypatch.setattr(Config, "PROXY_CACHE_REFRESH_PATHS", ["/", "/api/stats"])
+    refresh_proxy_cache(wait=True)
+    assert fetched == ["http://nginx:8080/", "http://nginx:8080/api/stats"]
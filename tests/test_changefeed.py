@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from app import changefeed
+from app.changefeed import notify_new_readings, read_changes, wait_for_changes
+from app.config import Config
+from app.database import epoch_now, insert_readings
+
+GB = 1024 ** 3
+
+
+def store(db, count, timestamp=datetime(2024, 1, 1, 12, 0)):
+    records = [{
+        "subscriber_id": "sub-1",
+        "plan_id": f"plan-{n}",
+        "plan_name": f"Plan {n}",
+        "remaining_balance_gb": 10,
+        "remaining_balance_bytes": 10 * GB,
+        "total_data_usage_bytes": 0,
+        "expires_in_days": 5,
+        "is_active": True,
+        "is_home_plan": False,
+        "raw_response": "{}",
+    } for n in range(count)]
+    ids = insert_readings(db, records, timestamp)
+    db.commit()
+    return ids
+
+
+def test_offsets_page_through_readings_in_insert_order(db):
+    ids = store(db, 5)
+
+    records, has_more = read_changes(0, 3)
+    assert ([r.id for r in records], has_more) == (ids[:3], True)
+
+    records, has_more = read_changes(records[-1].id, 3)
+    assert ([r.id for r in records], has_more) == (ids[3:], False)
+
+    assert read_changes(ids[-1], 3) == ([], False)
+
+
+def test_settle_window_holds_back_young_readings(db, monkeypatch):
+    ids = store(db, 2)
+    monkeypatch.setattr(changefeed, "engine", SimpleNamespace(dialect=SimpleNamespace(name="postgresql")))
+    monkeypatch.setattr(Config, "CHANGE_FEED_SETTLE_SECONDS", 60)
+
+    assert read_changes(0, 10) == ([], True)
+
+    monkeypatch.setattr(changefeed, "epoch_now", lambda: epoch_now() + 61)
+    records, has_more = read_changes(0, 10)
+    assert ([r.id for r in records], has_more) == (ids, False)
+
+
+def test_collection_in_another_thread_wakes_long_polls(db, monkeypatch):
+    [last] = store(db, 1)
+    # Only the wakeup can end the wait early; the heartbeat check never runs
+    monkeypatch.setattr(Config, "CHANGE_FEED_POLL_SECONDS", 30)
+
+    def collect_soon():
+        time.sleep(0.2)
+        store(db, 1, datetime(2024, 1, 1, 12, 15))
+        notify_new_readings()
+
+    # A fresh event loop each time, as with a reloaded app or another worker thread
+    for _ in range(2):
+        threading.Thread(target=collect_soon).start()
+        started = time.monotonic()
+        records, has_more = asyncio.run(wait_for_changes(last, 10, wait_seconds=10))
+        assert time.monotonic() - started < 5
+        assert len(records) == 1 and records[0].id > last and not has_more
+        last = records[0].id
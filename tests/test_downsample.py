@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.downsample import lttb_indices
+
+
+def reference_lttb(data, threshold):
+    """Sveinn Steinarsson's published LTTB, returning the kept indices"""
+    n = len(data)
+    if threshold >= n or threshold == 0:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    sampled = [0]
+    for i in range(threshold - 2):
+        avg_x = avg_y = 0
+        avg_range_start = int(math.floor((i + 1) * every) + 1)
+        avg_range_end = min(int(math.floor((i + 2) * every) + 1), n)
+        avg_range_length = avg_range_end - avg_range_start
+        for j in range(avg_range_start, avg_range_end):
+            avg_x += data[j][0]
+            avg_y += data[j][1]
+        avg_x /= avg_range_length
+        avg_y /= avg_range_length
+
+        point_a_x, point_a_y = data[a]
+        max_area = -1
+        for j in range(int(math.floor(i * every) + 1), int(math.floor((i + 1) * every) + 1)):
+            area = math.fabs((point_a_x - avg_x) * (data[j][1] - point_a_y)
+                             - (point_a_x - data[j][0]) * (avg_y - point_a_y)) * 0.5
+            if area > max_area:
+                max_area = area
+                next_a = j
+        sampled.append(next_a)
+        a = next_a
+    sampled.append(n - 1)
+    return sampled
+
+
+def series(rng, n, kind):
+    x = np.sort(rng.integers(1_700_000_000, 1_800_000_000, n))
+    if kind == "bytes":
+        y = rng.integers(0, 10 ** 12, n)
+    elif kind == "walk":
+        y = rng.normal(size=n).cumsum()
+    else:  # flat stretches: every triangle ties
+        y = rng.integers(0, 3, n)
+    return x, y
+
+
+@pytest.mark.parametrize("kind", ["bytes", "walk", "ties"])
+def test_matches_reference_implementation(kind):
+    rng = np.random.default_rng(7)
+    for _ in range(200):
+        n = int(rng.integers(4, 2000))
+        max_points = int(rng.integers(3, n))
+        x, y = series(rng, n, kind)
+        expected = reference_lttb(list(zip(x.tolist(), y.tolist())), max_points)
+        assert lttb_indices(x, y, max_points).tolist() == expected, (n, max_points)
+
+
+def test_last_bucket_when_float_bucket_width_rounds_down():
+    # (max_points - 2) * every lands just below n - 2, so the final edge is
+    # one short and the last bucket's third vertex averages two points
+    n, max_points = 3181, 602
+    assert math.floor((max_points - 2) * ((n - 2) / (max_points - 2))) + 1 == n - 2
+    rng = np.random.default_rng(3)
+    x, y = series(rng, n, "bytes")
+    assert lttb_indices(x, y, max_points).tolist() == reference_lttb(list(zip(x.tolist(), y.tolist())), max_points)
+
+
+def test_small_budgets_and_passthrough():
+    x = np.arange(10)
+    y = np.arange(10) ** 2
+    assert lttb_indices(x, y, 0).tolist() == list(range(10))
+    assert lttb_indices(x, y, 10).tolist() == list(range(10))
+    assert lttb_indices(x, y, 2).tolist() == [0, 9]
+    assert lttb_indices(x, y, 1).tolist() == [0]
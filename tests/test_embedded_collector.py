@@ -0,0 +1,91 @@
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import datetime
+
+import pytest
+
+from app import storage
+from app.database import insert_readings, upsert_current_state
+from app.embedded_collector import CollectorElection
+from app.heartbeat import record_heartbeat
+from app.storage import SqlUsageStore, refresh_current_state
+
+GB = 1024 ** 3
+
+
+def test_only_one_worker_holds_the_election(tmp_path):
+    path = str(tmp_path / "collector.lock")
+    first, second = CollectorElection(path), CollectorElection(path)
+
+    assert first.try_acquire()
+    assert first.try_acquire()
+    assert not second.try_acquire()
+
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_election_passes_on_when_the_holder_exits(tmp_path):
+    path = str(tmp_path / "collector.lock")
+    holder = subprocess.Popen([sys.executable, "-c", textwrap.dedent(f"""
+        import sys, time
+        from app.embedded_collector import CollectorElection
+        assert CollectorElection({path!r}).try_acquire()
+        print("held", flush=True)
+        time.sleep(60)
+    """)], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        election = CollectorElection(path)
+        assert not election.try_acquire()
+    finally:
+        holder.kill()
+        holder.wait()
+        holder.stdout.close()
+
+    assert election.try_acquire()
+    election.release()
+
+
+def collect(db, balance_gb, timestamp):
+    records = [{
+        "subscriber_id": "sub-1",
+        "plan_id": "plan-1",
+        "plan_name": "1 Month Unlimited",
+        "remaining_balance_gb": balance_gb,
+        "remaining_balance_bytes": int(balance_gb * GB),
+        "total_data_usage_bytes": 0,
+        "expires_in_days": 20,
+        "is_active": True,
+        "is_home_plan": True,
+    }]
+    ids = insert_readings(db, records, timestamp)
+    upsert_current_state(db, [dict(records[0], id=ids[0], timestamp=timestamp)])
+    db.commit()
+    record_heartbeat(success=True, records=1)
+
+
+def test_current_state_is_served_from_memory_until_a_collection(db, monkeypatch):
+    collect(db, 90, datetime(2024, 1, 1, 12, 0))
+    refresh_current_state()
+
+    def no_queries(self):
+        raise AssertionError("current_state was queried")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(SqlUsageStore, "_query_current_state", no_queries)
+        [reading] = SqlUsageStore(db).current_state()
+        assert reading.remaining_balance_bytes == 90 * GB
+
+        # Another collection makes the cached state stale
+        collect(db, 80, datetime(2024, 1, 1, 12, 15))
+        with pytest.raises(AssertionError):
+            SqlUsageStore(db).current_state()
+
+    refresh_current_state()
+    assert storage._current_state_cache is not None
+    [reading] = SqlUsageStore(db).current_state()
+    assert reading.remaining_balance_bytes == 80 * GB
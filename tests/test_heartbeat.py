@@ -0,0 +1,56 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import heartbeat
+from app.config import Config
+from app.heartbeat import readiness, record_heartbeat
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def fresh_heartbeat(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "HEARTBEAT_PATH", str(tmp_path / "collector_heartbeat.json"))
+    monkeypatch.setattr(Config, "HEARTBEAT_MAX_AGE_SECONDS", 2700)
+    monkeypatch.setattr(heartbeat, "_local", None)
+    monkeypatch.setattr(heartbeat, "_file_cache", (None, None))
+
+
+def test_not_ready_without_a_successful_collection():
+    client = TestClient(app)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "no_data"
+    assert response.headers["Cache-Control"] == "no-store"
+
+    record_heartbeat(success=False, error="login failed")
+    state = client.get("/health/ready").json()
+    assert (state["status"], state["consecutive_failures"], state["last_error"]) == ("no_data", 1, "login failed")
+
+
+def test_ready_after_success_and_through_a_failed_cycle():
+    record_heartbeat(success=True, records=3)
+    response = TestClient(app).get("/health/ready")
+    assert response.status_code == 200
+    assert (response.json()["status"], response.json()["records"]) == ("ok", 3)
+
+    record_heartbeat(success=False, error="timeout")
+    state = readiness()
+    assert (state["ready"], state["records"], state["consecutive_failures"]) == (True, 3, 1)
+
+
+def test_stale_heartbeat_from_another_process():
+    # Written by e.g. the scheduler container: only the file is shared
+    now = time.time()
+    with open(Config.HEARTBEAT_PATH, "w") as f:
+        json.dump({"pid": 1, "last_attempt": now - 60, "last_success": now - 3600, "records": 2,
+                   "consecutive_failures": 4, "last_error": "timeout"}, f)
+
+    response = TestClient(app).get("/health/ready")
+    assert response.status_code == 503
+    state = response.json()
+    assert state["status"] == "stale" and state["data_age_seconds"] >= 3600
+    assert readiness(max_age_seconds=7200)["ready"]
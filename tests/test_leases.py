@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.database import ApiLog, CollectionLease
+from app.leases import LeaseHeld, LeaseLost, acquire_lease, fence, release_lease
+
+
+def expire(db, account):
+    """Let the current lease run out, as if its holder had stalled"""
+    db.execute(update(CollectionLease).where(CollectionLease.account == account)
+               .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+
+
+def test_stalled_holder_is_fenced_out_after_takeover(db):
+    first = acquire_lease("254700000000", holder="worker-1")
+    with pytest.raises(LeaseHeld):
+        acquire_lease("254700000000", holder="worker-2")
+
+    expire(db, "254700000000")
+    second = acquire_lease("254700000000", holder="worker-2")
+    assert second.token == first.token + 1
+
+    # The stalled holder wakes up and tries to commit its cycle
+    db.add(ApiLog(endpoint="get_customer_bundle", method="GET", success=True))
+    with pytest.raises(LeaseLost):
+        fence(db, first)
+    db.rollback()
+    assert db.query(ApiLog).count() == 0
+
+    db.add(ApiLog(endpoint="get_customer_bundle", method="GET", success=True))
+    fence(db, second)
+    db.commit()
+    assert db.query(ApiLog).count() == 1
+
+    # Releasing the stale lease must not free the new holder's
+    release_lease(first)
+    with pytest.raises(LeaseHeld):
+        acquire_lease("254700000000", holder="worker-3")
+
+    release_lease(second)
+    assert acquire_lease("254700000000", holder="worker-3").token == second.token + 1
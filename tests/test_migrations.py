@@ -0,0 +1,130 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from app.database import (CurrentState, DataUsageRecord, Plan, RawResponse, Subscriber, create_tables, engine,
+                          insert_readings, to_epoch)
+from app.migrations import LEGACY_TABLE, has_legacy_current_state, is_legacy_layout, migrate_to_compact_schema
+
+LEGACY_DDL = """
+CREATE TABLE data_usage_records (
+    id INTEGER NOT NULL PRIMARY KEY,
+    timestamp DATETIME NOT NULL,
+    subscriber_id VARCHAR NOT NULL,
+    plan_name VARCHAR NOT NULL,
+    plan_id VARCHAR NOT NULL,
+    remaining_balance_gb FLOAT NOT NULL,
+    remaining_balance_bytes BIGINT NOT NULL,
+    total_data_usage_bytes BIGINT NOT NULL,
+    expires_in_days INTEGER NOT NULL,
+    is_active BOOLEAN NOT NULL,
+    is_home_plan BOOLEAN,
+    raw_response TEXT,
+    created_at DATETIME
+)
+"""
+
+GB = 1024 ** 3
+
+
+def legacy_row(row_id, timestamp, plan_id, balance_gb, raw_response):
+    return {
+        "id": row_id,
+        "timestamp": timestamp,
+        "subscriber_id": "sub-1",
+        "plan_name": f"Plan {plan_id}",
+        "plan_id": plan_id,
+        "remaining_balance_gb": balance_gb,
+        "remaining_balance_bytes": balance_gb * GB,
+        "total_data_usage_bytes": (100 - balance_gb) * GB,
+        "expires_in_days": 10,
+        "is_active": True,
+        "is_home_plan": plan_id == "A",
+        "raw_response": raw_response,
+        "created_at": timestamp,
+    }
+
+
+def test_legacy_rows_move_to_compact_layout(db):
+    first, second = datetime(2024, 1, 1, 12, 0), datetime(2024, 1, 1, 12, 15)
+    rows = [
+        legacy_row(1, first, "A", 90, '{"collection": 1}'),
+        legacy_row(2, first, "B", 5, '{"collection": 1}'),
+        legacy_row(5, second, "A", 89, '{"collection": 2}'),
+        legacy_row(6, second, "B", 5, None),
+    ]
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE data_usage_records"))
+        conn.execute(text(LEGACY_DDL))
+        conn.execute(text("CREATE INDEX ix_data_usage_records_timestamp ON data_usage_records (timestamp)"))
+        conn.execute(text(
+            "INSERT INTO data_usage_records VALUES (:id, :timestamp, :subscriber_id, :plan_name, :plan_id, "
+            ":remaining_balance_gb, :remaining_balance_bytes, :total_data_usage_bytes, :expires_in_days, "
+            ":is_active, :is_home_plan, :raw_response, :created_at)"
+        ), rows)
+    assert is_legacy_layout(engine)
+
+    assert migrate_to_compact_schema(engine, batch_size=3)
+    assert not is_legacy_layout(engine)
+    assert LEGACY_TABLE not in inspect(engine).get_table_names()
+
+    migrated = db.query(DataUsageRecord).order_by(DataUsageRecord.id).all()
+    assert [r.id for r in migrated] == [1, 2, 5, 6]
+    assert [(r.plan_id, r.plan_name, r.subscriber_id) for r in migrated] == [
+        (row["plan_id"], row["plan_name"], "sub-1") for row in rows
+    ]
+    assert [r.timestamp for r in migrated] == [to_epoch(row["timestamp"]) for row in rows]
+    assert [r.remaining_balance_bytes for r in migrated] == [row["remaining_balance_bytes"] for row in rows]
+    assert [r.is_home_plan for r in migrated] == [True, False, True, False]
+
+    # Strings become dimension rows; a collection's payload is stored once
+    assert db.query(Subscriber).count() == 1
+    assert db.query(Plan).count() == 2
+    assert db.query(RawResponse).count() == 2
+    assert migrated[0].response_id == migrated[1].response_id != migrated[2].response_id
+    assert migrated[3].response_id is None
+
+    # New readings continue after the migrated ids
+    db.add(DataUsageRecord(timestamp=to_epoch(datetime(2024, 1, 1, 12, 30)), plan_key=migrated[0].plan_key,
+                           remaining_balance_bytes=0, total_data_usage_bytes=0, expires_in_days=0,
+                           is_active=True))
+    db.commit()
+    assert db.query(DataUsageRecord.id).order_by(DataUsageRecord.id.desc()).first()[0] == 7
+
+    assert not migrate_to_compact_schema(engine)
+
+
+LEGACY_CURRENT_STATE_DDL = """
+CREATE TABLE current_state (
+    subscriber_id VARCHAR NOT NULL,
+    plan_id VARCHAR NOT NULL,
+    record_id INTEGER NOT NULL,
+    timestamp DATETIME NOT NULL,
+    plan_name VARCHAR NOT NULL,
+    remaining_balance_gb FLOAT NOT NULL,
+    remaining_balance_bytes BIGINT NOT NULL,
+    total_data_usage_bytes BIGINT NOT NULL,
+    expires_in_days INTEGER NOT NULL,
+    is_active BOOLEAN NOT NULL,
+    is_home_plan BOOLEAN,
+    PRIMARY KEY (subscriber_id, plan_id)
+)
+"""
+
+
+def test_legacy_current_state_is_rebuilt_in_compact_layout(db):
+    timestamp = datetime(2024, 1, 1, 12, 0)
+    record = {key: value for key, value in legacy_row(1, timestamp, "A", 90, "{}").items()
+              if key not in ("id", "timestamp", "created_at")}
+    [record_id] = insert_readings(db, [record], timestamp)
+    db.commit()
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE current_state"))
+        conn.execute(text(LEGACY_CURRENT_STATE_DDL))
+    assert has_legacy_current_state(engine)
+
+    create_tables()
+
+    assert not has_legacy_current_state(engine)
+    [row] = db.query(CurrentState).all()
+    assert (row.record_id, row.timestamp, row.remaining_balance_bytes) == (record_id, to_epoch(timestamp), 90 * GB)
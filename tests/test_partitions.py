@@ -0,0 +1,100 @@
+import textwrap
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import pytest
+
+from app import partitions
+from app.config import Config
+from app.database import ApiLog, postgres_pool_settings
+
+
+class RecordingConnection:
+    """Stands in for a PostgreSQL connection: records SQL, reports tables as partitioned"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self
+
+    def scalar(self):
+        return "p"
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+
+def test_pool_budget_covers_every_process(monkeypatch):
+    monkeypatch.setattr(Config, "MAX_CONNECTIONS", 100)
+    monkeypatch.setattr(Config, "WORKERS", 2)
+    monkeypatch.setattr(Config, "DB_OTHER_PROCESSES", 3)
+    monkeypatch.setattr(Config, "DB_RESERVED_CONNECTIONS", 5)
+
+    settings = postgres_pool_settings()
+    per_process = settings["pool_size"] + settings["max_overflow"]
+    assert (settings["pool_size"], per_process) == (9, 19)
+    assert per_process * (2 + 3) <= 100 - 5
+
+    monkeypatch.setattr(Config, "MAX_CONNECTIONS", 10)
+    settings = postgres_pool_settings()
+    assert settings["pool_size"] + settings["max_overflow"] == 2
+
+
+def test_partition_ddl_covers_each_month_across_year_end():
+    conn = RecordingConnection()
+
+    names = partitions._create_partitions(conn, "data_usage_records", date(2025, 11, 1), date(2026, 1, 1))
+    assert names == ["data_usage_records_p202511", "data_usage_records_p202512", "data_usage_records_p202601"]
+    assert conn.statements[1] == (
+        "CREATE TABLE IF NOT EXISTS data_usage_records_p202512 PARTITION OF data_usage_records "
+        "FOR VALUES FROM (1764547200) TO (1767225600)"
+    )
+
+    partitions._create_partitions(conn, "api_logs", date(2025, 12, 1), date(2025, 12, 1))
+    assert conn.statements[-1].endswith("FOR VALUES FROM ('2025-12-01') TO ('2026-01-01')")
+
+
+def test_ensure_partitions_takes_the_advisory_lock_first():
+    conn = RecordingConnection()
+    partitions.ensure_partitions(conn, months_ahead=0)
+    assert "pg_advisory_xact_lock" in conn.statements[0]
+
+
+def test_api_log_timestamp_is_set_in_utc(db):
+    db.add(ApiLog(endpoint="/bundle", method="GET", success=True))
+    db.commit()
+    assert abs((db.query(ApiLog.timestamp).scalar() - datetime.utcnow()).total_seconds()) < 60
+
+
+@pytest.mark.postgres
+def test_concurrent_ensure_partitions_and_api_log_partition(run_on_postgres):
+    output = run_on_postgres(textwrap.dedent("""
+        from concurrent.futures import ThreadPoolExecutor
+        from datetime import datetime
+
+        from sqlalchemy import text
+
+        from app.database import ApiLog, Base, SessionLocal, engine
+        from app.partitions import ensure_partitions, list_partitions, month_start, partition_name
+
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda _: ensure_partitions(engine, months_ahead=12), range(8)))
+        print(len(list_partitions(engine, "api_logs")))
+
+        # A session far from UTC must not move the row into another month
+        db = SessionLocal()
+        db.execute(text("SET TIME ZONE 'Pacific/Kiritimati'"))
+        db.add(ApiLog(endpoint="/bundle", method="GET", success=True))
+        db.commit()
+        print(db.execute(text("SELECT tableoid::regclass FROM api_logs")).scalar())
+        print(partition_name("api_logs", month_start(datetime.utcnow())))
+        db.close()
+    """)).split()
+
+    assert output[0] == "13"
+    assert output[1] == output[2]
@@ -0,0 +1,67 @@
+import logging
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.config import Config
+from app.profiling import TimedJSONResponse, install_profiling, timed
+
+
+def profiled_app(tmp_path, monkeypatch, slow_query_ms):
+    monkeypatch.setattr(Config, "SLOW_QUERY_MS", slow_query_ms)
+    monkeypatch.setattr(Config, "PROFILE_SAMPLE_INTERVAL_MS", 1)
+    engine = create_engine(f"sqlite:///{tmp_path / 'profiling.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE readings (id INTEGER PRIMARY KEY, balance INTEGER)"))
+        conn.execute(text("INSERT INTO readings (balance) VALUES (1), (2), (3)"))
+
+    app = FastAPI(default_response_class=TimedJSONResponse)
+    install_profiling(app, engine)
+
+    @app.get("/readings")
+    def readings():
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT balance FROM readings WHERE balance > :low"), {"low": 1}).all()
+        with timed("render"):
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+        return {"balances": [row.balance for row in rows]}
+
+    return TestClient(app)
+
+
+def phases(header):
+    return {part.split(";dur=")[0]: float(part.split(";dur=")[1]) for part in header.split(", ")}
+
+
+def test_server_timing_books_each_phase(tmp_path, monkeypatch):
+    client = profiled_app(tmp_path, monkeypatch, slow_query_ms=10_000)
+
+    response = client.get("/readings")
+    assert response.json() == {"balances": [2, 3]}
+    timing = phases(response.headers["Server-Timing"])
+    assert set(timing) == {"db", "serialize", "render", "total"}
+    assert timing["render"] >= 50
+    assert timing["total"] >= timing["db"] + timing["render"]
+
+
+def test_profile_samples_the_threadpool_handler(tmp_path, monkeypatch):
+    client = profiled_app(tmp_path, monkeypatch, slow_query_ms=10_000)
+
+    response = client.get("/readings?profile=1")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["X-Profile-Samples"]) > 0
+    assert "readings (" in response.text
+
+
+def test_slow_queries_are_logged_with_their_plan(tmp_path, monkeypatch, caplog):
+    client = profiled_app(tmp_path, monkeypatch, slow_query_ms=0)
+
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        client.get("/readings")
+    [slow] = [r.getMessage() for r in caplog.records if "FROM readings WHERE" in r.getMessage()]
+    assert slow.startswith("Slow query (")
+    assert "SCAN" in slow.split("\n", 1)[1]
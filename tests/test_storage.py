@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from app import storage
+from app.config import Config
+from app.database import insert_readings, rebuild_current_state, upsert_current_state
+from app.storage import ColumnarUsageStore, SqlUsageStore, append_committed
+
+GB = 1024 ** 3
+
+
+def reading(subscriber_id, plan_id, balance_gb, is_active=True):
+    return {
+        "subscriber_id": subscriber_id,
+        "plan_id": plan_id,
+        "plan_name": f"Plan {plan_id}",
+        "remaining_balance_gb": balance_gb,
+        "remaining_balance_bytes": int(balance_gb * GB),
+        "total_data_usage_bytes": int((100 - balance_gb) * GB),
+        "expires_in_days": 10,
+        "is_active": is_active,
+        "is_home_plan": plan_id == "A",
+    }
+
+
+def collect(db, store, records, timestamp):
+    """What a collection cycle does with each store"""
+    ids = insert_readings(db, records, timestamp)
+    committed = [dict(record, id=record_id, timestamp=timestamp) for record, record_id in zip(records, ids)]
+    upsert_current_state(db, committed)
+    db.commit()
+    store.append(committed)
+
+
+def test_current_state_matches_between_sql_and_columnar(db, tmp_path):
+    columnar = ColumnarUsageStore(str(tmp_path / "columnar"))
+
+    collect(db, columnar, [reading("sub-1", "A", 90), reading("sub-1", "B", 5), reading("sub-2", "C", 50)],
+            datetime(2024, 1, 1, 12, 0))
+    # B drops out of sub-1's response; sub-2 isn't collected this time
+    collect(db, columnar, [reading("sub-1", "A", 89), reading("sub-1", "D", 20, is_active=False)],
+            datetime(2024, 1, 1, 12, 15))
+    collect(db, columnar, [reading("sub-1", "A", 88), reading("sub-1", "D", 20, is_active=False)],
+            datetime(2024, 1, 1, 12, 30))
+
+    sql_state = SqlUsageStore(db).current_state()
+    assert [(r.subscriber_id, r.plan_id) for r in sql_state] == [("sub-1", "A"), ("sub-2", "C")]
+    assert columnar.current_state() == sql_state
+
+    rebuilt = ColumnarUsageStore.rebuild(str(tmp_path / "rebuilt"), db)
+    assert rebuilt.current_state() == sql_state
+
+    rebuild_current_state(db)
+    assert SqlUsageStore(db).current_state() == sql_state
+
+
+def test_plans_sharing_a_timestamp_order_newest_record_first(db, tmp_path):
+    columnar = ColumnarUsageStore(str(tmp_path / "columnar"))
+    collect(db, columnar, [reading("sub-1", "A", 90), reading("sub-1", "B", 5)], datetime(2024, 1, 1, 12, 0))
+
+    sql_state = SqlUsageStore(db).current_state()
+    assert [r.plan_id for r in sql_state] == ["B", "A"]
+    assert columnar.current_state() == sql_state
+
+
+def test_failed_append_marks_store_and_next_cycle_rebuilds(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "STORAGE_BACKEND", "columnar")
+    monkeypatch.setattr(Config, "COLUMNAR_STORAGE_PATH", str(tmp_path / "columnar"))
+    monkeypatch.setattr(storage, "_columnar_store", None)
+
+    def commit(records, timestamp):
+        ids = insert_readings(db, records, timestamp)
+        db.commit()
+        return [dict(record, id=record_id, timestamp=timestamp) for record, record_id in zip(records, ids)]
+
+    assert append_committed(db, commit([reading("sub-1", "A", 90)], datetime(2024, 1, 1, 12, 0)))
+
+    def disk_full(self, records):
+        raise OSError("No space left on device")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ColumnarUsageStore, "append", disk_full)
+        assert not append_committed(db, commit([reading("sub-1", "A", 89)], datetime(2024, 1, 1, 12, 15)))
+    assert storage._columnar_store.needs_rebuild
+
+    assert append_committed(db, commit([reading("sub-1", "A", 88)], datetime(2024, 1, 1, 12, 30)))
+    store = storage._columnar_store
+    assert not store.needs_rebuild
+    [series] = store.series_since(datetime(2024, 1, 1))
+    assert [reading.remaining_balance_gb for reading in map(series.reading, range(len(series)))] == [90, 89, 88]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark the typed bundle parser against the original nested-scan parser
+on synthetic responses with growing purchase histories
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.bundle_parser import bundle_to_records
+from tools.taara_simulator import SimulatorSettings, TaaraSimulator
+
+
+def legacy_parse_bundle_data(bundle_response: dict) -> list:
+    """The pre-typed parser: rescans history and re-serializes the payload per plan"""
+    parsed_data = []
+    data = bundle_response.get("data", {})
+    subscriber_id = data.get("subscriberId", "")
+    for plan in data.get("subscriberActiveAndUnusedPlans", []):
+        remaining_balance_str = plan.get("remainingBalance", "0 GB")
+        remaining_balance_gb = 0
+        remaining_balance_bytes = 0
+        if "GB" in remaining_balance_str:
+            remaining_balance_gb = float(remaining_balance_str.replace("GB", "").strip())
+            remaining_balance_bytes = int(remaining_balance_gb * 1024 * 1024 * 1024)
+        elif "MB" in remaining_balance_str:
+            remaining_balance_mb = float(remaining_balance_str.replace("MB", "").strip())
+            remaining_balance_gb = remaining_balance_mb / 1024
+            remaining_balance_bytes = int(remaining_balance_mb * 1024 * 1024)
+
+        expires_in_days = int(plan.get("expiresIn", "0 days").replace("days", "").strip())
+
+        total_data_usage_bytes = 0
+        for history in data.get("purchasedHistory", []):
+            for history_plan in history.get("purchasedHistoryPlans", []):
+                if history_plan.get("planDisplayName") == plan.get("planName"):
+                    total_data_usage_bytes = history_plan.get("dataUsage", {}).get("totalDataUsage", 0)
+                    break
+
+        parsed_data.append({
+            "subscriber_id": subscriber_id,
+            "plan_name": plan.get("planName", ""),
+            "plan_id": plan.get("planId", ""),
+            "remaining_balance_gb": remaining_balance_gb,
+            "remaining_balance_bytes": remaining_balance_bytes,
+            "total_data_usage_bytes": total_data_usage_bytes,
+            "expires_in_days": expires_in_days,
+            "is_active": plan.get("isActive", False),
+            "is_home_plan": plan.get("isHomePlan", False),
+            "raw_response": json.dumps(bundle_response),
+        })
+    return parsed_data
+
+
+def build_response(history_months: int, plans_per_purchase: int, active_plans: int) -> dict:
+    settings = SimulatorSettings(
+        accounts=1,
+        history_months=history_months,
+        plans_per_purchase=plans_per_purchase,
+    )
+    sim = TaaraSimulator(settings)
+    account = next(iter(sim.accounts_by_phone.values()))
+    # Widen the active plan list by repeating the catalogue entries
+    account.active_plans = [dict(p) for _ in range(active_plans) for p in account.active_plans][:active_plans]
+    return sim.bundle_payload(account)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bundle parsing")
+    parser.add_argument("--active-plans", type=int, default=4)
+    parser.add_argument("--plans-per-purchase", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'history':>8} {'payload KB':>11} {'legacy ms':>10} {'typed ms':>9} {'speedup':>8}")
+    for months in (12, 120, 1200, 6000):
+        response = build_response(months, args.plans_per_purchase, args.active_plans)
+        payload_kb = len(json.dumps(response)) / 1024
+        number = max(1, 2000 // months)
+
+        legacy = min(timeit.repeat(lambda: legacy_parse_bundle_data(response),
+                                   number=number, repeat=args.repeat)) / number
+        typed = min(timeit.repeat(lambda: bundle_to_records(response),
+                                  number=number, repeat=args.repeat)) / number
+
+        print(f"{months:>8} {payload_kb:>11.0f} {legacy * 1000:>10.2f} "
+              f"{typed * 1000:>9.2f} {legacy / typed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
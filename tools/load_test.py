@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Collector load-test harness
+Drives DataCollector for many simulated accounts against the local Taara API
+simulator and reports cycle time, upstream calls per second and failures
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Keep load-test rows out of the real database
+os.environ.setdefault("DATABASE_URL", "sqlite:///./data/load_test.db")
+# ...and its cycles out of the real heartbeat, columnar store, proxy cache and alert channels
+_scratch = tempfile.mkdtemp(prefix="taara-load-test-")
+os.environ["HEARTBEAT_PATH"] = os.path.join(_scratch, "collector_heartbeat.json")
+os.environ["COLUMNAR_STORAGE_PATH"] = os.path.join(_scratch, "columnar")
+os.environ["PROXY_CACHE_REFRESH_URL"] = ""
+os.environ["ALERTS_ENABLED"] = "False"
+
+import requests
+
+from app.database import SessionLocal, ApiLog, create_tables
+from app.data_collector import DataCollector
+from app.taara_api import TaaraAPI
+from tools.taara_simulator import SimulatorSettings, create_app
+
+
+def start_embedded_simulator(settings: SimulatorSettings, port: int) -> str:
+    """Run the simulator with uvicorn in a daemon thread and wait until it answers"""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(settings), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/_sim/stats", timeout=1)
+            return base_url
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError("Simulator did not start")
+
+
+def simulator_stats(base_url: str) -> dict:
+    try:
+        return requests.get(f"{base_url}/_sim/stats", timeout=5).json()
+    except requests.RequestException:
+        return {}
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def expire_sessions(collectors, pool: ThreadPoolExecutor, base_url: str):
+    """
+    Log every collector in, then expire the tokens it holds on the simulator,
+    so the next collection is rejected with 401 and has to log in again
+    """
+    list(pool.map(lambda collector: collector.api.login(), collectors))
+    requests.post(f"{base_url}/_sim/expire-tokens", timeout=5).raise_for_status()
+
+
+def run_collection(collector: DataCollector) -> tuple:
+    start = time.perf_counter()
+    try:
+        success = collector.collect_data()
+    except Exception:
+        success = False
+    return success, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test DataCollector against the Taara simulator")
+    parser.add_argument("--base-url", help="Use an already running simulator instead of starting one")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--passcode", default=SimulatorSettings.passcode)
+    parser.add_argument("--partner-id", default=SimulatorSettings.partner_id)
+    parser.add_argument("--phone-prefix", type=int, default=SimulatorSettings.phone_prefix)
+    parser.add_argument("--latency-ms", type=float, default=SimulatorSettings.latency_ms)
+    parser.add_argument("--error-rate", type=float, default=SimulatorSettings.error_rate)
+    parser.add_argument("--token-ttl", type=int, default=SimulatorSettings.token_ttl_seconds)
+    parser.add_argument("--history-months", type=int, default=SimulatorSettings.history_months)
+    parser.add_argument("--scenario", choices=["steady", "token-expiry"], default="steady",
+                        help="token-expiry: sessions expire before every round, exercising re-login")
+    parser.add_argument("--verbose", action="store_true", help="Keep collector INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("app").setLevel(logging.WARNING)
+        if args.scenario == "token-expiry":
+            # Every collection logs the rejected token; the summary counts them
+            logging.getLogger("app.taara_api").setLevel(logging.ERROR)
+
+    create_tables()
+
+    base_url = args.base_url
+    if not base_url:
+        settings = SimulatorSettings(
+            accounts=args.accounts,
+            passcode=args.passcode,
+            partner_id=args.partner_id,
+            phone_prefix=args.phone_prefix,
+            latency_ms=args.latency_ms,
+            error_rate=args.error_rate,
+            token_ttl_seconds=args.token_ttl,
+            history_months=args.history_months,
+        )
+        base_url = start_embedded_simulator(settings, args.port)
+
+    collectors = [
+        DataCollector(api=TaaraAPI(
+            phone_country_code="254",
+            phone_number=str(args.phone_prefix + index),
+            passcode=args.passcode,
+            partner_id=args.partner_id,
+            hotspot_id=SimulatorSettings.hotspot_id,
+            base_url=base_url,
+        ))
+        for index in range(args.accounts)
+    ]
+
+    db = SessionLocal()
+    first_log_id = db.query(ApiLog.id).order_by(ApiLog.id.desc()).limit(1).scalar() or 0
+    db.close()
+
+    print(f"Load test: {args.accounts} accounts x {args.rounds} rounds, "
+          f"concurrency {args.concurrency}, scenario {args.scenario}, simulator {base_url}")
+    print(f"Database: {os.environ['DATABASE_URL']}")
+    print()
+
+    stats_before = simulator_stats(base_url)
+    all_latencies = []
+    total_ok = total_failed = 0
+    test_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for round_number in range(1, args.rounds + 1):
+            if args.scenario == "token-expiry":
+                expire_sessions(collectors, pool, base_url)
+            round_start = time.perf_counter()
+            results = list(pool.map(run_collection, collectors))
+            cycle_seconds = time.perf_counter() - round_start
+
+            latencies = [latency for _, latency in results]
+            ok = sum(1 for success, _ in results if success)
+            all_latencies.extend(latencies)
+            total_ok += ok
+            total_failed += len(results) - ok
+
+            print(f"Round {round_number}: cycle {cycle_seconds:.2f}s, "
+                  f"ok {ok}/{len(results)}, "
+                  f"p50 {percentile(latencies, 50):.0f}ms, "
+                  f"p95 {percentile(latencies, 95):.0f}ms, "
+                  f"max {max(latencies):.0f}ms")
+
+    elapsed = time.perf_counter() - test_start
+    stats_after = simulator_stats(base_url)
+
+    print()
+    print("Summary")
+    print(f"  collections:      {total_ok + total_failed} ({total_failed} failed)")
+    print(f"  total time:       {elapsed:.2f}s")
+    print(f"  collections/sec:  {(total_ok + total_failed) / elapsed:.1f}")
+    print(f"  latency mean:     {statistics.mean(all_latencies):.0f}ms")
+    print(f"  latency p99:      {percentile(all_latencies, 99):.0f}ms")
+
+    if stats_after:
+        before = stats_before.get("requests", {})
+        calls = {k: v - before.get(k, 0) for k, v in stats_after.get("requests", {}).items()}
+        total_calls = sum(calls.values())
+        print(f"  upstream calls:   {total_calls} ({total_calls / elapsed:.1f}/sec)")
+        for endpoint, count in sorted(calls.items()):
+            print(f"    {endpoint:<22}{count}")
+        for key in ("injected_errors", "expired_tokens", "auth_failures"):
+            print(f"  {key.replace('_', ' ') + ':':<18}{stats_after.get(key, 0) - stats_before.get(key, 0)}")
+
+    # Failure behaviour as the collector recorded it
+    db = SessionLocal()
+    try:
+        failures = db.query(ApiLog.endpoint, ApiLog.error_message).filter(
+            ApiLog.id > first_log_id,
+            ApiLog.success == False
+        ).all()
+    finally:
+        db.close()
+
+    if failures:
+        print()
+        print("Logged API failures")
+        reasons = Counter((endpoint, (message or "")[:60]) for endpoint, message in failures)
+        for (endpoint, message), count in reasons.most_common(10):
+            print(f"  {count:>5}  {endpoint}: {message}")
+
+
+if __name__ == "__main__":
+    main()
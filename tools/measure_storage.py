@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Storage layout measurement
+Builds (or copies) a SQLite database in the original data_usage_records
+layout, migrates a copy to the compact layout and reports row size, index
+size and range-scan time for both
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.bundle_parser import bundle_to_records
+from tools.taara_simulator import SimulatorSettings, TaaraSimulator
+
+# data_usage_records as created before the compact layout
+LEGACY_SCHEMA = """
+CREATE TABLE data_usage_records (
+    id INTEGER NOT NULL PRIMARY KEY,
+    timestamp DATETIME NOT NULL,
+    subscriber_id VARCHAR NOT NULL,
+    plan_name VARCHAR NOT NULL,
+    plan_id VARCHAR NOT NULL,
+    remaining_balance_gb FLOAT NOT NULL,
+    remaining_balance_bytes BIGINT NOT NULL,
+    total_data_usage_bytes BIGINT NOT NULL,
+    expires_in_days INTEGER NOT NULL,
+    is_active BOOLEAN NOT NULL,
+    is_home_plan BOOLEAN,
+    raw_response TEXT,
+    created_at DATETIME
+);
+CREATE INDEX ix_data_usage_records_id ON data_usage_records (id);
+CREATE INDEX ix_data_usage_records_timestamp ON data_usage_records (timestamp);
+"""
+
+LEGACY_SCAN = (
+    "SELECT id, timestamp, subscriber_id, plan_id, plan_name, remaining_balance_bytes, "
+    "total_data_usage_bytes, expires_in_days, is_active, is_home_plan FROM data_usage_records "
+    "WHERE is_active = 1 AND timestamp >= ? ORDER BY timestamp"
+)
+COMPACT_SCAN = (
+    "SELECT plan_key, id, timestamp, remaining_balance_bytes, total_data_usage_bytes, "
+    "expires_in_days, is_active, is_home_plan FROM data_usage_records "
+    "WHERE is_active = 1 AND timestamp >= ? ORDER BY timestamp"
+)
+
+HISTORY_TABLES = ("data_usage_records",)
+SIDE_TABLES = ("raw_responses", "plans", "subscribers")
+
+
+def build_legacy_database(path: str, accounts: int, days: int, interval_minutes: int, history_months: int):
+    """Fill a legacy-layout database with simulated collections"""
+    simulator = TaaraSimulator(SimulatorSettings(accounts=accounts, history_months=history_months))
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+
+    start = datetime.utcnow() - timedelta(days=days)
+    ticks = days * 24 * 60 // interval_minutes
+    for tick in range(ticks):
+        timestamp = (start + timedelta(minutes=tick * interval_minutes)).isoformat(sep=" ", timespec="microseconds")
+        rows = []
+        for account in simulator.accounts_by_id.values():
+            for record in bundle_to_records(simulator.bundle_payload(account)):
+                rows.append((
+                    timestamp, record["subscriber_id"], record["plan_name"], record["plan_id"],
+                    record["remaining_balance_gb"], record["remaining_balance_bytes"],
+                    record["total_data_usage_bytes"], record["expires_in_days"], record["is_active"],
+                    record["is_home_plan"], record["raw_response"], timestamp,
+                ))
+        conn.executemany(
+            "INSERT INTO data_usage_records (timestamp, subscriber_id, plan_name, plan_id, remaining_balance_gb, "
+            "remaining_balance_bytes, total_data_usage_bytes, expires_in_days, is_active, is_home_plan, "
+            "raw_response, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    conn.commit()
+    conn.close()
+
+
+def table_sizes(conn: sqlite3.Connection) -> dict:
+    """Bytes per table/index from the dbstat virtual table"""
+    return {
+        name: {"bytes": size, "payload": payload}
+        for name, size, payload in conn.execute(
+            "SELECT name, SUM(pgsize), SUM(payload) FROM dbstat GROUP BY name"
+        )
+    }
+
+
+def measure(path: str, scan_sql: str, since, repeat: int) -> dict:
+    conn = sqlite3.connect(path)
+    sizes = table_sizes(conn)
+    indexes = {
+        name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN (%s)"
+            % ",".join("?" * len(HISTORY_TABLES)), HISTORY_TABLES
+        )
+    }
+    rows = conn.execute("SELECT COUNT(*) FROM data_usage_records").fetchone()[0]
+
+    timings = []
+    scanned = 0
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        scanned = len(conn.execute(scan_sql, (since,)).fetchall())
+        timings.append((time.perf_counter() - begin) * 1000)
+    conn.close()
+
+    history = sum(sizes.get(name, {}).get("bytes", 0) for name in HISTORY_TABLES)
+    payload = sum(sizes.get(name, {}).get("payload", 0) for name in HISTORY_TABLES)
+    return {
+        "rows": rows,
+        "history_bytes": history,
+        "bytes_per_row": history / rows if rows else 0,
+        "payload_per_row": payload / rows if rows else 0,
+        "index_bytes": sum(sizes[name]["bytes"] for name in indexes if name in sizes),
+        "side_bytes": sum(sizes.get(name, {}).get("bytes", 0) for name in SIDE_TABLES),
+        "file_bytes": os.path.getsize(path),
+        "scan_rows": scanned,
+        "scan_ms": statistics.median(timings),
+    }
+
+
+def vacuum(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def print_report(before: dict, after: dict, scan_days: int):
+    def mb(value):
+        return f"{value / 1024 / 1024:.2f} MB"
+
+    lines = [
+        ("rows", before["rows"], after["rows"], str),
+        ("history bytes/row", before["bytes_per_row"], after["bytes_per_row"], lambda v: f"{v:.1f}"),
+        ("history payload/row", before["payload_per_row"], after["payload_per_row"], lambda v: f"{v:.1f}"),
+        ("history table", before["history_bytes"], after["history_bytes"], mb),
+        ("history indexes", before["index_bytes"], after["index_bytes"], mb),
+        ("raw/dimension tables", before["side_bytes"], after["side_bytes"], mb),
+        ("database file", before["file_bytes"], after["file_bytes"], mb),
+        (f"range scan ({scan_days}d, {after['scan_rows']} rows)", before["scan_ms"], after["scan_ms"],
+         lambda v: f"{v:.2f} ms"),
+    ]
+    print(f"\n{'':34}{'legacy':>16}{'compact':>16}{'ratio':>10}")
+    for label, old, new, fmt in lines:
+        ratio = f"{new / old:.2f}x" if old else ""
+        print(f"{label:34}{fmt(old):>16}{fmt(new):>16}{ratio:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy and compact data_usage_records layouts")
+    parser.add_argument("--database", help="Existing legacy-layout SQLite database to copy instead of generating one")
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval-minutes", type=int, default=15)
+    parser.add_argument("--history-months", type=int, default=3)
+    parser.add_argument("--scan-days", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="taara-measure-")
+    legacy_path = os.path.join(workdir, "legacy.db")
+    compact_path = os.path.join(workdir, "compact.db")
+    try:
+        if args.database:
+            shutil.copyfile(args.database, legacy_path)
+        else:
+            print(f"Generating {args.accounts} accounts x {args.days} days every {args.interval_minutes} min...")
+            build_legacy_database(legacy_path, args.accounts, args.days, args.interval_minutes, args.history_months)
+        vacuum(legacy_path)
+        shutil.copyfile(legacy_path, compact_path)
+
+        # Migrate the copy with the application's own migration
+        os.environ["DATABASE_URL"] = f"sqlite:///{compact_path}"
+        from app.database import engine, to_epoch
+        from app.migrations import migrate_to_compact_schema
+
+        begin = time.perf_counter()
+        migrate_to_compact_schema(engine)
+        print(f"Migration took {time.perf_counter() - begin:.1f}s")
+        engine.dispose()
+        vacuum(compact_path)
+
+        since = datetime.utcnow() - timedelta(days=args.scan_days)
+        before = measure(legacy_path, LEGACY_SCAN, since.isoformat(sep=" ", timespec="microseconds"), args.repeat)
+        after = measure(compact_path, COMPACT_SCAN, to_epoch(since), args.repeat)
+        print_report(before, after, args.scan_days)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
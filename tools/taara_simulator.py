@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Local simulator of the Taara share API
+Serves login, get-customer-bundle, GetHotspotConfig and logout so the
+client and collector can be load-tested without touching share.taara.company
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import secrets
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+PLAN_CATALOG = [
+    # (display name, icon, allowance in GB, validity in days, price in KES)
+    ("1 Month Unlimited", "home", 1000.0, 30, 2500),
+    ("1 Week 50 GB", "", 50.0, 7, 500),
+    ("1 Day 5 GB", "", 5.0, 1, 100),
+    ("500 MB Free Trial", "", 0.48828125, 30, 0),
+]
+
+
+@dataclass
+class SimulatorSettings:
+    """Behaviour knobs for the simulator"""
+    accounts: int = 100
+    passcode: str = "123456"
+    partner_id: str = "sim-partner"
+    hotspot_id: str = "sim-hotspot"
+    phone_prefix: int = 700000000
+    latency_ms: float = 50.0
+    latency_jitter_ms: float = 25.0
+    error_rate: float = 0.0
+    token_ttl_seconds: int = 3600
+    history_months: int = 12
+    plans_per_purchase: int = 2
+    seed: int = 42
+
+
+@dataclass
+class SimulatedAccount:
+    """One subscriber with a deterministic purchase history"""
+    phone_number: str
+    subscriber_id: str
+    active_plans: List[dict]
+    purchased_history: List[dict]
+    usage_per_call_bytes: int
+    calls: int = 0
+
+
+@dataclass
+class SimulatorStats:
+    """Request counters exposed on /_sim/stats"""
+    requests: Dict[str, int] = field(default_factory=dict)
+    injected_errors: int = 0
+    expired_tokens: int = 0
+    auth_failures: int = 0
+
+    def count(self, endpoint: str):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+
+def format_balance(balance_bytes: int) -> str:
+    """Format a byte count the way the real API does ("885.1 GB", "500.0 MB")"""
+    gb = balance_bytes / (1024 ** 3)
+    if gb >= 1:
+        return f"{gb:.1f} GB"
+    return f"{balance_bytes / (1024 ** 2):.1f} MB"
+
+
+def build_account(index: int, settings: SimulatorSettings) -> SimulatedAccount:
+    """Generate an account with realistic active plans and purchase history"""
+    rng = random.Random(settings.seed * 1_000_003 + index)
+    subscriber_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    now = datetime.utcnow()
+
+    purchased_history = []
+    for month in range(settings.history_months):
+        purchased_at = now - timedelta(days=30 * month + rng.randint(0, 5))
+        plans = []
+        for _ in range(settings.plans_per_purchase):
+            name, _icon, allowance_gb, _days, price = rng.choice(PLAN_CATALOG)
+            plans.append({
+                "_id": f"{rng.getrandbits(96):024x}",
+                "hotspotName": "Simulated Tower",
+                "planDisplayName": name,
+                "resellerPrice": {"currencyCode": "KES", "units": price, "nanos": 0},
+                "isRewardPlan": price == 0,
+                "dataUsage": {"totalDataUsage": int(allowance_gb * 1e9 * rng.uniform(0.1, 1.0))},
+                "historyType": "HISTORY_TYPE_PURCHASED_PLAN",
+            })
+        date_str = purchased_at.strftime("%m/%d/%Y")
+        purchased_history.append({
+            "purchasedAt": date_str,
+            "purchasedHistoryPlans": plans,
+            "historyDate": date_str,
+        })
+
+    active_plans = []
+    for position, (name, icon, allowance_gb, days, _price) in enumerate(PLAN_CATALOG[:2]):
+        active_plans.append({
+            "isActive": position == 0,
+            "planId": f"{rng.getrandbits(96):024x}",
+            "planName": name,
+            "planIconName": icon,
+            "remainingBytes": int(allowance_gb * rng.uniform(0.3, 1.0) * 1024 ** 3),
+            "expiresAt": now + timedelta(days=rng.randint(1, days)),
+            "isHomePlan": icon == "home",
+        })
+
+    return SimulatedAccount(
+        phone_number=str(settings.phone_prefix + index),
+        subscriber_id=subscriber_id,
+        active_plans=active_plans,
+        purchased_history=purchased_history,
+        usage_per_call_bytes=rng.randint(50, 500) * 1024 ** 2,
+    )
+
+
+def encode_token(subscriber_id: str, expires_at: float) -> str:
+    """Build an unsigned JWT-shaped token carrying the subscriber ID in "sub" """
+    def b64(obj: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+
+    header = b64({"alg": "none", "typ": "JWT"})
+    payload = b64({"sub": subscriber_id, "exp": int(expires_at), "jti": secrets.token_hex(8)})
+    return f"{header}.{payload}.{secrets.token_urlsafe(16)}"
+
+
+class TaaraSimulator:
+    """In-memory state behind the simulated endpoints"""
+
+    def __init__(self, settings: SimulatorSettings):
+        self.settings = settings
+        self.stats = SimulatorStats()
+        self.rng = random.Random(settings.seed)
+        self.lock = threading.Lock()
+        self.accounts_by_phone: Dict[str, SimulatedAccount] = {}
+        self.accounts_by_id: Dict[str, SimulatedAccount] = {}
+        self.tokens: Dict[str, Tuple[str, float]] = {}
+
+        for index in range(settings.accounts):
+            account = build_account(index, settings)
+            self.accounts_by_phone[account.phone_number] = account
+            self.accounts_by_id[account.subscriber_id] = account
+
+    def phone_numbers(self) -> List[str]:
+        return list(self.accounts_by_phone)
+
+    async def simulate_network(self) -> Optional[JSONResponse]:
+        """Apply latency and, at the configured rate, an injected upstream error"""
+        delay = self.settings.latency_ms + self.rng.uniform(
+            -self.settings.latency_jitter_ms, self.settings.latency_jitter_ms
+        )
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if self.settings.error_rate and self.rng.random() < self.settings.error_rate:
+            self.stats.injected_errors += 1
+            status = self.rng.choice([500, 502, 503])
+            return JSONResponse({"message": "Simulated upstream error"}, status_code=status)
+        return None
+
+    def issue_token(self, account: SimulatedAccount) -> str:
+        expires_at = time.time() + self.settings.token_ttl_seconds
+        token = encode_token(account.subscriber_id, expires_at)
+        with self.lock:
+            self.tokens[token] = (account.subscriber_id, expires_at)
+        return token
+
+    def authenticate(self, request: Request) -> Tuple[Optional[SimulatedAccount], Optional[JSONResponse]]:
+        """Resolve the bearer token to an account, rejecting unknown or expired tokens"""
+        auth = request.headers.get("authorization", "")
+        token = auth[7:] if auth.lower().startswith("bearer ") else ""
+        entry = self.tokens.get(token)
+
+        if entry is None:
+            self.stats.auth_failures += 1
+            return None, JSONResponse({"message": "Unauthorized"}, status_code=401)
+
+        subscriber_id, expires_at = entry
+        if time.time() >= expires_at:
+            self.stats.expired_tokens += 1
+            with self.lock:
+                self.tokens.pop(token, None)
+            return None, JSONResponse({"message": "Token expired"}, status_code=401)
+
+        return self.accounts_by_id[subscriber_id], None
+
+    def bundle_payload(self, account: SimulatedAccount) -> dict:
+        """Render the bundle response, consuming some balance on every call"""
+        now = datetime.utcnow()
+        account.calls += 1
+
+        plans = []
+        for plan in account.active_plans:
+            if plan["isActive"]:
+                plan["remainingBytes"] = max(0, plan["remainingBytes"] - account.usage_per_call_bytes)
+            expires_in = max(0, (plan["expiresAt"] - now).days)
+            plans.append({
+                "isActive": plan["isActive"],
+                "planId": plan["planId"],
+                "planName": plan["planName"],
+                "planIconName": plan["planIconName"],
+                "remainingBalance": format_balance(plan["remainingBytes"]),
+                "expiresIn": f"{expires_in} days",
+                "isHomePlan": plan["isHomePlan"],
+            })
+
+        home = plans[0]
+        return {
+            "data": {
+                "notificationToastType": "",
+                "subscriberId": account.subscriber_id,
+                "balanceSummary": {
+                    "balanceSummaryHeadline": {
+                        "headLineText": home["planName"],
+                        "prefixMaterialIconName": home["planIconName"],
+                    },
+                    "balanceSummaryByLine": home["expiresIn"],
+                    "remainingBalance": 0,
+                },
+                "hasCallToAction": False,
+                "ctaDetails": {"ctaType": "CTA_UNKNOWN", "ctaMessage": ""},
+                "showUnusedBundles": True,
+                "subscriberActiveAndUnusedPlans": plans,
+                "purchasedHistory": account.purchased_history,
+                "subscriberUsername": "",
+                "showConnectButton": True,
+            },
+            "message": "List Customers Bundles",
+        }
+
+
+def create_app(settings: Optional[SimulatorSettings] = None) -> FastAPI:
+    """Build the simulator FastAPI app"""
+    sim = TaaraSimulator(settings or SimulatorSettings())
+    app = FastAPI(title="Taara API Simulator")
+    app.state.simulator = sim
+
+    @app.post("/v1/users/subscriber/login")
+    async def login(request: Request):
+        sim.stats.count("login")
+        error = await sim.simulate_network()
+        if error:
+            return error
+
+        body = await request.json()
+        phone = body.get("phoneNumber", {}).get("nationalNumber", "")
+        account = sim.accounts_by_phone.get(phone)
+        if (account is None or body.get("passcode") != sim.settings.passcode
+                or body.get("partnerId") != sim.settings.partner_id):
+            sim.stats.auth_failures += 1
+            return JSONResponse({"message": "Invalid credentials"}, status_code=401)
+
+        return JSONResponse({"accessToken": sim.issue_token(account)}, status_code=201)
+
+    @app.get("/v1/customers/get-customer-bundle")
+    async def get_customer_bundle(request: Request, hotspotId: str = ""):
+        sim.stats.count("get_customer_bundle")
+        error = await sim.simulate_network()
+        if error:
+            return error
+
+        account, auth_error = sim.authenticate(request)
+        if auth_error:
+            return auth_error
+        return sim.bundle_payload(account)
+
+    @app.get("/v1/hotspot/GetHotspotConfig")
+    async def get_hotspot_config(hotspotId: str = ""):
+        sim.stats.count("get_hotspot_config")
+        error = await sim.simulate_network()
+        if error:
+            return error
+
+        return {
+            "data": {
+                "hotspotId": hotspotId,
+                "hotspotName": "Simulated Tower",
+                "partnerId": sim.settings.partner_id,
+                "currencyCode": "KES",
+                "isActive": True,
+            },
+            "message": "Hotspot Config",
+        }
+
+    @app.get("/v1/users/subscriber/logout/{subscriber_id}")
+    async def logout(subscriber_id: str):
+        sim.stats.count("logout")
+        error = await sim.simulate_network()
+        if error:
+            return error
+
+        with sim.lock:
+            for token in [t for t, (sub, _) in sim.tokens.items() if sub == subscriber_id]:
+                del sim.tokens[token]
+        return {"message": "Logged out"}
+
+    @app.post("/_sim/expire-tokens")
+    async def expire_tokens():
+        """Expire every issued token now, as if the sessions had outlived their TTL"""
+        now = time.time()
+        with sim.lock:
+            sim.tokens = {token: (sub, min(expires_at, now)) for token, (sub, expires_at) in sim.tokens.items()}
+        return {"expired": len(sim.tokens)}
+
+    @app.get("/_sim/stats")
+    async def stats():
+        return {
+            "requests": sim.stats.requests,
+            "injected_errors": sim.stats.injected_errors,
+            "expired_tokens": sim.stats.expired_tokens,
+            "auth_failures": sim.stats.auth_failures,
+            "live_tokens": len(sim.tokens),
+        }
+
+    return app
+
+
+def parse_settings(argv: Optional[List[str]] = None) -> Tuple[SimulatorSettings, argparse.Namespace]:
+    defaults = SimulatorSettings()
+    parser = argparse.ArgumentParser(description="Local Taara API simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--accounts", type=int, default=defaults.accounts)
+    parser.add_argument("--passcode", default=defaults.passcode)
+    parser.add_argument("--partner-id", default=defaults.partner_id)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--latency-jitter-ms", type=float, default=defaults.latency_jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="Fraction of requests answered with a 5xx (0-1)")
+    parser.add_argument("--token-ttl", type=int, default=defaults.token_ttl_seconds,
+                        help="Seconds before an issued access token expires")
+    parser.add_argument("--history-months", type=int, default=defaults.history_months)
+    parser.add_argument("--plans-per-purchase", type=int, default=defaults.plans_per_purchase)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args(argv)
+
+    settings = SimulatorSettings(
+        accounts=args.accounts,
+        passcode=args.passcode,
+        partner_id=args.partner_id,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        token_ttl_seconds=args.token_ttl,
+        history_months=args.history_months,
+        plans_per_purchase=args.plans_per_purchase,
+        seed=args.seed,
+    )
+    return settings, args
+
+
+def main():
+    import uvicorn
+
+    settings, args = parse_settings()
+    print(f"Simulating {settings.accounts} accounts on http://{args.host}:{args.port} "
+          f"(phone numbers {settings.phone_prefix}..{settings.phone_prefix + settings.accounts - 1}, "
+          f"passcode {settings.passcode})")
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()